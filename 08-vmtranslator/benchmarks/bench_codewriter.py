@@ -0,0 +1,530 @@
+"""
+Times translating the VM files of a program, e.g. a full OS build, with the
+code writer that built each command's ASM from an f-string on every call
+against the one that fills in templates compiled once. Both must write the
+same ASM. Then measures the peak memory taken by translating the program
+repeated a growing number of times, with the lines written kept in memory
+and streamed. Build the OS first, with the compiler in 10-and-11-compiler:
+
+  $ mkdir /tmp/os && cp ../12-operating-system/jack_os/*.jack /tmp/os
+  $ (cd ../10-and-11-compiler && poetry run python -m jack_compiler.main /tmp/os vm)
+  $ poetry run python -m benchmarks.bench_codewriter /tmp/os
+"""
+
+from typing import Callable, List
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from vmtranslator import codewriter, hack, main as vm_translator, vm, vmparser
+from vmtranslator.codewriter import PUSHPOP_CMD, code_block_to_lines
+
+REPEATS = 5
+COPIES = (1, 4, 16)
+
+
+class FStringASMCodeWriter(codewriter.ASMCodeWriter):
+    """
+    The code writer as it was: ASM formatted, split and stripped per command,
+    and every line written at once and kept. Returns are written as now,
+    since they used to keep their frame in statics.
+    """
+
+    def __init__(self, output_file_path: str) -> None:
+        self.written_lines: List[str] = []
+        self.output = open(output_file_path, "w", encoding="utf-8")
+        self._out_filename = os.path.basename(output_file_path).split(".")[0]
+        self.i = 0
+        self._current_func = None
+        self.compact = False
+        self.write_init()
+
+    def write_arithmetic(self, command: str) -> None:
+        """
+        Writes to the output file the assembly code that implements
+        the given arithmetic-logical command.
+        """
+        self.i += 1
+        command = vm.ArithmeticCommands(command)
+        if command == vm.ArithmeticCommands.ADD:
+            asm = """//add
+                    // SP--
+                    @SP
+                    M=M-1
+                    // D = RAM[SP]
+                    A=M
+                    D=M
+                    // M = D + RAM[SP-1]
+                    A=A-1
+                    M=D+M
+                    """
+        elif command == vm.ArithmeticCommands.SUB:
+            asm = """//sub
+                    // SP--
+                    @SP
+                    M=M-1
+                    // D = RAM[SP]
+                    A=M
+                    D=M
+                    // M = RAM[SP-1] - D
+                    A=A-1
+                    M=M-D
+                    """
+        elif command == vm.ArithmeticCommands.NEG:
+            asm = """//neg
+                    @SP
+                    A=M
+                    A=A-1
+                    M=-M
+                    """
+        elif command == vm.ArithmeticCommands.EQ:
+            asm = f"""//eq
+                    @SP
+                    M=M-1
+                    A=M
+                    D=M
+                    A=A-1
+                    // D==0 if EQ, else not
+                    D=M-D
+                    // RAM[SP] = 0 (false)
+                    M=0
+                    // if D==0, JUMP to ZERO
+                    @ZERO{self.i}
+                    D;JEQ
+
+                    // jump to END
+                    @END{self.i}
+                    0;JMP
+
+                    (ZERO{self.i})
+                    // RAM[SP-1] = 1
+                    @SP
+                    A=M
+                    A=A-1
+                    M=-1
+
+                    (END{self.i})
+                    """
+
+        elif command == vm.ArithmeticCommands.GT:
+            asm = f"""//eq
+                    @SP
+                    M=M-1
+                    A=M
+                    D=M
+                    A=A-1
+                    // D>0 if GT, else not
+                    D=M-D
+                    // RAM[SP] = 0 (false)
+                    M=0
+                    // if D>0, JUMP to POSITIVE
+                    @POSITIVE{self.i}
+                    D;JGT
+
+                    // jump to END
+                    @END{self.i}
+                    0;JMP
+
+                    (POSITIVE{self.i})
+                    // RAM[SP-1] = 1
+                    @SP
+                    A=M
+                    A=A-1
+                    M=-1
+
+                    (END{self.i})
+                    """
+        elif command == vm.ArithmeticCommands.LT:
+            asm = f"""//eq
+                    @SP
+                    M=M-1
+                    A=M
+                    D=M
+                    A=A-1
+                    // D<0 if LT, else not
+                    D=M-D
+                    // RAM[SP] = 0 (false)
+                    M=0
+                    // if D>0, JUMP to NEGATIVE
+                    @NEGATIVE{self.i}
+                    D;JLT
+
+                    // jump to END
+                    @END{self.i}
+                    0;JMP
+
+                    (NEGATIVE{self.i})
+                    // RAM[SP-1] = 1
+                    @SP
+                    A=M
+                    A=A-1
+                    M=-1
+
+                    (END{self.i})
+                    """
+        elif command == vm.ArithmeticCommands.AND:
+            asm = """//and
+                    // SP--
+                    @SP
+                    M=M-1
+                    // D = RAM[SP]
+                    A=M
+                    D=M
+                    // M = RAM[SP-1] - D
+                    A=A-1
+                    M=M&D
+                    """
+
+        elif command == vm.ArithmeticCommands.OR:
+            asm = """//or
+                    // SP--
+                    @SP
+                    M=M-1
+                    // D = RAM[SP]
+                    A=M
+                    D=M
+                    // M = RAM[SP-1] - D
+                    A=A-1
+                    M=M|D
+                    """
+        elif command == vm.ArithmeticCommands.NOT:
+            asm = """//not
+                    @SP
+                    A=M
+                    A=A-1
+                    M=!M
+                    """
+        else:
+            raise ValueError()
+        lines = code_block_to_lines(asm)
+        self._write_lines(lines)
+
+    def write_push_pop(self, command: PUSHPOP_CMD, segment: str, index: int) -> None:
+        """
+        Writes to the output file the assembly code that implements
+        the given push or pop command.
+        """
+        segment: hack.MemorySegments = hack.MemorySegments(segment)
+        if segment == hack.MemorySegments.CONSTANT:
+            assert vm.VMCommandTypes.is_push(command)
+            asm = f"""
+            //D=index
+            @{index}
+            D=A
+            //Push D to SP
+            @SP
+            A=M
+            M=D
+            //SP++
+            @SP 
+            M=M+1"""
+        elif segment in [
+            hack.MemorySegments.LOCAL,
+            hack.MemorySegments.ARGUMENT,
+            hack.MemorySegments.THIS,
+            hack.MemorySegments.THAT,
+        ]:
+            segment_pointer = hack.SEGMENT_POINTER_MAP[segment]
+            if vm.VMCommandTypes.is_push(command):
+                asm = f"""//push {segment_pointer} {index}
+                        // {segment_pointer} i -> D
+                        @{index}
+                        D=A
+                        @{segment_pointer}
+                        D=M+D
+                        A=D
+                        D=M
+                        @SP
+                        A=M
+                        M=D
+                        @SP
+                        M=M+1
+                        """
+            else:
+                asm = f"""//pop {segment_pointer} {index}
+                        @{index}
+                        D=A
+                        @{segment_pointer}
+                        D=M+D
+                        @R13
+                        M=D
+                        @SP
+                        M=M-1
+                        A=M
+                        D=M
+                        @R13
+                        A=M
+                        M=D
+                        """
+        elif segment == hack.MemorySegments.STATIC:
+            if vm.VMCommandTypes.is_push(command):
+                asm = f"""//push static i
+                // D = STATIC[i]
+                @{self._input_filename}.{index}
+                D=M
+                // put D onto stack
+                @SP
+                A=M
+                M=D
+                // SP++
+                @SP
+                M=M+1
+                """
+            else:
+                asm = f"""// pop static i
+                // SP--
+                @SP
+                M=M-1
+                A=M
+                D=M
+                // STATIC[INDEX] = D
+                @{self._input_filename}.{index}
+                M=D
+                """
+        elif segment == hack.MemorySegments.TEMP:
+            if vm.VMCommandTypes.is_push(command):
+                asm = f"""//push temp i
+                @{index}
+                D=A
+                @{hack.RAM_POSITION_MAP[segment]}
+                A=A+D
+                D=M
+                // RAM[SP] = D
+                @SP
+                A=M
+                M=D
+                // SP++
+                @SP
+                M=M+1
+                """
+            else:
+                asm = f"""//pop temp i
+                // SP--
+                @{index}
+                D=A
+                @{hack.RAM_POSITION_MAP[segment]}
+                D=A+D
+                // store addr in RAM13
+                @R13
+                M=D
+                @SP
+                M=M-1
+                A=M
+                D=M
+                @R13
+                A=M
+                M=D
+                """
+        elif segment == hack.MemorySegments.POINTER:
+            assert index == 0 or index == 1
+            accessed_segment = hack.THAT_POINTER if index else hack.THIS_POINTER
+            if vm.VMCommandTypes.is_push(command):
+                asm = f"""// push pointer index
+                @{accessed_segment}
+                D=M
+                @SP
+                A=M
+                M=D
+                // SP++
+                @SP
+                M=M+1
+                """
+            else:
+                asm = f"""// pop pointer index
+                // SP--
+                @SP 
+                M=M-1
+                // D = RAM[SP]
+                A=M
+                D=M
+                @{accessed_segment}
+                M=D
+                """
+        else:
+            raise ValueError()
+        lines = code_block_to_lines(asm)
+        self._write_lines(lines)
+
+    def write_goto(self, label: str) -> None:
+        """Writes assembly code that effects the goto command."""
+        fname = f"{self._current_func}${label}" if self._current_func else label
+        asm = f"""
+                @{fname}
+                0;JMP
+                """
+        self._write_lines(code_block_to_lines(asm))
+
+    def write_if(self, label: str) -> None:
+        """Writes assembly code that effects the if-goto command."""
+        fname = f"{self._current_func}${label}" if self._current_func else label
+        asm = f"""
+            // D = pop stack
+            @SP
+            M=M-1
+            A=M
+            D=M
+            // if D>0, jump to label
+            @{fname}
+            D;JNE
+            """
+        self._write_lines(code_block_to_lines(asm))
+
+    def write_function(self, function_name: str, num_vars: int) -> None:
+        """Writes assembly code that effects the function command."""
+        self.write_label(function_name)
+        for _ in range(num_vars):
+            self.write_push_pop(
+                vm.VMCommandTypes.C_PUSH, hack.MemorySegments.CONSTANT, 0
+            )
+        # self._current_func = function_name
+
+    def write_call(self, function_name: str, num_args: int) -> None:
+        """Writes assembly code that effects the call command.
+        Args:
+            function_name: Name of the function being called.
+            num_args: Number of arguments to call the function with.
+        Returns:
+            None
+        """
+        self.i += 1
+        asm = f"""
+                // push returnAddress
+                @{function_name}$ret.{self.i}
+                D=A 
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                // push LCL
+                @LCL
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                // push ARG
+                @ARG
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                // push THIS
+                @THIS
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                // push THAT
+                @THAT
+                D=M
+                @SP
+                A=M
+                M=D
+                @SP
+                M=M+1
+                // ARG = SP - 5 - nArgs
+                @SP
+                D=M
+                @5
+                D=D-A
+                @{num_args}
+                D=D-A
+                @ARG
+                M=D
+                // LCL = SP
+                @SP
+                D=M
+                @LCL
+                M=D
+                // goto functionName
+                @{function_name}
+                0;JMP
+                // insert (returnAddress)
+                ({function_name}$ret.{self.i})
+                """
+        self._write_lines(code_block_to_lines(asm))
+
+    def _write_lines(self, lines: List[str]) -> None:
+        for line in lines:
+            if not line or line.startswith("//"):
+                continue
+            self.output.write(line)
+            self.output.write("\n")
+            self.written_lines.append(line)
+
+    def close(self) -> None:
+        self.output.close()
+
+
+def translate(
+    make_writer: Callable[[str], codewriter.ASMCodeWriter],
+    program: vm.VMProgram,
+    output_path: str,
+) -> float:
+    start = time.perf_counter()
+    writer = make_writer(output_path)
+    for vm_path, commands in program:
+        writer.set_file_name(vm_path)
+        for command in commands:
+            vm_translator.write_command(writer, command)
+    writer.close()
+    return time.perf_counter() - start
+
+
+def peak_memory(
+    make_writer: Callable[[str], codewriter.ASMCodeWriter],
+    program: vm.VMProgram,
+    output_path: str,
+) -> int:
+    tracemalloc.start()
+    translate(make_writer, program, output_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_path", help="A directory of VM files")
+    args = parser.parse_args()
+    program = [
+        (path, vmparser.parse_commands(path))
+        for path in vm_translator.list_all_vm_files(args.input_path)
+    ]
+    n_commands = sum(len(commands) for _, commands in program)
+    writers = {
+        "f-string": FStringASMCodeWriter,
+        "template": codewriter.ASMCodeWriter,
+        "kept": lambda path: codewriter.ASMCodeWriter(path, keep_lines=True),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, name) for name in ("fstring.asm", "template.asm")]
+        times = {}
+        for name, path in zip(("f-string", "template"), paths):
+            times[name] = min(translate(writers[name], program, path) for _ in range(REPEATS))
+        with open(paths[0]) as old, open(paths[1]) as new:
+            assert old.read() == new.read(), "the writers wrote different ASM"
+        print(f"{n_commands} VM commands in {len(program)} files")
+        print(f"{'writer':<9} {'ms':>8} {'commands/s':>11}")
+        for name, seconds in times.items():
+            print(f"{name:<9} {seconds * 1e3:>8.1f} {n_commands / seconds:>11,.0f}")
+        print(f"speedup   {times['f-string'] / times['template']:>8.1f}x")
+        print()
+        print(f"{'commands':>9} {'kept KiB':>9} {'streamed KiB':>13}")
+        for copies in COPIES:
+            kept, streamed = (
+                peak_memory(writers[name], program * copies, paths[1]) / 1024
+                for name in ("kept", "template")
+            )
+            print(f"{n_commands * copies:>9} {kept:>9.0f} {streamed:>13.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Times parsing VM files of growing size with the parser that re-sliced the
+remaining lines on every has_more_lines() call against the streaming parser,
+whose time grows linearly with the file.
+
+  $ poetry run python -m benchmarks.bench_vmparser
+"""
+
+import os
+import tempfile
+import time
+
+from vmtranslator import vmparser
+
+SIZES = (1_000, 4_000, 16_000, 64_000)
+LINES = (
+    "push argument 0",
+    "push constant 7",
+    "add",
+    "pop local 1",
+    "label LOOP",
+    "push local 1",
+    "if-goto LOOP  // back edge",
+    "call Math.multiply 2",
+)
+
+
+class SlicingVMParser(vmparser.VMParser):
+    """The parser as it was: every line read up front, and split per accessor."""
+
+    def __init__(self, input_file_path: str) -> None:
+        self.input_file_path = input_file_path
+        with open(input_file_path, "r", encoding="utf-8") as f:
+            lines = [l.strip("\n") for l in f.readlines() if not l.startswith("//")]
+        lines = [l.split("//")[0].strip() for l in lines]
+        self.file_lines = [l for l in lines if l]
+        self._line_pointer = -1
+
+    def has_more_lines(self) -> bool:
+        return bool(self.file_lines[self._line_pointer + 1 :])
+
+    def advance(self) -> None:
+        self._line_pointer += 1
+        self._current_line = self.file_lines[self._line_pointer]
+
+    def command_type(self):
+        line_cmd, *_ = self._current_line.split()
+        return vmparser.CMD_TO_TYPE_MAP[line_cmd]
+
+    def arg1(self) -> str:
+        if self.command_type() == vmparser.vm.VMCommandTypes.C_ARITHMETIC:
+            return self._current_line
+        _, arg1, *_ = self._current_line.split()
+        return arg1
+
+    def arg2(self) -> int:
+        _, _, arg2 = self._current_line.split()
+        return int(arg2)
+
+    def command(self):
+        cmd_type = self.command_type()
+        if cmd_type == vmparser.vm.VMCommandTypes.C_RETURN:
+            return vmparser.vm.VMCommand(cmd_type)
+        if cmd_type in vmparser.ONE_ARG_TYPES:
+            return vmparser.vm.VMCommand(cmd_type, self.arg1())
+        return vmparser.vm.VMCommand(cmd_type, self.arg1(), self.arg2())
+
+
+def parse_slicing(path: str):
+    parser = SlicingVMParser(path)
+    commands = []
+    while parser.has_more_lines():
+        parser.advance()
+        commands.append(parser.command())
+    return commands
+
+
+def bench(parse, path: str) -> float:
+    start = time.perf_counter()
+    parse(path)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'commands':>9} {'slicing ms':>11} {'streaming ms':>13} {'us/command':>11}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in SIZES:
+            path = os.path.join(tmp_dir, f"Bench{size}.vm")
+            with open(path, "w") as f:
+                f.writelines(LINES[i % len(LINES)] + "\n" for i in range(size))
+            assert parse_slicing(path) == vmparser.parse_commands(path)
+            slicing = bench(parse_slicing, path)
+            streaming = bench(vmparser.parse_commands, path)
+            print(
+                f"{size:>9} {slicing * 1e3:>11.1f} {streaming * 1e3:>13.1f}"
+                f" {streaming / size * 1e6:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
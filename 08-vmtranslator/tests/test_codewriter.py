@@ -0,0 +1,131 @@
+"""Unit tests for the ASM code writer"""
+
+import pytest
+
+from vmtranslator import codewriter, vm
+
+PUSH, POP = vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP
+
+
+@pytest.fixture
+def writer(tmp_path):
+    """A writer that has written its bootstrap code."""
+    asm_writer = codewriter.ASMCodeWriter(str(tmp_path / "Main.asm"), keep_lines=True)
+    asm_writer.set_file_name(str(tmp_path / "Main.vm"))
+    yield asm_writer
+    asm_writer.close()
+
+
+def written_after(writer, write, *args):
+    n_written = len(writer.written_lines)
+    write(*args)
+    return writer.written_lines[n_written:]
+
+
+class TestCodeWriter:
+    def test_templates_hold_instructions_only(self):
+        templates = [
+            *codewriter.ARITHMETIC_TEMPLATES.values(),
+            *codewriter.PUSH_POP_TEMPLATES.values(),
+            codewriter.CALL_TEMPLATE,
+            codewriter.RETURN_TEMPLATE,
+        ]
+        for template in templates:
+            assert all(line and not line.startswith("//") for line in template.lines)
+
+    def test_push_pop(self, writer):
+        assert written_after(writer, writer.write_push_pop, PUSH, "static", 3) == [
+            "@Main.3", "D=M", "@SP", "A=M", "M=D", "@SP", "M=M+1"
+        ]
+        assert written_after(writer, writer.write_push_pop, POP, "pointer", 1)[-2:] == [
+            "@THAT", "M=D"
+        ]
+        assert written_after(writer, writer.write_push_pop, PUSH, "local", 2)[:3] == [
+            "@2", "D=A", "@LCL"
+        ]
+
+    def test_labels_are_unique(self, writer):
+        first = written_after(writer, writer.write_arithmetic, "eq")
+        second = written_after(writer, writer.write_arithmetic, "eq")
+        assert "(ZERO2)" in first and "(ZERO3)" in second
+        assert written_after(writer, writer.write_call, "Main.f", 1)[-1] == "(Main.f$ret.4)"
+
+    def test_temporaries_take_no_static_ram(self, writer):
+        lines = written_after(writer, writer.write_return)
+        assert {line for line in lines if line.startswith("@R")} == {"@R13", "@R14"}
+        assert not any("endFrame" in line or "retAttr" in line for line in lines)
+
+    def test_static_usage(self, writer):
+        writer.write_push_pop(PUSH, "static", 0)
+        writer.write_push_pop(POP, "static", 0)
+        writer.write_push_pop(PUSH, "static", 4)
+        writer.set_file_name("Output.vm")
+        writer.write_push_pop(PUSH, "static", 0)
+        assert writer.static_usage == {"Main": {0, 4}, "Output": {0}}
+        report = codewriter.format_static_usage(writer.static_usage).splitlines()
+        assert report[1].split() == ["Main", "2"]
+        assert report[-2:] == [
+            f"{'total (2 files)':<40} {3:>7}",
+            f"{'free of RAM[16..255]':<40} {237:>7}",
+        ]
+
+    def test_written_to_output(self, tmp_path, writer):
+        writer.write_push_pop(PUSH, "constant", 7)
+        writer.close()
+        assert (tmp_path / "Main.asm").read_text().splitlines() == writer.written_lines
+
+    def test_streaming(self, tmp_path):
+        output = tmp_path / "Main.asm"
+        writer = codewriter.ASMCodeWriter(str(output), buffer_lines=100)
+        assert writer.written_lines is None
+        # the bootstrap code is buffered
+        writer.write_push_pop(PUSH, "constant", 7)
+        assert output.read_text() == ""
+        writer.write_call("Main.f", 0)
+        n_written = len(output.read_text().splitlines())
+        assert n_written >= 100
+        writer.write_push_pop(PUSH, "constant", 7)
+        writer.flush()
+        assert len(output.read_text().splitlines()) == n_written + 7
+        writer.close()
+
+    def test_buffer_size(self, tmp_path):
+        with pytest.raises(ValueError):
+            codewriter.ASMCodeWriter(str(tmp_path / "Main.asm"), buffer_lines=0)
+
+    def test_compact_runtime(self, tmp_path):
+        output = tmp_path / "Main.asm"
+        writer = codewriter.ASMCodeWriter(str(output), keep_lines=True, compact=True)
+        call = written_after(writer, writer.write_call, "Main.f", 2)
+        assert call[:8] == ["@Main.f", "D=A", "@R13", "M=D", "@7", "D=A", "@R14", "M=D"]
+        assert call[-3:] == ["@$CALL", "0;JMP", "(Main.f$ret.2)"]
+        assert written_after(writer, writer.write_return) == ["@$RETURN", "0;JMP"]
+        assert "@$CMP.gt" in written_after(writer, writer.write_arithmetic, "gt")
+        assert len(written_after(writer, writer.write_arithmetic, "add")) == 6
+        writer.close()
+        asm = output.read_text().splitlines()
+        for label in ("($CALL)", "($RETURN)", "($CMP.eq)", "($CMP.gt)", "($CMP.lt)"):
+            assert asm.count(label) == 1
+
+    def test_compact_call_passes_arguments_in_r13_and_r14(self, tmp_path):
+        writer = codewriter.ASMCodeWriter(str(tmp_path / "Main.asm"), keep_lines=True, compact=True)
+        call = written_after(writer, writer.write_call, "Main.f", 0)
+        writer.close()
+        written = [call[n] for n in range(len(call) - 1) if call[n + 1] == "M=D"]
+        assert written == ["@R13", "@R14"]
+        runtime = codewriter.RUNTIME_TEMPLATE.lines
+        call_routine = runtime[: runtime.index("($RETURN)")]
+        assert "@R13" in call_routine and "@R14" in call_routine
+
+    @pytest.mark.parametrize(
+        "write, args",
+        [
+            ("write_arithmetic", ("mul",)),
+            ("write_push_pop", (POP, "constant", 0)),
+            ("write_push_pop", (PUSH, "pointer", 2)),
+            ("write_push_pop", (vm.VMCommandTypes.C_CALL, "local", 0)),
+        ],
+    )
+    def test_errors(self, writer, write, args):
+        with pytest.raises(ValueError):
+            getattr(writer, write)(*args)
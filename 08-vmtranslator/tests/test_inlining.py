@@ -0,0 +1,144 @@
+"""Unit tests for inlining leaf functions"""
+
+from vmtranslator import inlining, main
+from vmtranslator.vm import VMCommand, VMCommandTypes
+
+PUSH, POP = VMCommandTypes.C_PUSH, VMCommandTypes.C_POP
+
+
+def parse(text):
+    """Parse VM code without going through a file."""
+    commands = []
+    for line in text.strip().splitlines():
+        name, *args = line.split()
+        cmd_type = {
+            "push": PUSH,
+            "pop": POP,
+            "label": VMCommandTypes.C_LABEL,
+            "goto": VMCommandTypes.C_GOTO,
+            "if-goto": VMCommandTypes.C_IF,
+            "function": VMCommandTypes.C_FUNCTION,
+            "call": VMCommandTypes.C_CALL,
+            "return": VMCommandTypes.C_RETURN,
+        }.get(name, VMCommandTypes.C_ARITHMETIC)
+        if cmd_type == VMCommandTypes.C_ARITHMETIC:
+            commands.append(VMCommand(cmd_type, name))
+        elif len(args) == 2:
+            commands.append(VMCommand(cmd_type, args[0], int(args[1])))
+        else:
+            commands.append(VMCommand(cmd_type, *args))
+    return commands
+
+
+STRING_VM = """
+function String.length 0
+push argument 0
+pop pointer 0
+push this 1
+return
+function String.count 1
+push static 0
+return
+"""
+
+MATH_VM = """
+function Math.abs 0
+push argument 0
+push constant 0
+lt
+not
+if-goto L1
+push argument 0
+neg
+return
+label L1
+push argument 0
+return
+function Math.recurse 0
+push argument 0
+call Math.recurse 1
+return
+"""
+
+MAIN_VM = """
+function Main.main 0
+push local 0
+call String.length 1
+push constant 3
+call Math.abs 1
+add
+call String.count 0
+add
+call Math.recurse 1
+return
+"""
+
+
+def program():
+    return [
+        ("String.vm", parse(STRING_VM)),
+        ("Math.vm", parse(MATH_VM)),
+        ("Main.vm", parse(MAIN_VM)),
+    ]
+
+
+class TestInlining:
+    def test_candidates(self):
+        assert set(inlining.find_candidates(program())) == {
+            "String.length",
+            "String.count",
+            "Math.abs",
+        }
+        assert "Math.abs" not in inlining.find_candidates(program(), max_callee_size=5)
+
+    def test_returns_single_value(self):
+        assert inlining.returns_single_value(parse("push constant 1\nreturn"))
+        assert not inlining.returns_single_value(
+            parse("push constant 1\npush constant 2\nreturn")
+        )
+        assert not inlining.returns_single_value(parse("push constant 1"))
+
+    def test_inline_calls(self):
+        new_program, inlined = inlining.inline_calls(program(), max_growth=1.0)
+        assert inlined == {"String.length": 1, "Math.abs": 1, "String.count": 1}
+        main = new_program[2][1]
+        calls = [c.arg1 for c in main if c.cmd_type == VMCommandTypes.C_CALL]
+        assert calls == ["Math.recurse"]
+        # String.length: the argument moves to temp 0 and THIS is saved around the body
+        assert main[2:10] == [
+            VMCommand(POP, "temp", 0),
+            VMCommand(PUSH, "pointer", 0),
+            VMCommand(POP, "temp", 1),
+            VMCommand(PUSH, "temp", 0),
+            VMCommand(POP, "pointer", 0),
+            VMCommand(PUSH, "this", 1),
+            VMCommand(PUSH, "temp", 1),
+            VMCommand(POP, "pointer", 0),
+        ]
+        # Math.abs: the early return jumps past the rest of the body
+        labels = [c.arg1 for c in main if c.cmd_type == VMCommandTypes.C_LABEL]
+        assert labels == ["L1$inline1", "Math.abs$inline1$end"]
+        # String.count keeps reading the statics of String.vm
+        assert VMCommand(PUSH, "static", 0, "String.vm") in main
+
+    def test_growth_limit(self):
+        _, inlined = inlining.inline_calls(program(), max_growth=0.1)
+        assert inlined == {"String.count": 1}
+        _, inlined = inlining.inline_calls(program(), max_growth=0.0)
+        assert inlined == {}
+
+    def test_format_inlined(self):
+        report = inlining.format_inlined({"Math.abs": 2, "String.length": 5})
+        assert report.splitlines()[1].split() == ["String.length", "5"]
+        assert report.splitlines()[-1].split()[-1] == "7"
+
+    def test_translate_inlines_calls(self, tmp_path, capsys):
+        for file_name, text in (("String.vm", STRING_VM), ("Math.vm", MATH_VM)):
+            (tmp_path / file_name).write_text(text)
+        (tmp_path / "Sys.vm").write_text("function Sys.init 0\n" + MAIN_VM.split("\n", 2)[2])
+        output_path = tmp_path / "out.asm"
+        main.translate_to_hack(str(tmp_path), str(output_path), inline=True, inline_max_growth=1.0)
+        asm = output_path.read_text().split()
+        assert "@Math.abs" not in asm and "@Math.recurse" in asm
+        assert "@String.0" in asm
+        assert "total (3 functions)" in capsys.readouterr().out
@@ -0,0 +1,165 @@
+"""Unit tests for the peephole optimizer"""
+
+from vmtranslator import main, peephole, vm, vmparser
+
+
+def optimize(tmp_path, text, stats=None):
+    """Optimize VM code, returned as VM code."""
+    path = tmp_path / "Main.vm"
+    path.write_text(text)
+    commands = peephole.optimize(vmparser.parse_commands(str(path)), stats)
+    return "".join(vm.format_command(command) + "\n" for command in commands)
+
+
+IF_VM = """function Main.max 0
+push argument 0
+push argument 1
+gt
+not
+if-goto IF_FALSE0
+push argument 0
+return
+goto IF_END0
+label IF_FALSE0
+push argument 1
+return
+label IF_END0
+"""
+
+WHILE_VM = """function Main.count 1
+label WHILE_EXP0
+push local 0
+push constant 10
+lt
+not
+if-goto WHILE_END0
+push local 0
+push constant 1
+add
+pop local 0
+goto WHILE_EXP0
+label WHILE_END0
+push local 0
+return
+"""
+
+
+class TestPeephole:
+    def test_constant_branches(self, tmp_path):
+        text = """function Main.f 0
+push constant 0
+not
+if-goto L1
+push constant 0
+if-goto L2
+label L1
+label L2
+push constant 0
+return
+"""
+        assert optimize(tmp_path, text) == "function Main.f 0\npush constant 0\nreturn\n"
+
+    def test_redundant_pairs(self, tmp_path):
+        text = """function Main.f 1
+push local 0
+pop local 0
+push argument 0
+not
+not
+pop temp 0
+push temp 0
+return
+"""
+        assert optimize(tmp_path, text) == "function Main.f 1\npush argument 0\nreturn\n"
+
+    def test_live_temp_is_kept(self, tmp_path):
+        text = """function Main.f 0
+push argument 0
+pop temp 0
+push temp 0
+push temp 0
+add
+return
+"""
+        assert optimize(tmp_path, text) == text
+
+    def test_jump_threading(self, tmp_path):
+        text = """function Main.f 0
+push argument 0
+if-goto A
+push constant 1
+return
+label A
+goto B
+label B
+push constant 2
+return
+"""
+        assert optimize(tmp_path, text) == """function Main.f 0
+push argument 0
+if-goto B
+push constant 1
+return
+label B
+push constant 2
+return
+"""
+
+    def test_branch_inversion(self, tmp_path):
+        assert optimize(tmp_path, IF_VM) == """function Main.max 0
+push argument 0
+push argument 1
+gt
+if-goto IF_FALSE0$then
+push argument 1
+return
+label IF_FALSE0$then
+push argument 0
+return
+"""
+
+    def test_non_boolean_condition_is_not_inverted(self, tmp_path):
+        # not 1 is -2, which jumps, so if-goto alone would not be the inverse
+        text = IF_VM.replace("gt\n", "and\n")
+        assert "not\n" in optimize(tmp_path, text)
+
+    def test_loop_rotation(self, tmp_path):
+        assert optimize(tmp_path, WHILE_VM) == """function Main.count 1
+goto WHILE_EXP0
+label WHILE_EXP0$body
+push local 0
+push constant 1
+add
+pop local 0
+label WHILE_EXP0
+push local 0
+push constant 10
+lt
+if-goto WHILE_EXP0$body
+push local 0
+return
+"""
+
+    def test_stats(self, tmp_path):
+        stats = peephole.PeepholeStats()
+        optimize(tmp_path, IF_VM, stats)
+        assert stats.fired == {"unreachable code": 1, "unused label": 2, "branch inversion": 1}
+        assert stats.eliminated["unreachable code"] == 1
+        assert stats.eliminated["branch inversion"] == 1
+        assert (stats.commands_before, stats.commands_after) == (11, 9)
+        assert peephole.format_stats(stats).splitlines()[-1].split()[-2:] == ["4", "2"]
+
+    def test_optimize_files(self, tmp_path):
+        (tmp_path / "Main.vm").write_text(WHILE_VM)
+        stats = peephole.optimize_files(str(tmp_path))
+        assert stats.fired == {"loop rotation": 1, "unused label": 1}
+        assert "not" not in (tmp_path / "Main.vm").read_text().split("\n")
+
+    def test_translate_with_peephole(self, tmp_path, capsys):
+        (tmp_path / "Main.vm").write_text(WHILE_VM)
+        main.translate_to_hack(str(tmp_path), str(tmp_path / "plain.asm"))
+        main.translate_to_hack(str(tmp_path), str(tmp_path / "peephole.asm"), peephole=True)
+        assert "loop rotation" in capsys.readouterr().out
+        plain = (tmp_path / "plain.asm").read_text().splitlines()
+        optimized = (tmp_path / "peephole.asm").read_text().splitlines()
+        assert main.count_instructions(optimized) < main.count_instructions(plain)
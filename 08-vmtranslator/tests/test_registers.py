@@ -0,0 +1,24 @@
+"""Unit tests for the allocation of registers to temporaries"""
+
+import pytest
+
+from vmtranslator import registers
+
+
+class TestRegisters:
+    def test_live_ranges(self):
+        lines = ["@%a", "M=D", "@%b", "@%a", "@%c"]
+        assert registers.live_ranges(lines) == {
+            "a": range(0, 4),
+            "b": range(2, 3),
+            "c": range(4, 5),
+        }
+
+    def test_dead_temporaries_free_their_register(self):
+        lines = ["@%a", "M=D", "@%b", "@%a", "@%c", "@%d", "@%c"]
+        assert registers.allocate(lines) == {"a": "R13", "b": "R14", "c": "R13", "d": "R14"}
+        assert registers.assign_registers(lines)[:4] == ["@R13", "M=D", "@R14", "@R13"]
+
+    def test_too_many_live_temporaries(self):
+        with pytest.raises(ValueError, match="cannot allocate d"):
+            registers.allocate(["@%a", "@%b", "@%c", "@%d", "@%a", "@%b", "@%c"])
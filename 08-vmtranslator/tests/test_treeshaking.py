@@ -0,0 +1,85 @@
+"""Unit tests for dead function elimination"""
+
+import pytest
+
+from vmtranslator import main, treeshaking, vmparser
+
+SYS_VM = """function Sys.init 0
+call Main.main 0
+pop temp 0
+label LOOP
+goto LOOP
+function Sys.unused 0
+push constant 0
+return
+"""
+
+MAIN_VM = """function Main.main 0
+call Main.helper 0
+return
+function Main.helper 0
+call Main.helper 0
+return
+function Main.dead 0
+call Main.main 0
+return
+"""
+
+
+@pytest.fixture
+def program_dir(tmp_path):
+    (tmp_path / "Sys.vm").write_text(SYS_VM)
+    (tmp_path / "Main.vm").write_text(MAIN_VM)
+    return tmp_path
+
+
+def read_program(program_dir):
+    return [
+        (path, vmparser.parse_commands(path))
+        for path in main.list_all_vm_files(str(program_dir))
+    ]
+
+
+class TestTreeShaking:
+    def test_call_graph(self, program_dir):
+        call_graph = treeshaking.read_call_graph(read_program(program_dir))
+        assert call_graph == {
+            "Sys.init": {"Main.main"},
+            "Sys.unused": set(),
+            "Main.main": {"Main.helper"},
+            "Main.helper": {"Main.helper"},
+            "Main.dead": {"Main.main"},
+        }
+
+    def test_reachable_functions(self, program_dir):
+        call_graph = treeshaking.read_call_graph(read_program(program_dir))
+        assert treeshaking.reachable_functions(call_graph) == {
+            "Sys.init",
+            "Main.main",
+            "Main.helper",
+        }
+
+    def test_missing_entry_point(self):
+        with pytest.raises(ValueError, match="Sys.init is not defined"):
+            treeshaking.reachable_functions({"Main.main": set()})
+
+    def test_translate_drops_unreachable_functions(self, program_dir, capsys):
+        output_path = program_dir / "out.asm"
+        main.translate_to_hack(str(program_dir), str(output_path), tree_shake=True)
+        asm = output_path.read_text().split()
+        assert "(Main.helper)" in asm
+        assert "(Main.dead)" not in asm
+        assert "(Sys.unused)" not in asm
+        report = capsys.readouterr().out
+        assert "Main.dead" in report and "Sys.unused" in report
+        assert "total (2 functions)" in report
+
+    def test_savings_match_output_size(self, program_dir, capsys):
+        shaken, full = program_dir / "shaken.asm", program_dir / "full.asm"
+        main.translate_to_hack(str(program_dir), str(shaken), tree_shake=True)
+        total_line = capsys.readouterr().out.splitlines()[-1]
+        main.translate_to_hack(str(program_dir), str(full))
+        saved = main.count_instructions(full.read_text().split()) - main.count_instructions(
+            shaken.read_text().split()
+        )
+        assert total_line.split()[-2:] == [str(saved), str(2 * saved)]
@@ -1,5 +1,9 @@
 """Unit test for testing VMParser"""
 
+import re
+
+import pytest
+
 from vmtranslator import vmparser, vm
 
 
@@ -43,3 +47,49 @@ class TestVMParser:
         assert parser.arg2() == 1
         parser.advance()
         assert parser.arg2() == 0
+
+    def test_command(self):
+        parser = vmparser.VMParser("tests/pushpop_test.vm")
+        commands = []
+        while parser.has_more_lines():
+            parser.advance()
+            commands.append(parser.command())
+        assert commands == [
+            vm.VMCommand(vm.VMCommandTypes.C_PUSH, "local", 1),
+            vm.VMCommand(vm.VMCommandTypes.C_POP, "pointer", 0),
+            vm.VMCommand(vm.VMCommandTypes.C_ARITHMETIC, "add"),
+        ]
+        assert commands == vmparser.parse_commands("tests/pushpop_test.vm")
+        with pytest.raises(IndexError):
+            parser.advance()
+
+    def test_comments_and_repeats(self, tmp_path):
+        path = tmp_path / "Main.vm"
+        path.write_text(
+            "// header\nfunction Main.f 0  // two args\n\n  push constant 1\n"
+            "push constant 1\nlabel LOOP\nreturn\n"
+        )
+        commands = list(vmparser.iter_commands(str(path)))
+        assert [vm.format_command(c) for c in commands] == [
+            "function Main.f 0",
+            "push constant 1",
+            "push constant 1",
+            "label LOOP",
+            "return",
+        ]
+        assert commands[1] is commands[2]
+
+    @pytest.mark.parametrize(
+        "line, error",
+        [
+            ("jump LOOP", "unknown VM command 'jump'"),
+            ("push constant", "push takes 2 argument(s)"),
+            ("add 1", "add takes 0 argument(s)"),
+            ("pop local x", "pop takes a non-negative integer"),
+        ],
+    )
+    def test_errors(self, tmp_path, line, error):
+        path = tmp_path / "Main.vm"
+        path.write_text(f"push constant 0\n{line}\n")
+        with pytest.raises(ValueError, match=re.escape(f"Main.vm:2: {error}")):
+            vmparser.parse_commands(str(path))
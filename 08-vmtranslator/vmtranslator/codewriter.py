@@ -1,25 +1,652 @@
 """Generates Hack assembly code from the parsed VM command."""
 
-from typing import List, Union, Literal, Optional
+from typing import Dict, List, Sequence, Set, Tuple, Union, Literal, Optional
 import os
 
-from vmtranslator import vm, hack
+from vmtranslator import vm, hack, registers
 
 
 PUSHPOP_CMD = Union[Literal[vm.VMCommandTypes.C_PUSH], Literal[vm.VMCommandTypes.C_POP]]
 
 
+def code_block_to_lines(block: str) -> List[str]:
+    lines = block.split("\n")
+    return [l.strip() for l in lines]
+
+
+class Template:
+    """
+    A block of ASM code compiled once into its instruction lines, without
+    comments or blank lines, and with its @%temporaries in registers. Lines
+    with {slots} are filled in by fill(), the rest are shared by every use of
+    the template.
+    """
+
+    __slots__ = ("lines", "_slots")
+
+    def __init__(self, block: str) -> None:
+        lines = [
+            line for line in code_block_to_lines(block) if line and not line.startswith("//")
+        ]
+        self.lines: Tuple[str, ...] = tuple(registers.assign_registers(lines))
+        self._slots = tuple(n for n, line in enumerate(self.lines) if "{" in line)
+
+    def fill(self, **values) -> Sequence[str]:
+        """The lines of the template, with its slots filled from values."""
+        if not self._slots:
+            return self.lines
+        lines = list(self.lines)
+        for n in self._slots:
+            lines[n] = lines[n].format_map(values)
+        return lines
+
+
+def _binary_template(command: str, operation: str) -> Template:
+    return Template(
+        f"""//{command}
+        // SP--
+        @SP
+        M=M-1
+        // D = RAM[SP]
+        A=M
+        D=M
+        // M = RAM[SP-1] op D
+        A=A-1
+        M={operation}
+        """
+    )
+
+
+def _unary_template(command: str, operation: str) -> Template:
+    return Template(
+        f"""//{command}
+        @SP
+        A=M
+        A=A-1
+        M={operation}
+        """
+    )
+
+
+def _comparison_template(command: str, jump: str, label: str) -> Template:
+    return Template(
+        f"""//{command}
+        @SP
+        M=M-1
+        A=M
+        D=M
+        A=A-1
+        // D compares to 0 as RAM[SP-1] to RAM[SP]
+        D=M-D
+        // RAM[SP] = 0 (false)
+        M=0
+        // if D compares true, JUMP to {label}
+        @{label}{{i}}
+        D;{jump}
+
+        // jump to END
+        @END{{i}}
+        0;JMP
+
+        ({label}{{i}})
+        // RAM[SP-1] = -1 (true)
+        @SP
+        A=M
+        A=A-1
+        M=-1
+
+        (END{{i}})
+        """
+    )
+
+
+ARITHMETIC_TEMPLATES: Dict[str, Template] = {
+    vm.ArithmeticCommands.ADD.value: _binary_template("add", "D+M"),
+    vm.ArithmeticCommands.SUB.value: _binary_template("sub", "M-D"),
+    vm.ArithmeticCommands.NEG.value: _unary_template("neg", "-M"),
+    vm.ArithmeticCommands.EQ.value: _comparison_template("eq", "JEQ", "ZERO"),
+    vm.ArithmeticCommands.GT.value: _comparison_template("gt", "JGT", "POSITIVE"),
+    vm.ArithmeticCommands.LT.value: _comparison_template("lt", "JLT", "NEGATIVE"),
+    vm.ArithmeticCommands.AND.value: _binary_template("and", "M&D"),
+    vm.ArithmeticCommands.OR.value: _binary_template("or", "M|D"),
+    vm.ArithmeticCommands.NOT.value: _unary_template("not", "!M"),
+}
+
+
+def _push_pop_templates() -> Dict[Tuple[vm.VMCommandTypes, str], Template]:
+    push, pop = vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP
+    templates = {
+        (push, hack.MemorySegments.CONSTANT.value): Template(
+            """
+            //D=index
+            @{index}
+            D=A
+            //Push D to SP
+            @SP
+            A=M
+            M=D
+            //SP++
+            @SP
+            M=M+1
+            """
+        ),
+        (push, hack.MemorySegments.STATIC.value): Template(
+            """
+            // D = STATIC[i]
+            @{file}.{index}
+            D=M
+            // put D onto stack
+            @SP
+            A=M
+            M=D
+            // SP++
+            @SP
+            M=M+1
+            """
+        ),
+        (pop, hack.MemorySegments.STATIC.value): Template(
+            """
+            // SP--
+            @SP
+            M=M-1
+            A=M
+            D=M
+            // STATIC[INDEX] = D
+            @{file}.{index}
+            M=D
+            """
+        ),
+        (push, hack.MemorySegments.TEMP.value): Template(
+            f"""
+            @{{index}}
+            D=A
+            @{hack.RAM_POSITION_MAP[hack.MemorySegments.TEMP]}
+            A=A+D
+            D=M
+            // RAM[SP] = D
+            @SP
+            A=M
+            M=D
+            // SP++
+            @SP
+            M=M+1
+            """
+        ),
+        (pop, hack.MemorySegments.TEMP.value): Template(
+            f"""
+            @{{index}}
+            D=A
+            @{hack.RAM_POSITION_MAP[hack.MemorySegments.TEMP]}
+            D=A+D
+            // store addr in a temporary
+            @%address
+            M=D
+            @SP
+            M=M-1
+            A=M
+            D=M
+            @%address
+            A=M
+            M=D
+            """
+        ),
+        # the pointer slot is THIS for index 0 and THAT for index 1
+        (push, hack.MemorySegments.POINTER.value): Template(
+            """
+            @{pointer}
+            D=M
+            @SP
+            A=M
+            M=D
+            // SP++
+            @SP
+            M=M+1
+            """
+        ),
+        (pop, hack.MemorySegments.POINTER.value): Template(
+            """
+            // SP--
+            @SP
+            M=M-1
+            // D = RAM[SP]
+            A=M
+            D=M
+            @{pointer}
+            M=D
+            """
+        ),
+    }
+    for segment, segment_pointer in hack.SEGMENT_POINTER_MAP.items():
+        templates[push, segment.value] = Template(
+            f"""
+            // {segment_pointer} i -> D
+            @{{index}}
+            D=A
+            @{segment_pointer}
+            D=M+D
+            A=D
+            D=M
+            @SP
+            A=M
+            M=D
+            @SP
+            M=M+1
+            """
+        )
+        templates[pop, segment.value] = Template(
+            f"""
+            @{{index}}
+            D=A
+            @{segment_pointer}
+            D=M+D
+            @%address
+            M=D
+            @SP
+            M=M-1
+            A=M
+            D=M
+            @%address
+            A=M
+            M=D
+            """
+        )
+    return templates
+
+
+PUSH_POP_TEMPLATES = _push_pop_templates()
+# enum members hash slowly, so writing looks templates up by segment name only
+_PUSH_TEMPLATES, _POP_TEMPLATES = (
+    {segment: template for (c, segment), template in PUSH_POP_TEMPLATES.items() if c is command}
+    for command in (vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP)
+)
+POINTERS = (hack.THIS_POINTER, hack.THAT_POINTER)
+
+# the assembler allocates variables, i.e. statics, from RAM[16] up to the
+# stack, which starts at RAM[256]
+STATIC_RAM = range(16, 256)
+
+# how many lines ASMCodeWriter collects before writing them out in one go
+DEFAULT_BUFFER_LINES = 4096
+
+GOTO_TEMPLATE = Template(
+    """
+    @{label}
+    0;JMP
+    """
+)
+
+IF_TEMPLATE = Template(
+    """
+    // D = pop stack
+    @SP
+    M=M-1
+    A=M
+    D=M
+    // if D!=0, jump to label
+    @{label}
+    D;JNE
+    """
+)
+
+CALL_TEMPLATE = Template(
+    """
+    // push returnAddress
+    @{function}$ret.{i}
+    D=A
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // push LCL
+    @LCL
+    D=M
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // push ARG
+    @ARG
+    D=M
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // push THIS
+    @THIS
+    D=M
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // push THAT
+    @THAT
+    D=M
+    @SP
+    A=M
+    M=D
+    @SP
+    M=M+1
+    // ARG = SP - 5 - nArgs
+    @SP
+    D=M
+    @5
+    D=D-A
+    @{num_args}
+    D=D-A
+    @ARG
+    M=D
+    // LCL = SP
+    @SP
+    D=M
+    @LCL
+    M=D
+    // goto functionName
+    @{function}
+    0;JMP
+    // insert (returnAddress)
+    ({function}$ret.{i})
+    """
+)
+
+RETURN_TEMPLATE = Template(
+    """
+    // endFrame = LCL
+    @LCL
+    D=M
+    @%endFrame
+    M=D
+    // retAttr=*(endFrame - 5)
+    @5
+    D=A
+    @%endFrame
+    A=M
+    A=A-D
+    D=M
+    @%retAttr
+    M=D
+    // *ARG=pop()
+    @SP
+    M=M-1
+    A=M
+    D=M
+    @ARG
+    A=M
+    M=D
+    // SP = ARG + 1
+    @ARG
+    D=M+1
+    @SP
+    M=D
+    // THAT = *(endFrame-1)
+    @%endFrame
+    A=M
+    A=A-1
+    D=M
+    @THAT
+    M=D
+    // THIS = *(endFrame-2)
+    @%endFrame
+    A=M
+    A=A-1
+    A=A-1
+    D=M
+    @THIS
+    M=D
+    // ARG = *(endFrame-3)
+    @%endFrame
+    A=M
+    A=A-1
+    A=A-1
+    A=A-1
+    D=M
+    @ARG
+    M=D
+    // LCL = *(endFrame-4)
+    @%endFrame
+    A=M
+    A=A-1
+    A=A-1
+    A=A-1
+    A=A-1
+    D=M
+    @LCL
+    M=D
+    // goto retAttr
+    @%retAttr
+    A=M
+    0;JMP
+    """
+)
+
+INIT_TEMPLATE = Template(
+    """
+    @256
+    D=A
+    @SP
+    M=D
+    """
+)
+
+
+# The compact runtime: call, return and comparisons jump to routines written
+# once, after the bootstrap code, instead of inlining their code at every use.
+# This takes far less ROM for a few more cycles per use. Sites pass the
+# return address in D, and a call also passes the function in R13 and
+# nArgs + 5 in R14.
+
+_PUSH_D = """
+    @SP
+    AM=M+1
+    A=A-1
+    M=D
+"""
+
+_CALL_ROUTINE = f"""
+    ($CALL)
+    // push returnAddress, LCL, ARG, THIS and THAT
+    {_PUSH_D}
+    @LCL
+    D=M
+    {_PUSH_D}
+    @ARG
+    D=M
+    {_PUSH_D}
+    @THIS
+    D=M
+    {_PUSH_D}
+    @THAT
+    D=M
+    {_PUSH_D}
+    // ARG = SP - (nArgs + 5)
+    @R14
+    D=M
+    @SP
+    D=M-D
+    @ARG
+    M=D
+    // LCL = SP
+    @SP
+    D=M
+    @LCL
+    M=D
+    // goto functionName
+    @R13
+    A=M
+    0;JMP
+"""
+
+_RETURN_ROUTINE = """
+    ($RETURN)
+    // endFrame = LCL
+    @LCL
+    D=M
+    @%endFrame
+    M=D
+    // retAttr = *(endFrame - 5)
+    @5
+    A=D-A
+    D=M
+    @%retAttr
+    M=D
+    // *ARG = pop()
+    @SP
+    AM=M-1
+    D=M
+    @ARG
+    A=M
+    M=D
+    // SP = ARG + 1
+    @ARG
+    D=M+1
+    @SP
+    M=D
+    // THAT, THIS, ARG, LCL = *(--endFrame)
+    @%endFrame
+    AM=M-1
+    D=M
+    @THAT
+    M=D
+    @%endFrame
+    AM=M-1
+    D=M
+    @THIS
+    M=D
+    @%endFrame
+    AM=M-1
+    D=M
+    @ARG
+    M=D
+    @%endFrame
+    AM=M-1
+    D=M
+    @LCL
+    M=D
+    // goto retAttr
+    @%retAttr
+    A=M
+    0;JMP
+"""
+
+
+def _comparison_entry(command: str, jump: str) -> str:
+    return f"""
+    ($CMP.{command})
+    @%returnAddress
+    M=D
+    @SP
+    AM=M-1
+    D=M
+    A=A-1
+    D=M-D
+    // RAM[SP-1] = -1 (true), unless D does not compare true
+    M=-1
+    @$CMP.END
+    D;{jump}
+    """
+
+
+# lt comes last, to fall through to FALSE
+_CMP_ROUTINE = f"""
+    {_comparison_entry("eq", "JEQ")}
+    @$CMP.FALSE
+    0;JMP
+    {_comparison_entry("gt", "JGT")}
+    @$CMP.FALSE
+    0;JMP
+    {_comparison_entry("lt", "JLT")}
+    ($CMP.FALSE)
+    @SP
+    A=M-1
+    M=0
+    ($CMP.END)
+    @%returnAddress
+    A=M
+    0;JMP
+"""
+
+RUNTIME_TEMPLATE = Template(_CALL_ROUTINE + _RETURN_ROUTINE + _CMP_ROUTINE)
+
+COMPACT_CALL_TEMPLATE = Template(
+    """
+    @{function}
+    D=A
+    @R13
+    M=D
+    @{frame}
+    D=A
+    @R14
+    M=D
+    @{function}$ret.{i}
+    D=A
+    @$CALL
+    0;JMP
+    ({function}$ret.{i})
+    """
+)
+
+COMPACT_RETURN_TEMPLATE = Template(
+    """
+    @$RETURN
+    0;JMP
+    """
+)
+
+COMPACT_COMPARISON_TEMPLATE = Template(
+    """
+    @$CMP$ret.{i}
+    D=A
+    @$CMP.{command}
+    0;JMP
+    ($CMP$ret.{i})
+    """
+)
+COMPARISONS = frozenset(
+    c.value for c in (vm.ArithmeticCommands.EQ, vm.ArithmeticCommands.GT, vm.ArithmeticCommands.LT)
+)
+
 class ASMCodeWriter:
     """
     Class to translate a parsed VM command into ASM.
+
+    The code of each command comes from a Template compiled when the module
+    is loaded, so writing a command only fills in its index or labels.
+
+    With compact, calls, returns and comparisons jump to the routines of
+    RUNTIME_TEMPLATE, see COMPACT_CALL_TEMPLATE.
+
+    Lines are buffered and written out in chunks: every buffer_lines lines,
+    on flush() and on close(). The lines written so far are only kept, in
+    written_lines, with keep_lines, e.g. for a pass over the whole ASM;
+    otherwise written_lines is None and memory use does not grow with the
+    program.
     """
 
-    def __init__(self, output_file_path: str) -> None:
-        self.written_lines: List[str] = []
-        self.output = open(output_file_path, "w", encoding="utf-8")
+    def __init__(
+        self,
+        output_file_path: str,
+        keep_lines: bool = False,
+        buffer_lines: int = DEFAULT_BUFFER_LINES,
+        compact: bool = False,
+    ) -> None:
+        if buffer_lines < 1:
+            raise ValueError(f"buffer_lines must be at least 1, got {buffer_lines}")
+        self.written_lines: Optional[List[str]] = [] if keep_lines else None
+        self.buffer_lines = buffer_lines
+        self.compact = compact
+        self._buffer: List[str] = []
+        # line buffered, so each chunk reaches the file as soon as it is written
+        self.output = open(output_file_path, "w", encoding="utf-8", buffering=1)
         self._out_filename = os.path.basename(output_file_path).split(".")[0]
+        self._input_filename = self._out_filename
         self.i = 0  # hacky solution to make sure goto labels are unique :/
         self._current_func: Optional[str] = None
+        self._filled: Dict[Tuple[Template, int, str], Tuple[str, ...]] = {}
+        # the static indices each file uses, each one a cell of static RAM
+        self.static_usage: Dict[str, Set[int]] = {}
         # self.init_memory()
         self.write_init()
 
@@ -33,304 +660,44 @@ class ASMCodeWriter:
         the given arithmetic-logical command.
         """
         self.i += 1
-        command = vm.ArithmeticCommands(command)
-        if command == vm.ArithmeticCommands.ADD:
-            asm = """//add
-                    // SP--
-                    @SP
-                    M=M-1
-                    // D = RAM[SP]
-                    A=M
-                    D=M
-                    // M = D + RAM[SP-1]
-                    A=A-1
-                    M=D+M
-                    """
-        elif command == vm.ArithmeticCommands.SUB:
-            asm = """//sub
-                    // SP--
-                    @SP
-                    M=M-1
-                    // D = RAM[SP]
-                    A=M
-                    D=M
-                    // M = RAM[SP-1] - D
-                    A=A-1
-                    M=M-D
-                    """
-        elif command == vm.ArithmeticCommands.NEG:
-            asm = """//neg
-                    @SP
-                    A=M
-                    A=A-1
-                    M=-M
-                    """
-        elif command == vm.ArithmeticCommands.EQ:
-            asm = f"""//eq
-                    @SP
-                    M=M-1
-                    A=M
-                    D=M
-                    A=A-1
-                    // D==0 if EQ, else not
-                    D=M-D
-                    // RAM[SP] = 0 (false)
-                    M=0
-                    // if D==0, JUMP to ZERO
-                    @ZERO{self.i}
-                    D;JEQ
-
-                    // jump to END
-                    @END{self.i}
-                    0;JMP
-
-                    (ZERO{self.i})
-                    // RAM[SP-1] = 1
-                    @SP
-                    A=M
-                    A=A-1
-                    M=-1
-
-                    (END{self.i})
-                    """
-
-        elif command == vm.ArithmeticCommands.GT:
-            asm = f"""//eq
-                    @SP
-                    M=M-1
-                    A=M
-                    D=M
-                    A=A-1
-                    // D>0 if GT, else not
-                    D=M-D
-                    // RAM[SP] = 0 (false)
-                    M=0
-                    // if D>0, JUMP to POSITIVE
-                    @POSITIVE{self.i}
-                    D;JGT
-
-                    // jump to END
-                    @END{self.i}
-                    0;JMP
-
-                    (POSITIVE{self.i})
-                    // RAM[SP-1] = 1
-                    @SP
-                    A=M
-                    A=A-1
-                    M=-1
-
-                    (END{self.i})
-                    """
-        elif command == vm.ArithmeticCommands.LT:
-            asm = f"""//eq
-                    @SP
-                    M=M-1
-                    A=M
-                    D=M
-                    A=A-1
-                    // D<0 if LT, else not
-                    D=M-D
-                    // RAM[SP] = 0 (false)
-                    M=0
-                    // if D>0, JUMP to NEGATIVE
-                    @NEGATIVE{self.i}
-                    D;JLT
-
-                    // jump to END
-                    @END{self.i}
-                    0;JMP
-
-                    (NEGATIVE{self.i})
-                    // RAM[SP-1] = 1
-                    @SP
-                    A=M
-                    A=A-1
-                    M=-1
-
-                    (END{self.i})
-                    """
-        elif command == vm.ArithmeticCommands.AND:
-            asm = """//and
-                    // SP--
-                    @SP
-                    M=M-1
-                    // D = RAM[SP]
-                    A=M
-                    D=M
-                    // M = RAM[SP-1] - D
-                    A=A-1
-                    M=M&D
-                    """
-
-        elif command == vm.ArithmeticCommands.OR:
-            asm = """//or
-                    // SP--
-                    @SP
-                    M=M-1
-                    // D = RAM[SP]
-                    A=M
-                    D=M
-                    // M = RAM[SP-1] - D
-                    A=A-1
-                    M=M|D
-                    """
-        elif command == vm.ArithmeticCommands.NOT:
-            asm = """//not
-                    @SP
-                    A=M
-                    A=A-1
-                    M=!M
-                    """
-        else:
-            raise ValueError()
-        lines = code_block_to_lines(asm)
-        self._write_lines(lines)
-
-    def write_push_pop(self, command: PUSHPOP_CMD, segment: str, index: int) -> None:
+        if self.compact and command in COMPARISONS:
+            self._write_lines(COMPACT_COMPARISON_TEMPLATE.fill(command=command, i=self.i))
+            return
+        template = ARITHMETIC_TEMPLATES.get(command)
+        if template is None:
+            raise ValueError(f"unknown arithmetic command {command!r}")
+        self._write_lines(template.fill(i=self.i))
+
+    def write_push_pop(
+        self, command: PUSHPOP_CMD, segment: Union[str, hack.MemorySegments], index: int
+    ) -> None:
         """
         Writes to the output file the assembly code that implements
         the given push or pop command.
         """
-        segment: hack.MemorySegments = hack.MemorySegments(segment)
-        if segment == hack.MemorySegments.CONSTANT:
-            assert vm.VMCommandTypes.is_push(command)
-            asm = f"""
-            //D=index
-            @{index}
-            D=A
-            //Push D to SP
-            @SP
-            A=M
-            M=D
-            //SP++
-            @SP 
-            M=M+1"""
-        elif segment in [
-            hack.MemorySegments.LOCAL,
-            hack.MemorySegments.ARGUMENT,
-            hack.MemorySegments.THIS,
-            hack.MemorySegments.THAT,
-        ]:
-            segment_pointer = hack.SEGMENT_POINTER_MAP[segment]
-            if vm.VMCommandTypes.is_push(command):
-                asm = f"""//push {segment_pointer} {index}
-                        // {segment_pointer} i -> D
-                        @{index}
-                        D=A
-                        @{segment_pointer}
-                        D=M+D
-                        A=D
-                        D=M
-                        @SP
-                        A=M
-                        M=D
-                        @SP
-                        M=M+1
-                        """
-            else:
-                asm = f"""//pop {segment_pointer} {index}
-                        @{index}
-                        D=A
-                        @{segment_pointer}
-                        D=M+D
-                        @R13
-                        M=D
-                        @SP
-                        M=M-1
-                        A=M
-                        D=M
-                        @R13
-                        A=M
-                        M=D
-                        """
-        elif segment == hack.MemorySegments.STATIC:
-            if vm.VMCommandTypes.is_push(command):
-                asm = f"""//push static i
-                // D = STATIC[i]
-                @{self._input_filename}.{index}
-                D=M
-                // put D onto stack
-                @SP
-                A=M
-                M=D
-                // SP++
-                @SP
-                M=M+1
-                """
-            else:
-                asm = f"""// pop static i
-                // SP--
-                @SP
-                M=M-1
-                A=M
-                D=M
-                // STATIC[INDEX] = D
-                @{self._input_filename}.{index}
-                M=D
-                """
-        elif segment == hack.MemorySegments.TEMP:
-            if vm.VMCommandTypes.is_push(command):
-                asm = f"""//push temp i
-                @{index}
-                D=A
-                @{hack.RAM_POSITION_MAP[segment]}
-                A=A+D
-                D=M
-                // RAM[SP] = D
-                @SP
-                A=M
-                M=D
-                // SP++
-                @SP
-                M=M+1
-                """
-            else:
-                asm = f"""//pop temp i
-                // SP--
-                @{index}
-                D=A
-                @{hack.RAM_POSITION_MAP[segment]}
-                D=A+D
-                // store addr in RAM13
-                @R13
-                M=D
-                @SP
-                M=M-1
-                A=M
-                D=M
-                @R13
-                A=M
-                M=D
-                """
-        elif segment == hack.MemorySegments.POINTER:
-            assert index == 0 or index == 1
-            accessed_segment = hack.THAT_POINTER if index else hack.THIS_POINTER
-            if vm.VMCommandTypes.is_push(command):
-                asm = f"""// push pointer index
-                @{accessed_segment}
-                D=M
-                @SP
-                A=M
-                M=D
-                // SP++
-                @SP
-                M=M+1
-                """
-            else:
-                asm = f"""// pop pointer index
-                // SP--
-                @SP 
-                M=M-1
-                // D = RAM[SP]
-                A=M
-                D=M
-                @{accessed_segment}
-                M=D
-                """
+        if isinstance(segment, hack.MemorySegments):
+            segment = segment.value
+        if command is vm.VMCommandTypes.C_PUSH:
+            template = _PUSH_TEMPLATES.get(segment)
+        elif command is vm.VMCommandTypes.C_POP:
+            template = _POP_TEMPLATES.get(segment)
         else:
-            raise ValueError()
-        lines = code_block_to_lines(asm)
+            raise ValueError(f"{command} is not a push or pop command")
+        if template is None:
+            raise ValueError(f"cannot {command.name} segment {segment!r}")
+        # the same few push/pops repeat all over a program, so each is filled in once
+        key = (template, index, self._input_filename)
+        lines = self._filled.get(key)
+        if lines is None:
+            if segment == hack.MemorySegments.POINTER.value:
+                if index not in (0, 1):
+                    raise ValueError(f"pointer index must be 0 or 1, got {index}")
+                lines = template.fill(pointer=POINTERS[index])
+            else:
+                lines = template.fill(index=index, file=self._input_filename)
+                if segment == hack.MemorySegments.STATIC.value:
+                    self.static_usage.setdefault(self._input_filename, set()).add(index)
+            lines = self._filled[key] = tuple(lines)
         self._write_lines(lines)
 
     def write_label(self, label: str) -> None:
@@ -341,34 +708,19 @@ class ASMCodeWriter:
     def write_goto(self, label: str) -> None:
         """Writes assembly code that effects the goto command."""
         fname = f"{self._current_func}${label}" if self._current_func else label
-        asm = f"""
-                @{fname}
-                0;JMP
-                """
-        self._write_lines(code_block_to_lines(asm))
+        self._write_lines(GOTO_TEMPLATE.fill(label=fname))
 
     def write_if(self, label: str) -> None:
         """Writes assembly code that effects the if-goto command."""
         fname = f"{self._current_func}${label}" if self._current_func else label
-        asm = f"""
-            // D = pop stack
-            @SP
-            M=M-1
-            A=M
-            D=M
-            // if D>0, jump to label
-            @{fname}
-            D;JNE
-            """
-        self._write_lines(code_block_to_lines(asm))
+        self._write_lines(IF_TEMPLATE.fill(label=fname))
 
     def write_function(self, function_name: str, num_vars: int) -> None:
         """Writes assembly code that effects the function command."""
         self.write_label(function_name)
+        push_constant_0 = _PUSH_TEMPLATES[hack.MemorySegments.CONSTANT.value].fill(index=0)
         for _ in range(num_vars):
-            self.write_push_pop(
-                vm.VMCommandTypes.C_PUSH, hack.MemorySegments.CONSTANT, 0
-            )
+            self._write_lines(push_constant_0)
         # self._current_func = function_name
 
     def write_call(self, function_name: str, num_args: int) -> None:
@@ -380,165 +732,51 @@ class ASMCodeWriter:
             None
         """
         self.i += 1
-        asm = f"""
-                // push returnAddress
-                @{function_name}$ret.{self.i}
-                D=A 
-                @SP
-                A=M
-                M=D
-                @SP
-                M=M+1
-                // push LCL
-                @LCL
-                D=M
-                @SP
-                A=M
-                M=D
-                @SP
-                M=M+1
-                // push ARG
-                @ARG
-                D=M
-                @SP
-                A=M
-                M=D
-                @SP
-                M=M+1
-                // push THIS
-                @THIS
-                D=M
-                @SP
-                A=M
-                M=D
-                @SP
-                M=M+1
-                // push THAT
-                @THAT
-                D=M
-                @SP
-                A=M
-                M=D
-                @SP
-                M=M+1
-                // ARG = SP - 5 - nArgs
-                @SP
-                D=M
-                @5
-                D=D-A
-                @{num_args}
-                D=D-A
-                @ARG
-                M=D
-                // LCL = SP
-                @SP
-                D=M
-                @LCL
-                M=D
-                // goto functionName
-                @{function_name}
-                0;JMP
-                // insert (returnAddress)
-                ({function_name}$ret.{self.i})
-                """
-        self._write_lines(code_block_to_lines(asm))
+        if self.compact:
+            lines = COMPACT_CALL_TEMPLATE.fill(function=function_name, frame=num_args + 5, i=self.i)
+        else:
+            lines = CALL_TEMPLATE.fill(function=function_name, num_args=num_args, i=self.i)
+        self._write_lines(lines)
 
     def write_return(self) -> None:
         """Writes assembly code that effects the return command."""
-        self.i += 1
-        asm = f"""
-                // endFrame = LCL
-                @LCL
-                D=M
-                @endFrame{self.i}
-                M=D
-                // retAttr=*(endFrame - 5)
-                @5
-                D=A
-                @endFrame{self.i}
-                A=M
-                A=A-D
-                D=M
-                @retAttr{self.i}
-                M=D
-                // *ARG=pop()
-                @SP
-                M=M-1
-                A=M
-                D=M
-                @ARG
-                A=M
-                M=D
-                // SP = ARG + 1
-                @ARG
-                D=M+1
-                @SP
-                M=D
-                // THAT = *(endFrame-1)
-                @endFrame{self.i}
-                A=M
-                A=A-1
-                D=M
-                @THAT
-                M=D
-                // THIS = *(endFrame-2)
-                @endFrame{self.i}
-                A=M
-                A=A-1
-                A=A-1
-                D=M
-                @THIS
-                M=D
-                // ARG = *(endFrame-3)
-                @endFrame{self.i}
-                A=M
-                A=A-1
-                A=A-1
-                A=A-1
-                D=M
-                @ARG
-                M=D
-                // LCL = *(endFrame-4)
-                @endFrame{self.i}
-                A=M
-                A=A-1
-                A=A-1
-                A=A-1
-                A=A-1
-                D=M
-                @LCL
-                M=D
-                // goto retAttr
-                @retAttr{self.i}
-                A=M
-                0;JMP
-                """
-        self._write_lines(code_block_to_lines(asm))
+        if self.compact:
+            self._write_lines(COMPACT_RETURN_TEMPLATE.lines)
+        else:
+            self._write_lines(RETURN_TEMPLATE.lines)
         # self._current_func = None
 
     def write_init(self) -> None:
         """Write the startup bootstrap code."""
-        asm = """
-                @256
-                D=A
-                @SP
-                M=D
-                """
-        self._write_lines(code_block_to_lines(asm))
+        self._write_lines(INIT_TEMPLATE.lines)
         self.write_call("Sys.init", 0)
-
-    def _write_lines(self, lines: List[str]) -> None:
-        for line in lines:
-            if not line or line.startswith("//"):
-                continue
-            self.output.write(line)
-            self.output.write("\n")
-            self.written_lines.append(line)
+        if self.compact:
+            self._write_lines(RUNTIME_TEMPLATE.lines)
+
+    def _write_lines(self, lines: Sequence[str]) -> None:
+        # lines come from templates, so are already free of comments
+        self._buffer.extend(lines)
+        if self.written_lines is not None:
+            self.written_lines.extend(lines)
+        if len(self._buffer) >= self.buffer_lines:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self._buffer:
+            self._buffer.append("")
+            self.output.write("\n".join(self._buffer))
+            self._buffer.clear()
+
+    def flush(self) -> None:
+        """Writes the buffered lines to the output file and flushes it."""
+        self._write_buffer()
+        self.output.flush()
 
     def close(self) -> None:
         """
-        Closes the output file.
+        Writes the buffered lines and closes the output file.
         """
+        self._write_buffer()
         self.output.close()
 
     def init_memory(self) -> None:
@@ -547,6 +785,21 @@ class ASMCodeWriter:
                 """
 
 
-def code_block_to_lines(block: str) -> List[str]:
-    lines = block.split("\n")
-    return [l.strip() for l in lines]
+def format_static_usage(static_usage: Dict[str, Set[int]]) -> str:
+    """
+    Format the cells of static RAM taken by each file as a table, largest
+    first, and how much of STATIC_RAM they leave free. The translator's own
+    temporaries live in registers and take none.
+    """
+    usage = {name: len(indices) for name, indices in static_usage.items()}
+    lines = [f"{'file':<40} {'statics':>7}"]
+    for name, cells in sorted(usage.items(), key=lambda item: (-item[1], item[0])):
+        lines.append(f"{name:<40} {cells:>7}")
+    total = sum(usage.values())
+    lines.append(f"{f'total ({len(usage)} files)':<40} {total:>7}")
+    free = len(STATIC_RAM) - total
+    if free >= 0:
+        lines.append(f"{f'free of RAM[{STATIC_RAM.start}..{STATIC_RAM.stop - 1}]':<40} {free:>7}")
+    else:
+        lines.append(f"{'overflowing into the stack':<40} {-free:>7}")
+    return "\n".join(lines)
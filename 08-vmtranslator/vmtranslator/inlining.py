@@ -0,0 +1,240 @@
+"""Inlining of small leaf functions at their VM call sites."""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from vmtranslator import hack, vm
+
+# body size, in VM commands, of the largest function that is inlined
+DEFAULT_MAX_CALLEE_SIZE = 16
+# how much the inliner may grow the program, as a fraction of its VM commands
+DEFAULT_MAX_GROWTH = 0.25
+
+N_TEMP_REGISTERS = 8
+
+BINARY_COMMANDS = {
+    vm.ArithmeticCommands.ADD.value,
+    vm.ArithmeticCommands.SUB.value,
+    vm.ArithmeticCommands.EQ.value,
+    vm.ArithmeticCommands.GT.value,
+    vm.ArithmeticCommands.LT.value,
+    vm.ArithmeticCommands.AND.value,
+    vm.ArithmeticCommands.OR.value,
+}
+
+
+class InlineCandidate:
+    """
+    A function whose body can replace its call sites.
+
+    Only leaf functions (that call nothing) are candidates, which also rules
+    out recursion. Their arguments and locals move to temp registers the body
+    does not use: temp is shared by all functions, so no caller can expect it
+    to survive a call, but a nested call could clobber the moved arguments.
+    """
+
+    def __init__(
+        self, name: str, file_name: str, n_vars: int, body: List[vm.VMCommand]
+    ) -> None:
+        self.name = name
+        self.file_name = file_name
+        self.n_vars = n_vars
+        self.body = body
+        self.used_temps: Set[int] = set()
+        self.saved_pointers: List[int] = []
+        self.n_args_read = 0
+        for command in body:
+            if command.cmd_type in (vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP):
+                segment = hack.MemorySegments(command.arg1)
+                if segment == hack.MemorySegments.TEMP:
+                    self.used_temps.add(command.arg2)
+                elif segment == hack.MemorySegments.ARGUMENT:
+                    self.n_args_read = max(self.n_args_read, command.arg2 + 1)
+                elif (
+                    segment == hack.MemorySegments.POINTER
+                    and command.cmd_type == vm.VMCommandTypes.C_POP
+                    and command.arg2 not in self.saved_pointers
+                ):
+                    # THIS and THAT are restored by return, so save them instead
+                    self.saved_pointers.append(command.arg2)
+
+    def temps_needed(self, n_args: int) -> int:
+        return n_args + self.n_vars + len(self.saved_pointers)
+
+    def fits(self, n_args: int) -> bool:
+        """Can a call with n_args arguments be inlined?"""
+        free_temps = N_TEMP_REGISTERS - len(self.used_temps)
+        return self.n_args_read <= n_args and self.temps_needed(n_args) <= free_temps
+
+    def expand(self, n_args: int, site: int) -> List[vm.VMCommand]:
+        """The commands replacing `call name n_args`; site makes the labels unique."""
+        free_temps = [i for i in range(N_TEMP_REGISTERS) if i not in self.used_temps]
+        arg_temps = free_temps[:n_args]
+        local_temps = free_temps[n_args : n_args + self.n_vars]
+        saved_temps = free_temps[n_args + self.n_vars : self.temps_needed(n_args)]
+        end_label = f"{self.name}$inline{site}$end"
+        temp = hack.MemorySegments.TEMP.value
+        pointer = hack.MemorySegments.POINTER.value
+
+        commands = [vm.VMCommand(vm.VMCommandTypes.C_POP, temp, i) for i in reversed(arg_temps)]
+        for i in local_temps:
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_PUSH, hack.MemorySegments.CONSTANT.value, 0))
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_POP, temp, i))
+        for index, i in zip(self.saved_pointers, saved_temps):
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_PUSH, pointer, index))
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_POP, temp, i))
+        jumps_to_end = False
+        for position, command in enumerate(self.body):
+            if command.cmd_type == vm.VMCommandTypes.C_RETURN:
+                # the return value is the only thing left on the body's stack
+                if position != len(self.body) - 1:
+                    commands.append(vm.VMCommand(vm.VMCommandTypes.C_GOTO, end_label))
+                    jumps_to_end = True
+            elif command.cmd_type in (
+                vm.VMCommandTypes.C_LABEL,
+                vm.VMCommandTypes.C_GOTO,
+                vm.VMCommandTypes.C_IF,
+            ):
+                commands.append(command._replace(arg1=f"{command.arg1}$inline{site}"))
+            elif command.cmd_type in (vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP):
+                segment = hack.MemorySegments(command.arg1)
+                if segment == hack.MemorySegments.ARGUMENT:
+                    command = command._replace(arg1=temp, arg2=arg_temps[command.arg2])
+                elif segment == hack.MemorySegments.LOCAL:
+                    command = command._replace(arg1=temp, arg2=local_temps[command.arg2])
+                elif segment == hack.MemorySegments.STATIC:
+                    command = command._replace(file_name=command.file_name or self.file_name)
+                commands.append(command)
+            else:
+                commands.append(command)
+        if jumps_to_end:
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_LABEL, end_label))
+        for index, i in reversed(list(zip(self.saved_pointers, saved_temps))):
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_PUSH, temp, i))
+            commands.append(vm.VMCommand(vm.VMCommandTypes.C_POP, pointer, index))
+        return commands
+
+
+def find_candidates(
+    program: vm.VMProgram, max_callee_size: int = DEFAULT_MAX_CALLEE_SIZE
+) -> Dict[str, InlineCandidate]:
+    """Find the functions of the program that can be inlined."""
+    candidates = {}
+    for file_name, commands in program:
+        for name, n_vars, body in split_functions(commands):
+            if len(body) > max_callee_size:
+                continue
+            if any(command.cmd_type == vm.VMCommandTypes.C_CALL for command in body):
+                continue
+            if not returns_single_value(body):
+                continue
+            candidates[name] = InlineCandidate(name, file_name, n_vars, body)
+    return candidates
+
+
+def inline_calls(
+    program: vm.VMProgram,
+    max_callee_size: int = DEFAULT_MAX_CALLEE_SIZE,
+    max_growth: float = DEFAULT_MAX_GROWTH,
+) -> Tuple[vm.VMProgram, Dict[str, int]]:
+    """
+    Replace calls to small leaf functions by their bodies, in program
+    order, until the program has grown by max_growth. Returns the new
+    program and the number of call sites inlined per function.
+    """
+    candidates = find_candidates(program, max_callee_size)
+    budget = int(max_growth * sum(len(commands) for _, commands in program))
+    inlined: Dict[str, int] = {}
+    site = 0
+    new_program = []
+    for file_name, commands in program:
+        new_commands = []
+        for command in commands:
+            candidate = None
+            if command.cmd_type == vm.VMCommandTypes.C_CALL:
+                candidate = candidates.get(command.arg1)
+            if candidate is None or not candidate.fits(command.arg2):
+                new_commands.append(command)
+                continue
+            expansion = candidate.expand(command.arg2, site)
+            if len(expansion) - 1 > budget:
+                new_commands.append(command)
+                continue
+            budget -= len(expansion) - 1
+            site += 1
+            inlined[candidate.name] = inlined.get(candidate.name, 0) + 1
+            new_commands.extend(expansion)
+        new_program.append((file_name, new_commands))
+    return new_program, inlined
+
+
+def split_functions(
+    commands: List[vm.VMCommand],
+) -> List[Tuple[str, int, List[vm.VMCommand]]]:
+    """Split a file's commands into (name, n_vars, body) per function."""
+    functions = []
+    for command in commands:
+        if command.cmd_type == vm.VMCommandTypes.C_FUNCTION:
+            functions.append((command.arg1, command.arg2, []))
+        elif functions:
+            functions[-1][2].append(command)
+    return functions
+
+
+def returns_single_value(body: List[vm.VMCommand]) -> bool:
+    """
+    Check that every path through the body ends in a return with exactly
+    the return value on the stack, so a return can become a jump to the
+    end of the inlined code.
+    """
+    labels = {
+        command.arg1: position
+        for position, command in enumerate(body)
+        if command.cmd_type == vm.VMCommandTypes.C_LABEL
+    }
+    depths: Dict[int, int] = {}
+    pending = [(0, 0)]
+    while pending:
+        position, depth = pending.pop()
+        while True:
+            if position >= len(body) or depth < 0:
+                return False
+            if position in depths:
+                if depths[position] != depth:
+                    return False
+                break
+            depths[position] = depth
+            command = body[position]
+            next_positions: Optional[List[int]] = [position + 1]
+            if command.cmd_type == vm.VMCommandTypes.C_PUSH:
+                depth += 1
+            elif command.cmd_type == vm.VMCommandTypes.C_POP:
+                depth -= 1
+            elif command.cmd_type == vm.VMCommandTypes.C_ARITHMETIC and command.arg1 in BINARY_COMMANDS:
+                depth -= 1
+            elif command.cmd_type == vm.VMCommandTypes.C_RETURN:
+                if depth != 1:
+                    return False
+                next_positions = None
+            elif command.cmd_type in (vm.VMCommandTypes.C_GOTO, vm.VMCommandTypes.C_IF):
+                if command.arg1 not in labels:
+                    return False
+                if command.cmd_type == vm.VMCommandTypes.C_IF:
+                    depth -= 1
+                    next_positions = [position + 1, labels[command.arg1]]
+                else:
+                    next_positions = [labels[command.arg1]]
+            if next_positions is None:
+                break
+            for other in next_positions[1:]:
+                pending.append((other, depth))
+            position = next_positions[0]
+    return True
+
+
+def format_inlined(inlined: Dict[str, int]) -> str:
+    """Format the number of call sites inlined per function as a table."""
+    lines = [f"{'inlined function':<40} {'sites':>7}"]
+    for function_name, sites in sorted(inlined.items(), key=lambda item: (-item[1], item[0])):
+        lines.append(f"{function_name:<40} {sites:>7}")
+    lines.append(f"{f'total ({len(inlined)} functions)':<40} {sum(inlined.values()):>7}")
+    return "\n".join(lines)
@@ -1,14 +1,37 @@
 """Main entry point for running the VMTranslator from the command line."""
 
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List, Set, Tuple
 import os
 import argparse
 
-from vmtranslator import codewriter, vmparser, vm
-
-
-def translate_to_hack(input_path: str, output_file_path: Optional[str] = None) -> None:
-    """Translate VM code to Hack code, writing to the output path."""
+from vmtranslator import codewriter, inlining, treeshaking, vmparser, vm
+from vmtranslator import peephole as peephole_optimizer
+
+
+def translate_to_hack(
+    input_path: str,
+    output_file_path: Optional[str] = None,
+    tree_shake: bool = False,
+    inline: bool = False,
+    inline_max_size: int = inlining.DEFAULT_MAX_CALLEE_SIZE,
+    inline_max_growth: float = inlining.DEFAULT_MAX_GROWTH,
+    peephole: bool = False,
+    compact_runtime: bool = False,
+    ram_report: bool = False,
+) -> None:
+    """
+    Translate VM code to Hack code, writing to the output path.
+
+    With peephole, each function is first rewritten by the peephole
+    optimizer, and how often each of its rules fired is reported. With
+    inline, calls to small leaf functions are replaced by their bodies.
+    With tree_shake, functions that cannot be reached from
+    Sys.init are left out, and the ROM space saved by each is reported.
+    With compact_runtime, calls, returns and comparisons jump to shared
+    routines instead of inlining their code, which saves ROM but costs
+    cycles. With ram_report, the cells of static RAM each file takes are
+    reported.
+    """
     input_is_file = os.path.isfile(input_path)
     output_file_path = output_file_path or (
         make_output_path_for_input_file(input_path)
@@ -20,42 +43,124 @@ def translate_to_hack(input_path: str, output_file_path: Optional[str] = None) -
     )
     print("input file paths:", *vm_file_paths)
     print("output file path:", output_file_path)
-    asm_writer = codewriter.ASMCodeWriter(output_file_path)
-    for vm_path in vm_file_paths:
-        parser = vmparser.VMParser(vm_path)
-        asm_writer.set_file_name(vm_path)
-        while parser.has_more_lines():
-            parser.advance()
-            cmd_type = parser.command_type()
-            if cmd_is_pushpop_type(cmd_type):
-                asm_writer.write_push_pop(cmd_type, parser.arg1(), parser.arg2())
-            elif cmd_is_arithmetic_type(cmd_type):
-                asm_writer.write_arithmetic(parser.arg1())
-            elif cmd_is_label_type(cmd_type):
-                asm_writer.write_label(parser.arg1())
-            elif cmd_is_goto_type(cmd_type):
-                asm_writer.write_goto(parser.arg1())
-            elif cmd_is_if_type(cmd_type):
-                asm_writer.write_if(parser.arg1())
-            elif cmd_is_function_type(cmd_type):
-                asm_writer.write_function(parser.arg1(), parser.arg2())
-            elif cmd_is_return_type(cmd_type):
-                asm_writer.write_return()
-            elif cmd_is_call_type(cmd_type):
-                asm_writer.write_call(parser.arg1(), parser.arg2())
+    program = (
+        (vm_path, vmparser.iter_commands(vm_path)) for vm_path in vm_file_paths
+    )
+    translate_program(
+        program,
+        output_file_path,
+        tree_shake=tree_shake,
+        inline=inline,
+        inline_max_size=inline_max_size,
+        inline_max_growth=inline_max_growth,
+        peephole=peephole,
+        compact_runtime=compact_runtime,
+        ram_report=ram_report,
+    )
+
+
+def translate_program(
+    program: Iterable[Tuple[str, Iterable[vm.VMCommand]]],
+    output_file_path: str,
+    tree_shake: bool = False,
+    inline: bool = False,
+    inline_max_size: int = inlining.DEFAULT_MAX_CALLEE_SIZE,
+    inline_max_growth: float = inlining.DEFAULT_MAX_GROWTH,
+    peephole: bool = False,
+    compact_runtime: bool = False,
+    ram_report: bool = False,
+) -> None:
+    """
+    Translate the already parsed commands of each file of a program to Hack
+    code, see translate_to_hack. The files are translated as they are
+    produced, unless inlining or tree shaking needs the whole program first.
+    """
+    if peephole:
+        peephole_stats = peephole_optimizer.PeepholeStats()
+        program = (
+            (path, peephole_optimizer.optimize(commands, peephole_stats))
+            for path, commands in program
+        )
+    if inline or tree_shake:
+        program = [(path, list(commands)) for path, commands in program]
+    if inline:
+        program, inlined = inlining.inline_calls(
+            program, inline_max_size, inline_max_growth
+        )
+        print(inlining.format_inlined(inlined))
+    asm_writer = codewriter.ASMCodeWriter(output_file_path, compact=compact_runtime)
+    reachable: Optional[Set[str]] = None
+    if tree_shake:
+        reachable = treeshaking.reachable_functions(
+            treeshaking.read_call_graph(program)
+        )
+        # dropped functions are still translated, into a throwaway writer, to
+        # measure how many ROM words they would have taken
+        dropped_writer = codewriter.ASMCodeWriter(
+            os.devnull, keep_lines=True, compact=compact_runtime
+        )
+        dropped_writer.written_lines.clear()  # its bootstrap and runtime code
+        savings: Dict[str, int] = {}
+    for vm_path, commands in program:
+        writer = asm_writer
+        for command in commands:
+            if reachable is not None and cmd_is_function_type(command.cmd_type):
+                function_name = command.arg1
+                writer = asm_writer if function_name in reachable else dropped_writer
+            # inlined commands keep the statics of the file they came from
+            writer.set_file_name(command.file_name or vm_path)
+            if writer is asm_writer:
+                write_command(asm_writer, command)
             else:
-                raise ValueError(f"command type: {cmd_type} not recognized.")
+                write_command(writer, command)
+                savings[function_name] = savings.get(
+                    function_name, 0
+                ) + count_instructions(writer.written_lines)
+                writer.written_lines.clear()
     asm_writer.close()
-    # lines = asm_writer.written_lines
-    # lines = [l for l in lines if l.startswith("(")]
+    if peephole:
+        print(peephole_optimizer.format_stats(peephole_stats))
+    if reachable is not None:
+        dropped_writer.close()
+        print(treeshaking.format_savings(savings))
+    if ram_report:
+        print(codewriter.format_static_usage(asm_writer.static_usage))
+
+
+def write_command(asm_writer: codewriter.ASMCodeWriter, command: vm.VMCommand) -> None:
+    """Write the ASM for a VM command."""
+    cmd_type = command.cmd_type
+    if cmd_is_pushpop_type(cmd_type):
+        asm_writer.write_push_pop(cmd_type, command.arg1, command.arg2)
+    elif cmd_is_arithmetic_type(cmd_type):
+        asm_writer.write_arithmetic(command.arg1)
+    elif cmd_is_label_type(cmd_type):
+        asm_writer.write_label(command.arg1)
+    elif cmd_is_goto_type(cmd_type):
+        asm_writer.write_goto(command.arg1)
+    elif cmd_is_if_type(cmd_type):
+        asm_writer.write_if(command.arg1)
+    elif cmd_is_function_type(cmd_type):
+        asm_writer.write_function(command.arg1, command.arg2)
+    elif cmd_is_return_type(cmd_type):
+        asm_writer.write_return()
+    elif cmd_is_call_type(cmd_type):
+        asm_writer.write_call(command.arg1, command.arg2)
+    else:
+        raise ValueError(f"command type: {cmd_type} not recognized.")
+
+
+def count_instructions(asm_lines: List[str]) -> int:
+    """Count the ROM words taken by ASM lines; (LABEL) lines take none."""
+    return sum(1 for line in asm_lines if not line.startswith("("))
 
 
 def list_all_vm_files(dir_path: str) -> List[str]:
-    """Given a directory path, list all the VM files in it."""
-    abs_dir_path = os.path.abspath(os.path.dirname(dir_path))
-    vm_files = [
+    """Given a directory path, list all the VM files in it, sorted by name."""
+    abs_dir_path = os.path.abspath(dir_path)
+    vm_files = sorted(
         os.path.basename(name) for name in os.listdir(dir_path) if name.endswith("vm")
-    ]
+    )
     return [os.path.join(abs_dir_path, vmfile) for vmfile in vm_files]
 
 
@@ -120,13 +225,61 @@ def get_cmdline_args() -> argparse.Namespace:
     parser.add_argument(
         "--output_file", required=False, help="Where to save the output assembly file"
     )
+    parser.add_argument(
+        "--tree-shake",
+        action="store_true",
+        help="Drop functions that are never called, directly or not, from Sys.init",
+    )
+    parser.add_argument(
+        "--inline",
+        action="store_true",
+        help="Replace calls to small leaf functions by their bodies",
+    )
+    parser.add_argument(
+        "--inline-max-size",
+        type=int,
+        default=inlining.DEFAULT_MAX_CALLEE_SIZE,
+        help="Largest function body, in VM commands, to inline",
+    )
+    parser.add_argument(
+        "--inline-max-growth",
+        type=float,
+        default=inlining.DEFAULT_MAX_GROWTH,
+        help="How much inlining may grow the program, as a fraction of its VM commands",
+    )
+    parser.add_argument(
+        "--peephole",
+        action="store_true",
+        help="Rewrite wasteful VM command sequences, e.g. `not` before `if-goto`",
+    )
+    parser.add_argument(
+        "--compact-runtime",
+        action="store_true",
+        help="Jump to shared call, return and comparison routines instead of "
+        "inlining them, for less ROM but more cycles",
+    )
+    parser.add_argument(
+        "--ram-report",
+        action="store_true",
+        help="Print the cells of static RAM each file takes",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     """Run the VM Translator"""
     args = get_cmdline_args()
-    translate_to_hack(args.input_path, args.output_file)
+    translate_to_hack(
+        args.input_path,
+        args.output_file,
+        tree_shake=args.tree_shake,
+        inline=args.inline,
+        inline_max_size=args.inline_max_size,
+        inline_max_growth=args.inline_max_growth,
+        peephole=args.peephole,
+        compact_runtime=args.compact_runtime,
+        ram_report=args.ram_report,
+    )
 
 
 if __name__ == "__main__":
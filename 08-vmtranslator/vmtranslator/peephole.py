@@ -0,0 +1,398 @@
+"""
+Peephole optimization of VM code, run on each function on its own.
+
+Can be run as a stage of the translator (--peephole) or on its own, to
+rewrite .vm files in place:
+
+  $ python -m vmtranslator.peephole pathToDir
+"""
+
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import argparse
+import os
+
+from vmtranslator import hack, vm, vmparser
+
+NOT = vm.ArithmeticCommands.NOT.value
+NEG = vm.ArithmeticCommands.NEG.value
+TEMP = hack.MemorySegments.TEMP
+
+# commands that leave 0 or -1 on the stack, so `not; if-goto` after them is the inverse of `if-goto`
+COMPARISONS = {
+    vm.ArithmeticCommands.EQ.value,
+    vm.ArithmeticCommands.GT.value,
+    vm.ArithmeticCommands.LT.value,
+}
+# commands after which control never falls through to the next command
+NO_FALL_THROUGH = {vm.VMCommandTypes.C_GOTO, vm.VMCommandTypes.C_RETURN}
+# commands that branch or can be branched to; everything else runs straight
+CONTROL_FLOW = {
+    vm.VMCommandTypes.C_LABEL,
+    vm.VMCommandTypes.C_GOTO,
+    vm.VMCommandTypes.C_IF,
+    vm.VMCommandTypes.C_RETURN,
+}
+# how many commands before a rewrite to look at again, for patterns it completed
+WINDOW = 3
+
+# the end of the commands a rule matched and the commands replacing them
+Rewrite = Optional[Tuple[int, List[vm.VMCommand]]]
+
+
+class Rule(NamedTuple):
+    """A rewrite of the commands starting at a position of a function body."""
+
+    name: str
+    rewrite: Callable[[List[vm.VMCommand], int, Dict[str, int]], Rewrite]
+
+
+class PeepholeStats:
+    """How often each rule fired and how many commands it eliminated."""
+
+    def __init__(self) -> None:
+        self.fired: Dict[str, int] = {}
+        self.eliminated: Dict[str, int] = {}
+        self.commands_before = 0
+        self.commands_after = 0
+
+    def record(self, rule_name: str, eliminated: int) -> None:
+        self.fired[rule_name] = self.fired.get(rule_name, 0) + 1
+        self.eliminated[rule_name] = self.eliminated.get(rule_name, 0) + eliminated
+
+
+def is_arithmetic(command: vm.VMCommand, *names: str) -> bool:
+    return command.cmd_type == vm.VMCommandTypes.C_ARITHMETIC and command.arg1 in names
+
+
+def is_segment(command: vm.VMCommand, segment: hack.MemorySegments) -> bool:
+    return command.arg1 == segment.value
+
+
+def count_code(commands: List[vm.VMCommand]) -> int:
+    """Count the commands that are translated to instructions; labels are not."""
+    return sum(1 for c in commands if c.cmd_type != vm.VMCommandTypes.C_LABEL)
+
+
+def label_references(body: List[vm.VMCommand]) -> Dict[str, int]:
+    """Count the jumps to each label of a function body."""
+    references: Dict[str, int] = {}
+    for command in body:
+        if command.cmd_type in (vm.VMCommandTypes.C_GOTO, vm.VMCommandTypes.C_IF):
+            references[command.arg1] = references.get(command.arg1, 0) + 1
+    return references
+
+
+def find_label(body: List[vm.VMCommand], label: str, start: int = 0) -> Optional[int]:
+    for position in range(start, len(body)):
+        command = body[position]
+        if command.cmd_type == vm.VMCommandTypes.C_LABEL and command.arg1 == label:
+            return position
+    return None
+
+
+def fresh_label(body: List[vm.VMCommand], label: str) -> str:
+    """A label based on the given one that the body does not use yet."""
+    used = {c.arg1 for c in body if c.cmd_type == vm.VMCommandTypes.C_LABEL}
+    candidate, n = label, 1
+    while candidate in used:
+        candidate, n = f"{label}{n}", n + 1
+    return candidate
+
+
+def fold_constant_branch(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """push constant k; [not|neg;] if-goto L: always or never jumps."""
+    command = body[i]
+    if command.cmd_type != vm.VMCommandTypes.C_PUSH:
+        return None
+    if not is_segment(command, hack.MemorySegments.CONSTANT):
+        return None
+    value, j = command.arg2, i + 1
+    if j < len(body) and is_arithmetic(body[j], NOT):
+        value, j = ~value, j + 1
+    elif j < len(body) and is_arithmetic(body[j], NEG):
+        value, j = -value, j + 1
+    if j >= len(body) or body[j].cmd_type != vm.VMCommandTypes.C_IF:
+        return None
+    if value == 0:
+        return j + 1, []
+    return j + 1, [vm.VMCommand(vm.VMCommandTypes.C_GOTO, body[j].arg1)]
+
+
+def drop_double_negation(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """not; not and neg; neg do nothing."""
+    for name in (NOT, NEG):
+        if is_arithmetic(body[i], name) and i + 1 < len(body) and is_arithmetic(body[i + 1], name):
+            return i + 2, []
+    return None
+
+
+def drop_push_pop(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """push X; pop X writes X back unchanged."""
+    if i + 1 >= len(body):
+        return None
+    push, pop = body[i], body[i + 1]
+    if push.cmd_type != vm.VMCommandTypes.C_PUSH or pop.cmd_type != vm.VMCommandTypes.C_POP:
+        return None
+    if (push.arg1, push.arg2, push.file_name) != (pop.arg1, pop.arg2, pop.file_name):
+        return None
+    return i + 2, []
+
+
+def temp_is_dead(body: List[vm.VMCommand], start: int, index: int) -> bool:
+    """
+    Is temp index written before it is read again, on the only path from
+    start? Only straight-line code is followed, so a jump gives up.
+    """
+    for command in body[start:]:
+        if command.cmd_type in (vm.VMCommandTypes.C_PUSH, vm.VMCommandTypes.C_POP):
+            if is_segment(command, TEMP) and command.arg2 == index:
+                return command.cmd_type == vm.VMCommandTypes.C_POP
+        elif command.cmd_type == vm.VMCommandTypes.C_RETURN:
+            return True
+        elif command.cmd_type in (vm.VMCommandTypes.C_GOTO, vm.VMCommandTypes.C_IF):
+            return False
+    return True
+
+
+def drop_dead_temp_store(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """pop temp k; push temp k leaves the stack as it was, and temp k is not read again."""
+    if i + 1 >= len(body):
+        return None
+    pop, push = body[i], body[i + 1]
+    if pop.cmd_type != vm.VMCommandTypes.C_POP or push.cmd_type != vm.VMCommandTypes.C_PUSH:
+        return None
+    if not is_segment(pop, TEMP) or not is_segment(push, TEMP):
+        return None
+    if pop.arg2 != push.arg2 or not temp_is_dead(body, i + 2, pop.arg2):
+        return None
+    return i + 2, []
+
+
+def drop_jump_to_next(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """goto L; label L: control falls through to L anyway."""
+    if body[i].cmd_type != vm.VMCommandTypes.C_GOTO:
+        return None
+    j = i + 1
+    while j < len(body) and body[j].cmd_type == vm.VMCommandTypes.C_LABEL:
+        if body[j].arg1 == body[i].arg1:
+            return i + 1, []
+        j += 1
+    return None
+
+
+def thread_jump(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """goto L, where L is followed by goto M: jump to M directly."""
+    command = body[i]
+    if command.cmd_type not in (vm.VMCommandTypes.C_GOTO, vm.VMCommandTypes.C_IF):
+        return None
+    target, seen = command.arg1, {command.arg1}
+    while True:
+        position = find_label(body, target)
+        if position is None:
+            break
+        position += 1
+        while position < len(body) and body[position].cmd_type == vm.VMCommandTypes.C_LABEL:
+            position += 1
+        if position >= len(body) or body[position].cmd_type != vm.VMCommandTypes.C_GOTO:
+            break
+        target = body[position].arg1
+        if target in seen:
+            # an endless loop of jumps, leave it be
+            return None
+        seen.add(target)
+    if target == command.arg1:
+        return None
+    return i + 1, [command._replace(arg1=target)]
+
+
+def drop_unreachable(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """Commands after a goto or return, up to the next label, never run."""
+    if body[i].cmd_type not in NO_FALL_THROUGH:
+        return None
+    j = i + 1
+    while j < len(body) and body[j].cmd_type != vm.VMCommandTypes.C_LABEL:
+        j += 1
+    if j == i + 1:
+        return None
+    return j, [body[i]]
+
+
+def drop_unused_label(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """Labels nothing jumps to."""
+    if body[i].cmd_type != vm.VMCommandTypes.C_LABEL or refs.get(body[i].arg1, 0):
+        return None
+    return i + 1, []
+
+
+def rotate_loop(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """
+    label W; cond; not; if-goto E; statements; goto W; label E, as compiled
+    for a while loop, becomes goto W; label T; statements; label W; cond;
+    if-goto T; label E, which takes one jump per iteration instead of two
+    and a not. Only done when cond is a comparison: if-goto jumps on any
+    value but 0, so not; if-goto is only the inverse of if-goto for 0 and -1.
+    """
+    if body[i].cmd_type != vm.VMCommandTypes.C_LABEL:
+        return None
+    loop_label = body[i].arg1
+    j = i + 1
+    while j < len(body) and body[j].cmd_type not in CONTROL_FLOW:
+        if is_arithmetic(body[j], NOT):
+            break
+        j += 1
+    if j + 1 >= len(body) or j == i + 1 or not is_arithmetic(body[j], NOT):
+        return None
+    if not is_arithmetic(body[j - 1], *COMPARISONS):
+        return None
+    if body[j + 1].cmd_type != vm.VMCommandTypes.C_IF:
+        return None
+    end_label = body[j + 1].arg1
+    end = find_label(body, end_label, j + 2)
+    if end is None or end - 1 < j + 2:
+        return None
+    if body[end - 1] != vm.VMCommand(vm.VMCommandTypes.C_GOTO, loop_label):
+        return None
+    body_label = fresh_label(body, f"{loop_label}$body")
+    return end + 1, [
+        vm.VMCommand(vm.VMCommandTypes.C_GOTO, loop_label),
+        vm.VMCommand(vm.VMCommandTypes.C_LABEL, body_label),
+        *body[j + 2 : end - 1],
+        body[i],
+        *body[i + 1 : j],
+        vm.VMCommand(vm.VMCommandTypes.C_IF, body_label),
+        body[end],
+    ]
+
+
+def invert_branch(body: List[vm.VMCommand], i: int, refs: Dict[str, int]) -> Rewrite:
+    """
+    cond; not; if-goto A; then; label A, where then never falls through
+    (it ends in a goto or return, as an if statement's then branch does),
+    becomes cond; if-goto T; label A, with label T; then moved to the end
+    of the function. Only done when cond is a comparison, see rotate_loop.
+    """
+    if i == 0 or i + 1 >= len(body) or not is_arithmetic(body[i], NOT):
+        return None
+    if not is_arithmetic(body[i - 1], *COMPARISONS):
+        return None
+    if body[i + 1].cmd_type != vm.VMCommandTypes.C_IF:
+        return None
+    else_label = body[i + 1].arg1
+    else_position = find_label(body, else_label, i + 2)
+    if else_position is None or else_position == i + 2:
+        return None
+    # then is moved after the last command, so neither may fall through
+    if body[else_position - 1].cmd_type not in NO_FALL_THROUGH:
+        return None
+    if body[-1].cmd_type not in NO_FALL_THROUGH:
+        return None
+    then_label = fresh_label(body, f"{else_label}$then")
+    return len(body), [
+        vm.VMCommand(vm.VMCommandTypes.C_IF, then_label),
+        *body[else_position:],
+        vm.VMCommand(vm.VMCommandTypes.C_LABEL, then_label),
+        *body[i + 2 : else_position],
+    ]
+
+
+RULES = [
+    Rule("constant branch", fold_constant_branch),
+    Rule("double negation", drop_double_negation),
+    Rule("push/pop same", drop_push_pop),
+    Rule("dead temp store", drop_dead_temp_store),
+    Rule("jump to next", drop_jump_to_next),
+    Rule("jump threading", thread_jump),
+    Rule("unreachable code", drop_unreachable),
+    Rule("unused label", drop_unused_label),
+    Rule("loop rotation", rotate_loop),
+    Rule("branch inversion", invert_branch),
+]
+
+
+def optimize_function(body: List[vm.VMCommand], stats: PeepholeStats) -> List[vm.VMCommand]:
+    """Apply the rules to a function body until none fires."""
+    body = list(body)
+    changed = True
+    while changed:
+        changed = False
+        refs = label_references(body)
+        i = 0
+        while i < len(body):
+            for rule in RULES:
+                rewrite = rule.rewrite(body, i, refs)
+                if rewrite is not None:
+                    break
+            else:
+                i += 1
+                continue
+            end, replacement = rewrite
+            stats.record(rule.name, count_code(body[i:end]) - count_code(replacement))
+            body[i:end] = replacement
+            refs = label_references(body)
+            changed = True
+            i = max(i - WINDOW, 0)
+    return body
+
+
+def optimize(
+    commands: Iterable[vm.VMCommand], stats: Optional[PeepholeStats] = None
+) -> List[vm.VMCommand]:
+    """Optimize the commands of a file, function by function."""
+    commands = list(commands)
+    stats = stats if stats is not None else PeepholeStats()
+    optimized: List[vm.VMCommand] = []
+    body: List[vm.VMCommand] = []
+    for command in commands:
+        if command.cmd_type == vm.VMCommandTypes.C_FUNCTION:
+            # commands before the first function are left alone, there is no function to jump in
+            optimized.extend(optimize_function(body, stats) if optimized else body)
+            optimized.append(command)
+            body = []
+        else:
+            body.append(command)
+    optimized.extend(optimize_function(body, stats) if optimized else body)
+    stats.commands_before += count_code(commands)
+    stats.commands_after += count_code(optimized)
+    return optimized
+
+
+def format_stats(stats: PeepholeStats) -> str:
+    """Format the number of times each rule fired and the commands it eliminated as a table."""
+    lines = [f"{'peephole rule':<40} {'fired':>7} {'removed':>7}"]
+    by_eliminated = sorted(stats.fired, key=lambda name: (-stats.eliminated[name], name))
+    for name in by_eliminated:
+        fired = stats.fired[name]
+        lines.append(f"{name:<40} {fired:>7} {stats.eliminated[name]:>7}")
+    total = sum(stats.eliminated.values())
+    lines.append(f"{f'total ({stats.commands_before} -> {stats.commands_after} commands)':<40} "
+                 f"{sum(stats.fired.values()):>7} {total:>7}")
+    return "\n".join(lines)
+
+
+def optimize_files(input_path: str) -> PeepholeStats:
+    """Rewrite a VM file, or every VM file of a directory, in place."""
+    if os.path.isfile(input_path):
+        vm_paths = [input_path]
+    else:
+        vm_paths = sorted(
+            os.path.join(input_path, name)
+            for name in os.listdir(input_path)
+            if name.endswith(".vm")
+        )
+    stats = PeepholeStats()
+    for vm_path in vm_paths:
+        commands = optimize(vmparser.parse_commands(vm_path), stats)
+        with open(vm_path, "w", encoding="utf-8") as f:
+            f.writelines(vm.format_command(command) + "\n" for command in commands)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peephole optimize VM code in place.")
+    parser.add_argument("input_path", help="Either a VM file or a directory of VM files")
+    args = parser.parse_args()
+    print(format_stats(optimize_files(args.input_path)))
+
+
+if __name__ == "__main__":
+    main()
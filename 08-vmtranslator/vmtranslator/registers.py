@@ -0,0 +1,58 @@
+"""
+Allocates the registers R13-R15 to the temporaries of the translator's ASM
+code, so that they take no static RAM.
+
+A temporary is written `@%name` in a block of ASM. It is live from the first
+line that names it to the last, which is exact for straight-line code and
+safe for code that only jumps forward within the block. A register is given
+to one temporary at a time and reused as soon as that temporary is dead.
+"""
+
+from typing import Dict, List, Sequence
+import re
+
+# the Hack platform leaves these to VM implementations, for any use
+TEMP_REGISTERS = ("R13", "R14", "R15")
+
+TEMPORARY = re.compile(r"@%(\w+)")
+
+
+def live_ranges(lines: Sequence[str]) -> Dict[str, range]:
+    """Map each temporary to the range of the lines it is live over."""
+    first: Dict[str, int] = {}
+    last: Dict[str, int] = {}
+    for n, line in enumerate(lines):
+        for name in TEMPORARY.findall(line):
+            first.setdefault(name, n)
+            last[name] = n
+    return {name: range(first[name], last[name] + 1) for name in first}
+
+
+def allocate(lines: Sequence[str]) -> Dict[str, str]:
+    """
+    Assign a register to each temporary of the lines, lowest first. Raises
+    ValueError if more temporaries are live at once than there are registers.
+    """
+    ranges = live_ranges(lines)
+    free = list(TEMP_REGISTERS)
+    live: List[str] = []
+    registers: Dict[str, str] = {}
+    for name in sorted(ranges, key=lambda name: ranges[name].start):
+        start = ranges[name].start
+        for dead in [other for other in live if ranges[other].stop <= start]:
+            live.remove(dead)
+            free.append(registers[dead])
+        if not free:
+            raise ValueError(
+                f"cannot allocate {name}: {', '.join(live)} hold every register"
+            )
+        free.sort(key=TEMP_REGISTERS.index)
+        registers[name] = free.pop(0)
+        live.append(name)
+    return registers
+
+
+def assign_registers(lines: Sequence[str]) -> List[str]:
+    """The lines with each temporary replaced by the register allocated to it."""
+    registers = allocate(lines)
+    return [TEMPORARY.sub(lambda m: "@" + registers[m.group(1)], line) for line in lines]
@@ -0,0 +1,58 @@
+"""Whole-program dead function elimination over the VM call graph."""
+
+from typing import Dict, Iterable, List, Set
+
+from vmtranslator import vm
+
+# the bootstrap code written by ASMCodeWriter.write_init calls this
+ENTRY_POINT = "Sys.init"
+
+
+def read_call_graph(program: vm.VMProgram) -> Dict[str, Set[str]]:
+    """Map every function defined in the program to the functions it calls."""
+    call_graph: Dict[str, Set[str]] = {}
+    for _, commands in program:
+        callees: Set[str] = set()
+        for command in commands:
+            if command.cmd_type == vm.VMCommandTypes.C_FUNCTION:
+                callees = call_graph.setdefault(command.arg1, set())
+            elif command.cmd_type == vm.VMCommandTypes.C_CALL:
+                callees.add(command.arg1)
+    return call_graph
+
+
+def reachable_functions(
+    call_graph: Dict[str, Set[str]], roots: Iterable[str] = (ENTRY_POINT,)
+) -> Set[str]:
+    """
+    Return the functions reachable from the roots over call edges.
+
+    The VM has no function pointers, so every function that can ever run
+    is found this way. Calls to functions that are not defined are ignored.
+    """
+    roots = list(roots)
+    for root in roots:
+        if root not in call_graph:
+            raise ValueError(f"cannot tree-shake: {root} is not defined")
+    reachable: Set[str] = set()
+    pending: List[str] = roots
+    while pending:
+        function_name = pending.pop()
+        if function_name in reachable or function_name not in call_graph:
+            continue
+        reachable.add(function_name)
+        pending.extend(call_graph[function_name])
+    return reachable
+
+
+def format_savings(savings: Dict[str, int]) -> str:
+    """
+    Format the ROM words saved per dropped function as a table, largest
+    first. Hack instructions are 16 bits wide, so each word is 2 bytes.
+    """
+    lines = [f"{'dropped function':<40} {'words':>7} {'bytes':>7}"]
+    for function_name, words in sorted(savings.items(), key=lambda item: (-item[1], item[0])):
+        lines.append(f"{function_name:<40} {words:>7} {2 * words:>7}")
+    total = sum(savings.values())
+    lines.append(f"{f'total ({len(savings)} functions)':<40} {total:>7} {2 * total:>7}")
+    return "\n".join(lines)
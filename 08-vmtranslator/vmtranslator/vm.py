@@ -1,3 +1,4 @@
+from typing import List, NamedTuple, Optional, Tuple
 import enum
 
 
@@ -35,3 +36,39 @@ class VMCommandTypes(enum.Enum):
     @classmethod
     def is_pop(cls, cmd: "VMCommandTypes") -> bool:
         return cmd == VMCommandTypes.C_POP
+
+
+class VMCommand(NamedTuple):
+    """
+    A parsed VM command. file_name is only set on commands moved out of
+    their own file (e.g. by inlining), to keep their statics pointing at it.
+    """
+
+    cmd_type: VMCommandTypes
+    arg1: Optional[str] = None
+    arg2: Optional[int] = None
+    file_name: Optional[str] = None
+
+
+# the commands of every file in a program, keyed by file path, in file order
+VMProgram = List[Tuple[str, List[VMCommand]]]
+
+
+def format_command(command: VMCommand) -> str:
+    """Format a command as a line of VM code."""
+    if command.cmd_type == VMCommandTypes.C_RETURN:
+        return "return"
+    if command.cmd_type == VMCommandTypes.C_ARITHMETIC:
+        return command.arg1
+    name = {
+        VMCommandTypes.C_PUSH: "push",
+        VMCommandTypes.C_POP: "pop",
+        VMCommandTypes.C_LABEL: "label",
+        VMCommandTypes.C_GOTO: "goto",
+        VMCommandTypes.C_IF: "if-goto",
+        VMCommandTypes.C_FUNCTION: "function",
+        VMCommandTypes.C_CALL: "call",
+    }[command.cmd_type]
+    if command.arg2 is None:
+        return f"{name} {command.arg1}"
+    return f"{name} {command.arg1} {command.arg2}"
@@ -1,6 +1,6 @@
 """Defines the Parser class to parse VM code."""
 
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from vmtranslator import vm
 
@@ -16,43 +16,61 @@ CMD_TO_TYPE_MAP = {
     **{m.value: vm.VMCommandTypes.C_ARITHMETIC for m in vm.ArithmeticCommands},
 }
 
+ONE_ARG_TYPES = {
+    vm.VMCommandTypes.C_ARITHMETIC,
+    vm.VMCommandTypes.C_LABEL,
+    vm.VMCommandTypes.C_GOTO,
+    vm.VMCommandTypes.C_IF,
+}
+
+# words after the command name; an arithmetic command is its own arg1
+N_ARGUMENTS = {
+    vm.VMCommandTypes.C_ARITHMETIC: 0,
+    vm.VMCommandTypes.C_RETURN: 0,
+    vm.VMCommandTypes.C_LABEL: 1,
+    vm.VMCommandTypes.C_GOTO: 1,
+    vm.VMCommandTypes.C_IF: 1,
+    vm.VMCommandTypes.C_PUSH: 2,
+    vm.VMCommandTypes.C_POP: 2,
+    vm.VMCommandTypes.C_FUNCTION: 2,
+    vm.VMCommandTypes.C_CALL: 2,
+}
+
 
 class VMParser:
     """
-    Parses VM code.
+    Parses VM code, one command at a time. Lines are read lazily and each
+    is decoded once, by decode_command, when advance() reaches it.
     """
 
     def __init__(self, input_file_path: str) -> None:
         self.input_file_path = input_file_path
-        self.file_lines = self._read_file_lines()
-        self._line_pointer: Optional[int] = None
+        self._lines = iter_lines(input_file_path)
+        self._next_line = next(self._lines, None)
         self._current_line: Optional[str] = None
+        self._command: Optional[vm.VMCommand] = None
 
     def has_more_lines(self) -> bool:
         """Are there more lines in the input?"""
-        if self._line_pointer is None:
-            lp = -1
-        else:
-            lp = self._line_pointer
-        return bool(self.file_lines[lp + 1 :])
+        return self._next_line is not None
 
     def advance(self) -> None:
         """
         Reads the next command from the current input and
         makes it the current command.
         """
-        if self._line_pointer is None:
-            self._line_pointer = -1
-        self._line_pointer += 1
-        self._current_line = self.file_lines[self._line_pointer]
+        if self._next_line is None:
+            raise IndexError(f"no more commands in {self.input_file_path}")
+        number, self._current_line = self._next_line
+        self._command = _decode_line(self.input_file_path, number, self._current_line)
+        self._next_line = next(self._lines, None)
 
     def command_type(self) -> vm.VMCommandTypes:
         """
         Returns a constant representing the type of the
         current command.
         """
-        line_cmd, *_ = self._current_line.split()
-        return CMD_TO_TYPE_MAP[line_cmd]
+        return self._command.cmd_type
 
     def arg1(self) -> str:
         """
@@ -60,21 +78,70 @@ class VMParser:
 
         In the case of C_ARITHMETIC, return the command itself.
         """
-        if self.command_type() == vm.VMCommandTypes.C_ARITHMETIC:
-            return self._current_line
-        _, arg1, *_ = self._current_line.split()
-        return arg1
+        return self._command.arg1
 
     def arg2(self) -> int:
         """
         Returns the second argument of the current command.
         """
-        _, _, arg2 = self._current_line.split()
-        return int(arg2)
-
-    def _read_file_lines(self) -> List[str]:
-        with open(self.input_file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        lines = [l.strip("\n") for l in lines if not l.startswith("//")]
-        lines = [l.split("//")[0].strip() for l in lines]
-        return [l for l in lines if l]
+        return self._command.arg2
+
+    def command(self) -> vm.VMCommand:
+        """
+        Returns the current command together with the arguments
+        its type takes.
+        """
+        return self._command
+
+
+def iter_lines(input_file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield the line number and code of each line of a VM file that holds a command."""
+    with open(input_file_path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            code = line.split("//", 1)[0].strip()
+            if code:
+                yield number, code
+
+
+def decode_command(line: str) -> vm.VMCommand:
+    """Decode a line of VM code, without comments, into a command."""
+    name, *args = line.split()
+    cmd_type = CMD_TO_TYPE_MAP.get(name)
+    if cmd_type is None:
+        raise ValueError(f"unknown VM command {name!r}")
+    if len(args) != N_ARGUMENTS[cmd_type]:
+        raise ValueError(f"{name} takes {N_ARGUMENTS[cmd_type]} argument(s), got {line!r}")
+    if cmd_type == vm.VMCommandTypes.C_RETURN:
+        return vm.VMCommand(cmd_type)
+    if cmd_type == vm.VMCommandTypes.C_ARITHMETIC:
+        return vm.VMCommand(cmd_type, name)
+    if cmd_type in ONE_ARG_TYPES:
+        return vm.VMCommand(cmd_type, args[0])
+    if not args[1].isdigit():
+        raise ValueError(f"{name} takes a non-negative integer, got {line!r}")
+    return vm.VMCommand(cmd_type, args[0], int(args[1]))
+
+
+def iter_commands(input_file_path: str) -> Iterator[vm.VMCommand]:
+    """
+    Yield the commands of a VM file as it is read. Commands are immutable,
+    so a line that repeats is decoded once and its command shared.
+    """
+    decoded: Dict[str, vm.VMCommand] = {}
+    for number, line in iter_lines(input_file_path):
+        command = decoded.get(line)
+        if command is None:
+            command = decoded[line] = _decode_line(input_file_path, number, line)
+        yield command
+
+
+def parse_commands(input_file_path: str) -> List[vm.VMCommand]:
+    """Parse every command of a VM file."""
+    return list(iter_commands(input_file_path))
+
+
+def _decode_line(input_file_path: str, number: int, line: str) -> vm.VMCommand:
+    try:
+        return decode_command(line)
+    except ValueError as e:
+        raise ValueError(f"{input_file_path}:{number}: {e}") from None
@@ -0,0 +1,119 @@
+"""
+Counts the Hack cycles a program exercising the OS routines takes when the
+OS is compiled with and without loop-invariant code motion and common
+subexpression elimination, in total and for the OS functions that change.
+Every build must compute the known sum and rectangle and leave the same
+screen and heap. Needs the vmtranslator package.
+
+  $ poetry run python -m benchmarks.bench_code_motion
+"""
+
+from typing import Dict, FrozenSet
+import contextlib
+import io
+import math
+import os
+import shutil
+import tempfile
+
+from jack_compiler import pipeline
+from jack_compiler.compilation import optimization
+from benchmarks import hack_emulator
+
+OS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "12-operating-system", "jack_os")
+MAX_CYCLES = 200_000_000
+SCREEN = slice(16384, 24576)
+HEAP = slice(2048, 16384)
+
+Optimization = optimization.Optimization
+BUILDS = {
+  "fold": frozenset({Optimization.CONSTANT_FOLDING}),
+  "fold,licm,cse": frozenset({Optimization.CONSTANT_FOLDING, Optimization.LOOP_INVARIANTS,
+                              Optimization.COMMON_SUBEXPRESSIONS}),
+}
+
+MAIN = """
+class Main {
+  static int sum;
+
+  function void main() {
+    var int i;
+    let i = 0;
+    while (i < 10) {
+      let sum = sum + Math.sqrt(i * 3000);
+      let i = i + 1;
+    }
+    do Screen.drawLine(10, 5, 90, 40);
+    do Screen.drawLine(5, 60, 40, 10);
+    do Screen.drawCircle(256, 128, 8);
+    do Screen.drawRectangle(20, 200, 30, 205);
+    return;
+  }
+}
+"""
+# what every build must leave behind, so that a broken OS cannot pass as fast
+EXPECTED_SUM = sum(math.isqrt(i * 3000) for i in range(10))
+# the OS draws horizontal lines from one pixel right of x1, so the rectangle
+# covers columns 21-31 of rows 200-205: bits 5-15 of each row's second word
+RECTANGLE = {16384 + row * 32 + 1: 0b1111111111100000 - (1 << 16) for row in range(200, 206)}
+
+
+def write_program(src_dir: str) -> None:
+  for name in os.listdir(OS_DIR):
+    if name.endswith(".jack"):
+      shutil.copy(os.path.join(OS_DIR, name), src_dir)
+  # the OS initializes Math, which allocates, before Memory, which would
+  # then hand out Math's table again
+  sys_path = os.path.join(src_dir, "Sys.jack")
+  with open(sys_path) as f:
+    sys_jack = f.read()
+  init_order = "do Math.init(); \n        do Memory.init();"
+  assert init_order in sys_jack, "Sys.init no longer initializes Math before Memory"
+  with open(sys_path, "w") as f:
+    f.write(sys_jack.replace(init_order, "do Memory.init();\n        do Math.init();", 1))
+  with open(os.path.join(src_dir, "Main.jack"), "w") as f:
+    f.write(MAIN)
+
+
+def run_build(src_dir: str, optimizations: FrozenSet[Optimization]) -> hack_emulator.Result:
+  with contextlib.redirect_stdout(io.StringIO()):
+    asm_path = pipeline.compile_to_hack(src_dir, optimizations=optimizations)
+  with open(asm_path) as f:
+    program = hack_emulator.Program(f)
+  result = hack_emulator.run(program, MAX_CYCLES, profile=True)
+  check_result(program, result)
+  result.functions = result.profile(program)
+  return result
+
+
+def check_result(program: hack_emulator.Program, result: hack_emulator.Result) -> None:
+  assert result.halted, f"the program did not halt within {MAX_CYCLES} cycles"
+  total = result.ram[program.variables["Main.0"]]
+  assert total == EXPECTED_SUM, f"the program summed {total}, not {EXPECTED_SUM}"
+  for address, word in RECTANGLE.items():
+    assert result.ram[address] == word, f"RAM[{address}] is {result.ram[address]}, not the rectangle's {word}"
+
+
+def main() -> None:
+  if pipeline.vm_translator is None:
+    raise SystemExit("the vmtranslator package is not installed")
+  results: Dict[str, hack_emulator.Result] = {}
+  with tempfile.TemporaryDirectory() as src_dir:
+    write_program(src_dir)
+    for name, optimizations in BUILDS.items():
+      results[name] = run_build(src_dir, optimizations)
+  base, optimized = results.values()
+  assert base.ram[SCREEN] == optimized.ram[SCREEN], "the builds drew different screens"
+  assert base.ram[HEAP] == optimized.ram[HEAP], "the builds left different heaps"
+  names = list(BUILDS)
+  print(f"{'function':<22} {names[0]:>12} {names[1]:>14} {'saved':>7}")
+  changed = [function for function in base.functions
+             if base.functions[function] != optimized.functions.get(function, 0)]
+  for function in sorted(changed, key=lambda f: optimized.functions.get(f, 0) - base.functions[f]):
+    before, after = base.functions[function], optimized.functions.get(function, 0)
+    print(f"{function:<22} {before:>12,} {after:>14,} {1 - after / before:>7.1%}")
+  print(f"{'total':<22} {base.cycles:>12,} {optimized.cycles:>14,} {1 - optimized.cycles / base.cycles:>7.1%}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+"""
+Compares the ROM size and the Hack cycles of a program exercising the OS
+routines when the VM translator inlines the code of every call, return and
+comparison and when it jumps to the shared routines of its compact runtime,
+with and without tree shaking. Every build must leave the known result of
+bench_code_motion and the same screen and heap. Needs the vmtranslator
+package.
+
+  $ poetry run python -m benchmarks.bench_compact_runtime
+"""
+
+from typing import Dict
+import contextlib
+import io
+import tempfile
+
+from jack_compiler import pipeline
+from jack_compiler.compilation import optimization
+from benchmarks import bench_code_motion, hack_emulator
+
+ROM_SIZE = 32768
+
+BUILDS = {
+  "inline": {},
+  "compact": {"compact_runtime": True},
+  "inline, shaken": {"tree_shake": True},
+  "compact, shaken": {"compact_runtime": True, "tree_shake": True},
+}
+
+
+def run_build(src_dir: str, options: Dict[str, bool]) -> hack_emulator.Result:
+  with contextlib.redirect_stdout(io.StringIO()):
+    asm_path = pipeline.compile_to_hack(src_dir, optimizations=optimization.ALL_OPTIMIZATIONS, **options)
+  with open(asm_path) as f:
+    program = hack_emulator.Program(f)
+  result = hack_emulator.run(program, bench_code_motion.MAX_CYCLES)
+  bench_code_motion.check_result(program, result)
+  result.rom = len(program.instructions)
+  return result
+
+
+def main() -> None:
+  if pipeline.vm_translator is None:
+    raise SystemExit("the vmtranslator package is not installed")
+  results: Dict[str, hack_emulator.Result] = {}
+  with tempfile.TemporaryDirectory() as src_dir:
+    bench_code_motion.write_program(src_dir)
+    for name, options in BUILDS.items():
+      results[name] = run_build(src_dir, options)
+  first = results["inline"]
+  for name, result in results.items():
+    assert result.ram[bench_code_motion.SCREEN] == first.ram[bench_code_motion.SCREEN], f"{name} drew another screen"
+    assert result.ram[bench_code_motion.HEAP] == first.ram[bench_code_motion.HEAP], f"{name} left another heap"
+  print(f"{'build':<16} {'ROM words':>10} {'fits':>5} {'ROM saved':>10} {'cycles':>11} {'cycles added':>13}")
+  for name, result in results.items():
+    base = results[name.replace("compact", "inline")]
+    fits = "yes" if result.rom <= ROM_SIZE else "no"
+    print(f"{name:<16} {result.rom:>10,} {fits:>5} {1 - result.rom / base.rom:>10.1%} {result.cycles:>11,}"
+          f" {result.cycles / base.cycles - 1:>13.1%}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,43 @@
+"""
+Times a full incremental build of a generated project, a no-op rebuild and
+a rebuild after editing one class.
+
+  $ poetry run python -m benchmarks.bench_incremental
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from jack_compiler import jack_analyzer
+from jack_compiler.compilation import vm_compilation
+from benchmarks import jack_sources
+
+N_CLASSES = 500
+N_SUBROUTINES = 5
+
+
+def bench_build(src_dir: str) -> float:
+  """Seconds for one incremental build of src_dir."""
+  analyzer = jack_analyzer.JackAnalyzer(src_dir, vm_compilation.VMCompilationEngine, incremental=True)
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    analyzer.analyze()
+  return time.perf_counter() - start
+
+
+def main() -> None:
+  print(f"{N_CLASSES} classes of {N_SUBROUTINES} subroutines")
+  with tempfile.TemporaryDirectory() as src_dir:
+    jack_sources.write_project(src_dir, N_CLASSES, N_SUBROUTINES)
+    print(f"{'full build':<24} {bench_build(src_dir) * 1e3:>9.1f} ms")
+    print(f"{'no-op rebuild':<24} {bench_build(src_dir) * 1e3:>9.1f} ms")
+    jack_sources.write_class(src_dir, "Class0", N_SUBROUTINES + 1)
+    print(f"{'one class changed':<24} {bench_build(src_dir) * 1e3:>9.1f} ms")
+    assert os.path.exists(os.path.join(src_dir, "Class0.vm"))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,48 @@
+"""
+Shows that the LL(2) lookahead used to parse terms costs the same no matter
+how large the source file is.
+
+  $ poetry run python -m benchmarks.bench_lookahead
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import timeit
+
+from jack_compiler import jack_tokenizer
+from jack_compiler.compilation import vm_compilation
+from benchmarks import jack_sources
+
+SIZES = (10, 100, 1000)
+PEEKS = 100_000
+
+
+def bench_peek(table) -> float:
+  """Seconds per peek() from the middle of the table."""
+  tokenizer = jack_tokenizer.JackTokenizer("<bench>", table)
+  tokenizer.seek(len(table) // 2)
+  return timeit.timeit(tokenizer.peek, number=PEEKS) / PEEKS
+
+
+def bench_compile(path: str) -> float:
+  """Seconds to compile the class at path to VM code."""
+  with tempfile.TemporaryDirectory() as out_dir, contextlib.redirect_stdout(io.StringIO()):
+    engine = vm_compilation.VMCompilationEngine(path, os.path.join(out_dir, "out.vm"))
+    return timeit.timeit(engine.compile_class, number=1)
+
+
+def main() -> None:
+  print(f"{'subroutines':>12} {'tokens':>9} {'ns/peek':>9} {'us/token compile':>17}")
+  with tempfile.TemporaryDirectory() as src_dir:
+    for size in SIZES:
+      path = jack_sources.write_class(src_dir, f"Bench{size}", size)
+      table = jack_tokenizer.tokenize_file(path)
+      peek = bench_peek(table)
+      compile_ = bench_compile(path)
+      print(f"{size:>12} {len(table):>9} {peek * 1e9:>9.0f} {compile_ / len(table) * 1e6:>17.2f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+"""
+Compares compiling a generated project of many classes serially against
+spreading the classes over a process pool with JackAnalyzer(jobs=N).
+
+  $ poetry run python -m benchmarks.bench_parallel
+"""
+
+from typing import Dict
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from jack_compiler import jack_analyzer
+from jack_compiler.compilation import vm_compilation
+from benchmarks import jack_sources
+
+N_CLASSES = 120
+N_SUBROUTINES = 20
+
+
+def bench_analyze(src_dir: str, jobs: int) -> float:
+  """Seconds to compile every class of src_dir to VM code."""
+  analyzer = jack_analyzer.JackAnalyzer(src_dir, vm_compilation.VMCompilationEngine, jobs=jobs)
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    analyzer.analyze()
+  return time.perf_counter() - start
+
+
+def read_outputs(src_dir: str) -> Dict[str, str]:
+  """The generated VM code of src_dir by file name."""
+  outputs = {}
+  for name in sorted(os.listdir(src_dir)):
+    if name.endswith(".vm"):
+      with open(os.path.join(src_dir, name)) as f:
+        outputs[name] = f.read()
+  return outputs
+
+
+def main() -> None:
+  cpus = os.cpu_count() or 1
+  job_counts = sorted({1, 2, 4, cpus})
+  print(f"{N_CLASSES} classes of {N_SUBROUTINES} subroutines, {cpus} CPUs")
+  print(f"{'jobs':>5} {'seconds':>9} {'speedup':>8}")
+  with tempfile.TemporaryDirectory() as src_dir:
+    jack_sources.write_project(src_dir, N_CLASSES, N_SUBROUTINES)
+    serial = bench_analyze(src_dir, 1)
+    expected = read_outputs(src_dir)
+    print(f"{1:>5} {serial:>9.2f} {1:>8.2f}")
+    for jobs in job_counts[1:]:
+      seconds = bench_analyze(src_dir, jobs)
+      assert read_outputs(src_dir) == expected, "parallel output differs from serial"
+      print(f"{jobs:>5} {seconds:>9.2f} {serial / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+  main()
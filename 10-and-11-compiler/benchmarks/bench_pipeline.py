@@ -0,0 +1,61 @@
+"""
+Compares building Hack assembly for a generated project in two steps
+(Jack to .vm files, then the VM translator re-reads them) against the
+in-process pipeline, which hands structured VM commands straight over.
+Needs the vmtranslator package.
+
+  $ poetry run python -m benchmarks.bench_pipeline
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from jack_compiler import jack_analyzer, pipeline
+from jack_compiler.compilation import vm_compilation
+from benchmarks import jack_sources
+
+N_CLASSES = 50
+N_SUBROUTINES = 20
+REPEAT = 3
+
+
+def two_steps(src_dir: str, output_path: str) -> None:
+  jack_analyzer.JackAnalyzer(src_dir, vm_compilation.VMCompilationEngine).analyze()
+  pipeline.vm_translator.translate_to_hack(src_dir, output_path)
+
+
+def in_process(src_dir: str, output_path: str) -> None:
+  pipeline.compile_to_hack(src_dir, output_path)
+
+
+def bench(build, src_dir: str, output_path: str) -> float:
+  """Best seconds for a build of src_dir into output_path."""
+  best = float('inf')
+  for _ in range(REPEAT):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+      build(src_dir, output_path)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main() -> None:
+  if pipeline.vm_translator is None:
+    raise SystemExit("the vmtranslator package is not installed")
+  print(f"{N_CLASSES} classes of {N_SUBROUTINES} subroutines")
+  with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as out_dir:
+    jack_sources.write_project(src_dir, N_CLASSES, N_SUBROUTINES)
+    two_steps_path, in_process_path = os.path.join(out_dir, "two.asm"), os.path.join(out_dir, "one.asm")
+    serialized = bench(two_steps, src_dir, two_steps_path)
+    direct = bench(in_process, src_dir, in_process_path)
+    with open(two_steps_path) as a, open(in_process_path) as b:
+      assert a.read() == b.read(), "the pipeline wrote different assembly"
+    print(f"{'jack -> .vm -> asm':<22} {serialized:>7.2f} s")
+    print(f"{'in-process pipeline':<22} {direct:>7.2f} s  ({serialized / direct:.2f}x)")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,42 @@
+"""
+Compares peak Python heap use of lexing a large class up front into a
+TokenTable against streaming it from a memory map.
+
+  $ poetry run python -m benchmarks.bench_tokenizer_memory
+"""
+
+import tempfile
+import tracemalloc
+
+from jack_compiler import jack_tokenizer
+from benchmarks import jack_sources
+
+SIZES = (100, 1000, 5000)
+
+
+def peak_bytes(make_tokenizer) -> int:
+  """Peak traced allocation while walking every token of a tokenizer."""
+  tracemalloc.start()
+  tokenizer = make_tokenizer()
+  while tokenizer.has_more_tokens():
+    tokenizer.advance()
+    tokenizer.peek()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return peak
+
+
+def main() -> None:
+  print(f"{'subroutines':>12} {'source KiB':>11} {'table KiB':>10} {'stream KiB':>11}")
+  with tempfile.TemporaryDirectory() as src_dir:
+    for size in SIZES:
+      path = jack_sources.write_class(src_dir, f"Bench{size}", size)
+      with open(path, 'rb') as f:
+        source_size = len(f.read())
+      table = peak_bytes(lambda: jack_tokenizer.JackTokenizer(path))
+      stream = peak_bytes(lambda: jack_tokenizer.StreamingJackTokenizer(path))
+      print(f"{size:>12} {source_size / 1024:>11.0f} {table / 1024:>10.0f} {stream / 1024:>11.0f}")
+
+
+if __name__ == "__main__":
+  main()
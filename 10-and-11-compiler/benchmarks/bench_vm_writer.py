@@ -0,0 +1,70 @@
+"""
+Compares the VM output writers on a large generated class: the old writer
+that reopened the file for every command, the buffered FileWriter and the
+in-memory MemoryWriter. The class is parsed once so only code generation
+and output are timed.
+
+  $ poetry run python -m benchmarks.bench_vm_writer
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import timeit
+
+from jack_compiler import jack_parser, jack_tokenizer
+from jack_compiler.compilation import vm_compilation, vm_writing
+from benchmarks import jack_sources
+
+N_SUBROUTINES = 1000
+REPEAT = 3
+
+
+class AppendingFileWriter(vm_writing.OutputWriter):
+  """The writer FileWriter replaced: one open, write and close per command."""
+  def __init__(self, output_path: str) -> None:
+    self.output_path = output_path
+    if os.path.exists(self.output_path):
+      os.remove(self.output_path)
+
+  def write(self, cmd: str) -> None:
+    with open(self.output_path, 'a') as f:
+      f.write(cmd)
+      f.write("\n")
+
+  def close(self) -> None:
+    ...
+
+
+def bench_compile(path: str, tree, make_writer) -> float:
+  """Best seconds to compile the parsed class into the writer make_writer returns."""
+  def compile_() -> None:
+    engine = vm_compilation.VMCompilationEngine(path, path.replace(".jack", ".vm"), tree=tree,
+                                                output_writer=make_writer())
+    with contextlib.redirect_stdout(io.StringIO()):
+      engine.compile_class()
+  return min(timeit.repeat(compile_, number=1, repeat=REPEAT))
+
+
+def main() -> None:
+  with tempfile.TemporaryDirectory() as src_dir:
+    path = jack_sources.write_class(src_dir, "Bench", N_SUBROUTINES)
+    output_path = path.replace(".jack", ".vm")
+    tree = jack_parser.JackParser(jack_tokenizer.JackTokenizer(path)).parse_class()
+    memory = vm_writing.MemoryWriter()
+    with contextlib.redirect_stdout(io.StringIO()):
+      vm_compilation.VMCompilationEngine(path, output_path, tree=tree, output_writer=memory).compile_class()
+    print(f"{N_SUBROUTINES} subroutines, {len(memory.commands)} VM commands")
+    print(f"{'writer':<22} {'ms':>8} {'us/command':>11}")
+    for name, make_writer in (
+        ("append per command", lambda: AppendingFileWriter(output_path)),
+        ("buffered file", lambda: vm_writing.FileWriter(output_path)),
+        ("memory", vm_writing.MemoryWriter),
+    ):
+      seconds = bench_compile(path, tree, make_writer)
+      print(f"{name:<22} {seconds * 1e3:>8.1f} {seconds / len(memory.commands) * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+  main()
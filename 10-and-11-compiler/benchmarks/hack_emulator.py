@@ -0,0 +1,133 @@
+"""
+A small Hack assembler and CPU emulator for the benchmarks that count the
+cycles of compiled programs. Each instruction is one cycle.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import collections
+import re
+
+Compute = Callable[[int, int, int], int]
+
+COMPUTATIONS: Dict[str, Compute] = {
+  '0': lambda a, d, m: 0, '1': lambda a, d, m: 1, '-1': lambda a, d, m: -1,
+  'D': lambda a, d, m: d, 'A': lambda a, d, m: a, 'M': lambda a, d, m: m,
+  '!D': lambda a, d, m: ~d, '!A': lambda a, d, m: ~a, '!M': lambda a, d, m: ~m,
+  '-D': lambda a, d, m: -d, '-A': lambda a, d, m: -a, '-M': lambda a, d, m: -m,
+  'D+1': lambda a, d, m: d + 1, 'A+1': lambda a, d, m: a + 1, 'M+1': lambda a, d, m: m + 1,
+  'D-1': lambda a, d, m: d - 1, 'A-1': lambda a, d, m: a - 1, 'M-1': lambda a, d, m: m - 1,
+  'D+A': lambda a, d, m: d + a, 'D+M': lambda a, d, m: d + m,
+  'D-A': lambda a, d, m: d - a, 'D-M': lambda a, d, m: d - m,
+  'A-D': lambda a, d, m: a - d, 'M-D': lambda a, d, m: m - d,
+  'D&A': lambda a, d, m: d & a, 'D&M': lambda a, d, m: d & m,
+  'D|A': lambda a, d, m: d | a, 'D|M': lambda a, d, m: d | m,
+}
+# the assembler accepts either order for the commutative operations
+for _computation in list(COMPUTATIONS):
+  if _computation[1:2] in '+&|' and len(_computation) == 3:
+    COMPUTATIONS[_computation[::-1]] = COMPUTATIONS[_computation]
+
+JUMPS: Dict[str, Callable[[int], bool]] = {
+  '': lambda v: False, 'JGT': lambda v: v > 0, 'JEQ': lambda v: v == 0, 'JGE': lambda v: v >= 0,
+  'JLT': lambda v: v < 0, 'JNE': lambda v: v != 0, 'JLE': lambda v: v <= 0, 'JMP': lambda v: True,
+}
+
+PREDEFINED = dict({f'R{i}': i for i in range(16)}, SP=0, LCL=1, ARG=2, THIS=3, THAT=4, SCREEN=16384, KBD=24576)
+FIRST_VARIABLE = 16
+RAM_SIZE = 32768
+# the labels the VM translator gives functions, as opposed to return addresses and branches
+FUNCTION_LABEL = re.compile(r'^[A-Za-z_]\w*\.[A-Za-z_]\w*$')
+
+# ('A', value, ...) or ('C', computation, dest, jump, reads memory)
+Instruction = Tuple
+
+
+class Program:
+  """Assembled Hack code with the ROM addresses of its labels and the RAM addresses of its variables."""
+
+  def __init__(self, lines: Iterable[str]):
+    self.labels: Dict[str, int] = {}
+    code: List[str] = []
+    for line in lines:
+      line = line.split('//')[0].strip()
+      if line.startswith('('):
+        self.labels[line[1:-1]] = len(code)
+      elif line:
+        code.append(line)
+    self.variables: Dict[str, int] = dict(PREDEFINED)
+    self.instructions: List[Instruction] = [self._assemble(line, self.variables) for line in code]
+
+  def _assemble(self, line: str, variables: Dict[str, int]) -> Instruction:
+    if line.startswith('@'):
+      symbol = line[1:]
+      if symbol.isdigit():
+        return ('A', int(symbol))
+      if symbol in self.labels:
+        return ('A', self.labels[symbol])
+      return ('A', variables.setdefault(symbol, FIRST_VARIABLE + len(variables) - len(PREDEFINED)))
+    dest, _, rest = line.rpartition('=')
+    computation, _, jump = rest.partition(';')
+    return ('C', COMPUTATIONS[computation], dest, JUMPS[jump], 'M' in computation)
+
+  def function_starts(self) -> List[Tuple[int, str]]:
+    """(address, name) of every function, in ROM order."""
+    return sorted((address, name) for name, address in self.labels.items() if FUNCTION_LABEL.match(name))
+
+
+class Result:
+  """What a run left behind."""
+
+  def __init__(self, cycles: int, ram: List[int], halted: bool, hits: Optional[List[int]]):
+    self.cycles = cycles
+    self.ram = ram
+    self.halted = halted
+    self.hits = hits
+
+  def profile(self, program: Program) -> Dict[str, int]:
+    """Cycles spent in each function, counting its own code only."""
+    cycles: Dict[str, int] = collections.Counter()
+    if self.hits is None:
+      return cycles
+    starts = program.function_starts() + [(len(program.instructions), '')]
+    for (start, name), (end, _) in zip(starts, starts[1:]):
+      cycles[name] = sum(self.hits[start:end])
+    return cycles
+
+
+def run(program: Program, max_cycles: int, halt_label: str = 'Sys.halt', profile: bool = False) -> Result:
+  """
+  Run the program from address 0 until it reaches halt_label, spins in an
+  empty loop or runs out of cycles.
+  """
+  instructions = program.instructions
+  halt = program.labels.get(halt_label, -1)
+  hits = [0] * len(instructions) if profile else None
+  ram = [0] * RAM_SIZE
+  a = d = pc = cycles = 0
+  while cycles < max_cycles and 0 <= pc < len(instructions):
+    if pc == halt:
+      return Result(cycles, ram, True, hits)
+    if hits is not None:
+      hits[pc] += 1
+    cycles += 1
+    instruction = instructions[pc]
+    if instruction[0] == 'A':
+      a = instruction[1]
+      pc += 1
+      continue
+    _, compute, dest, jump, reads_memory = instruction
+    value = compute(a, d, ram[a & 0x7FFF] if reads_memory else 0)
+    value = ((value + 0x8000) & 0xFFFF) - 0x8000
+    if 'M' in dest:
+      ram[a & 0x7FFF] = value
+    if 'D' in dest:
+      d = value
+    if jump(value):
+      if a == pc - 1 and instructions[a][0] == 'A':
+        return Result(cycles, ram, True, hits)
+      pc = a & 0xFFFF
+    else:
+      pc += 1
+    if 'A' in dest:
+      a = value
+  return Result(cycles, ram, False, hits)
@@ -0,0 +1,40 @@
+"""Generates synthetic Jack sources of a given size for the benchmarks."""
+
+from typing import List
+import os
+
+SUBROUTINE_TEMPLATE = """
+  function int compute{i}(int a, int b) {{
+    var int x, y;
+    var Array arr;
+    let arr = Array.new(8);
+    let x = (a + b) * 2 - (a / 4);
+    let y = Math.max(x, b) + arr[a & 7];
+    while (x > 0) {{
+      if ((x & 1) = 1) {{ let y = y + {i}; }} else {{ let y = y - 1; }}
+      let arr[x & 7] = y;
+      let x = x - 1;
+    }}
+    do Output.printString("compute{i}");
+    return y;
+  }}
+"""
+
+
+def make_class(name: str, n_subroutines: int) -> str:
+  """Return the source of a class with n_subroutines expression-heavy functions."""
+  body = "".join(SUBROUTINE_TEMPLATE.format(i=i) for i in range(n_subroutines))
+  return f"class {name} {{\n{body}}}\n"
+
+
+def write_class(dir_path: str, name: str, n_subroutines: int) -> str:
+  """Write a generated class to dir_path and return its path."""
+  path = os.path.join(dir_path, f"{name}.jack")
+  with open(path, 'w', encoding='utf-8') as f:
+    f.write(make_class(name, n_subroutines))
+  return path
+
+
+def write_project(dir_path: str, n_classes: int, n_subroutines: int) -> List[str]:
+  """Write a project of n_classes generated classes to dir_path."""
+  return [write_class(dir_path, f"Class{i}", n_subroutines) for i in range(n_classes)]
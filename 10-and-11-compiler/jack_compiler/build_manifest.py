@@ -0,0 +1,162 @@
+"""This module contains the BuildManifest, which lets incremental builds skip unchanged classes."""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import hashlib
+import json
+import os
+import tempfile
+
+from jack_compiler import jack_ast, jack_tokenizer
+
+# bump whenever the generated code changes, so old outputs are rebuilt
+COMPILER_VERSION = "1"
+MANIFEST_NAME = ".jack_build.json"
+_FORMAT_VERSION = 1
+
+
+class FileState(NamedTuple):
+  """What a file looked like when it was last built: its stat fields and content hash."""
+  size: int
+  mtime_ns: int
+  digest: str
+
+
+def file_state(path: str, previous: Optional[FileState] = None) -> Optional[FileState]:
+  """
+  Return the state of the file, or None if it does not exist. When size and
+  mtime match the previous state the file is not read again, so checking an
+  unchanged project costs one stat per file.
+  """
+  try:
+    stat = os.stat(path)
+  except FileNotFoundError:
+    return None
+  if previous is not None and (previous.size, previous.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+    return previous
+  with open(path, 'rb') as f:
+    digest = hashlib.sha256(f.read()).hexdigest()
+  return FileState(stat.st_size, stat.st_mtime_ns, digest)
+
+
+def referenced_classes(tree: jack_ast.Class) -> Set[str]:
+  """Names of the other classes a class uses as a type or calls a subroutine of."""
+  types = [class_var_dec.type_ for class_var_dec in tree.class_var_decs]
+  class_names = {name for class_var_dec in tree.class_var_decs for name in class_var_dec.names}
+  references = set()
+  for subroutine_dec in tree.subroutine_decs:
+    types.append(subroutine_dec.return_type)
+    types.extend(parameter.type_ for parameter in subroutine_dec.parameters)
+    types.extend(var_dec.type_ for var_dec in subroutine_dec.var_decs)
+    names = class_names | {parameter.name for parameter in subroutine_dec.parameters}
+    names.update(name for var_dec in subroutine_dec.var_decs for name in var_dec.names)
+    for node in jack_ast.walk(subroutine_dec):
+      # a receiver that is not a variable is a class: Math.max(a, b)
+      if isinstance(node, jack_ast.SubroutineCall) and node.receiver is not None and node.receiver not in names:
+        references.add(node.receiver)
+  references.update(type_ for type_ in types if not jack_ast.is_primitive_type(type_))
+  references.discard(tree.name)
+  return references
+
+
+class BuildManifest:
+  """
+  Records, for every class of a directory, the state of its source and output
+  and the classes it references, as of its last successful compile. A class
+  is rebuilt when its source or output changed since, or when the build key
+  (compiler version and options) changed. With whole-program optimizations
+  a change also rebuilds every class that depends on the changed one.
+  """
+  def __init__(self, path: str, build_key: str) -> None:
+    self.path = path
+    self.build_key = build_key
+    self.entries: Dict[str, Tuple[FileState, FileState, List[str]]] = {}
+    self._source_states: Dict[str, FileState] = {}
+
+  @classmethod
+  def load(cls, path: str, build_key: str) -> 'BuildManifest':
+    """Read the manifest at path; a missing, corrupt or differently built one is empty."""
+    manifest = cls(path, build_key)
+    try:
+      with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+      if data.get('format') != _FORMAT_VERSION or data.get('build_key') != build_key:
+        return manifest
+      for name, entry in data['files'].items():
+        manifest.entries[name] = (FileState(*entry['source']), FileState(*entry['output']), entry['references'])
+    except FileNotFoundError:
+      pass
+    except (ValueError, KeyError, TypeError):
+      manifest.entries.clear()
+    return manifest
+
+  def stale_sources(self, files: Iterable[Tuple[str, str]], whole_program: bool = False) -> List[str]:
+    """Return the sources of the (source, output) pairs that need compiling, in order."""
+    files = list(files)
+    changed: Set[str] = set()
+    for source_file, output_path in files:
+      name = os.path.basename(source_file)
+      entry = self.entries.get(name)
+      source = file_state(source_file, entry[0] if entry else None)
+      if source is not None:
+        self._source_states[source_file] = source
+      if entry is None or source is None or source.digest != entry[0].digest:
+        changed.add(name)
+        continue
+      output = file_state(output_path, entry[1])
+      if output is None or output.digest != entry[1].digest:
+        changed.add(name)
+    if whole_program:
+      changed |= self._dependents(changed | (set(self.entries) - {os.path.basename(s) for s, _ in files}))
+    return [source_file for source_file, _ in files if os.path.basename(source_file) in changed]
+
+  def _dependents(self, names: Set[str]) -> Set[str]:
+    """Every entry that references one of the named sources, directly or not."""
+    dependents: Dict[str, Set[str]] = {}
+    for name, (_, _, references) in self.entries.items():
+      for class_name in references:
+        dependents.setdefault(f"{class_name}.jack", set()).add(name)
+    found: Set[str] = set()
+    pending = list(names)
+    while pending:
+      for dependent in dependents.get(pending.pop(), ()):
+        if dependent not in found:
+          found.add(dependent)
+          pending.append(dependent)
+    return found
+
+  def record(self, source_file: str, output_path: str, references: Iterable[str]) -> None:
+    """Remember a successful compile of the source into the output."""
+    source = file_state(source_file, self._source_states.get(source_file))
+    output = file_state(output_path)
+    if source is None or output is None:
+      self.forget(source_file)
+      return
+    self.entries[os.path.basename(source_file)] = (source, output, sorted(references))
+
+  def forget(self, source_file: str) -> None:
+    """Drop the source, e.g. after a failed compile, so the next build retries it."""
+    self.entries.pop(os.path.basename(source_file), None)
+
+  def prune(self, source_files: Iterable[str]) -> None:
+    """Drop the entries of sources that no longer exist."""
+    names = {os.path.basename(source_file) for source_file in source_files}
+    for name in set(self.entries) - names:
+      del self.entries[name]
+
+  def save(self) -> None:
+    data = {
+      'format': _FORMAT_VERSION,
+      'build_key': self.build_key,
+      'files': {name: {'source': list(source), 'output': list(output), 'references': references}
+                for name, (source, output, references) in sorted(self.entries.items())},
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix=".tmp")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      json.dump(data, f, indent=1)
+    # atomic so an interrupted build never leaves half a manifest
+    os.replace(tmp_path, self.path)
+
+
+def build_key(*options: str) -> str:
+  """The key old outputs must match to be reused: compiler and tokenizer versions plus options."""
+  return ":".join((COMPILER_VERSION, jack_tokenizer.TOKENIZER_VERSION) + options)
@@ -0,0 +1,54 @@
+"""This module contains the ClassCache, a bounded in-memory cache of parsed classes."""
+
+from typing import Optional
+import collections
+import hashlib
+
+from jack_compiler import jack_ast, jack_parser, jack_tokenizer, token_cache
+
+DEFAULT_MAX_CLASSES = 256
+
+
+class ClassCache:
+  """
+  Keeps the AST of the most recently compiled sources, keyed by a hash of
+  the source bytes, so a long-running process never lexes or parses an
+  unchanged class twice. ASTs are never mutated by the compiler, so one
+  tree is shared by every build. At most max_classes trees are kept; the
+  least recently used are dropped first. Misses are lexed through the
+  on-disk token cache when one is given.
+  """
+  def __init__(self, max_classes: int = DEFAULT_MAX_CLASSES,
+               tokens: Optional[token_cache.TokenCache] = None) -> None:
+    self.max_classes = max_classes
+    self.tokens = tokens
+    self.hits = 0
+    self.misses = 0
+    self._trees: 'collections.OrderedDict[bytes, jack_ast.Class]' = collections.OrderedDict()
+
+  def __len__(self) -> int:
+    return len(self._trees)
+
+  def parse_file(self, file_path: str) -> jack_ast.Class:
+    """Return the AST of the file, parsing it only on a cache miss."""
+    with open(file_path, 'rb') as f:
+      source = f.read()
+    key = hashlib.sha256(source).digest()
+    tree = self._trees.get(key)
+    if tree is not None:
+      self.hits += 1
+      self._trees.move_to_end(key)
+      return tree
+    self.misses += 1
+    if self.tokens is not None:
+      table = self.tokens.tokenize_file(file_path)
+    else:
+      table = jack_tokenizer.tokenize(source.decode('utf-8'), file_path)
+    tree = jack_parser.JackParser(jack_tokenizer.JackTokenizer(file_path, table)).parse_class()
+    self._trees[key] = tree
+    while len(self._trees) > self.max_classes:
+      self._trees.popitem(last=False)
+    return tree
+
+  def clear(self) -> None:
+    self._trees.clear()
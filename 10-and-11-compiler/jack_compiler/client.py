@@ -0,0 +1,65 @@
+"""
+Sends a compile request to a running CompileServer. Only imports the
+standard library, so it starts far faster than compiling in-process.
+
+  $ python -m jack_compiler.client --socket /tmp/jack.sock MyGame vm -O all
+"""
+
+from typing import Any, Dict
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "jack_compiler.sock")
+
+
+def send_request(request: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH) -> Dict[str, Any]:
+  """
+  Send one request to the server at socket_path and return its response.
+  Raises ConnectionError if the server hangs up without replying.
+  """
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.connect(socket_path)
+    sock.sendall(json.dumps(request).encode() + b"\n")
+    sock.shutdown(socket.SHUT_WR)
+    with sock.makefile('rb') as f:
+      line = f.readline()
+  if not line:
+    raise ConnectionError("the server closed the connection without replying")
+  return json.loads(line)
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Compile through a running jack_compiler.server.")
+  parser.add_argument("source_code_path")
+  parser.add_argument("compiler")
+  parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+  parser.add_argument("-O", "--optimize", default="none")
+  parser.add_argument("--incremental", action="store_true")
+  parser.add_argument("--translate", action="store_true", help="also translate the VM code to Hack assembly")
+  return parser.parse_args()
+
+
+def main():
+  args = parse_args()
+  try:
+    response = send_request({
+      # the server may run in another directory
+      'path': os.path.abspath(args.source_code_path),
+      'compiler': args.compiler,
+      'optimize': args.optimize,
+      'incremental': args.incremental,
+      'translate': args.translate,
+    }, args.socket)
+  except ConnectionError as e:
+    sys.exit(str(e))
+  print(response['output'], end='')
+  if not response['ok']:
+    sys.exit(response['error'])
+
+
+if __name__ == "__main__":
+  main()
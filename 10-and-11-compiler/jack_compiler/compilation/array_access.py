@@ -0,0 +1,94 @@
+"""
+This module helps the VM compiler lower array accesses into less VM code:
+constant parts of an index become the offset of `push that c`/`pop that c`,
+and an element `pointer 1` already points at is not pointed at again.
+"""
+
+from typing import Callable, FrozenSet, Hashable, NamedTuple, Optional, Tuple
+
+from jack_compiler import jack_ast, lexicon
+from jack_compiler.compilation import constant_folding, symbol_table
+from jack_compiler.compilation.code_motion import expression_key, strip
+
+# what an index that `pointer 1` can be reused for may be made of: only the
+# variables it names can change its value (* and / call Math, which leaves
+# them alone)
+ADDRESS_NODES = (jack_ast.VarRef, jack_ast.IntegerConstant, jack_ast.KeywordConstant,
+                 jack_ast.UnaryOp, jack_ast.BinaryOp, jack_ast.Parenthesized)
+
+
+class Address(NamedTuple):
+  """The address `pointer 1` was set to: an array variable plus the non-constant part of an index."""
+  key: Hashable
+  names: FrozenSet[str]
+  # a static can change during any call, a local or an argument only by assignment
+  reads_statics: bool
+
+
+def split_index(index: jack_ast.Expression) -> Tuple[Optional[jack_ast.Expression], int]:
+  """
+  Split an index into the part to add to the array's base, None if there is
+  none, and a non-negative constant offset from the resulting address.
+  """
+  value = constant_folding.constant_value(index)
+  if value is not None and value >= 0:
+    return None, value
+  node = strip(index)
+  if isinstance(node, jack_ast.BinaryOp):
+    right = constant_folding.constant_value(node.right)
+    if node.op == lexicon.Symbols.PLUS and right is not None and right >= 0:
+      return node.left, right
+    left = constant_folding.constant_value(node.left)
+    # constants have no side effects, so c + i may evaluate i alone
+    if node.op == lexicon.Symbols.PLUS and left is not None and left >= 0:
+      return node.right, left
+  return index, 0
+
+
+def address_of(name: str, variable: Optional[jack_ast.Expression],
+               kind_of: Callable[[str], symbol_table.Kind]) -> Optional[Address]:
+  """
+  The address name[variable] names, or None if it can change without the
+  compiler seeing it: an index that reads memory or calls, or a field, which
+  an array store may overwrite.
+  """
+  names = {name}
+  if variable is not None:
+    for node in jack_ast.walk(variable):
+      if not isinstance(node, ADDRESS_NODES):
+        return None
+      if isinstance(node, jack_ast.VarRef):
+        names.add(node.name)
+  kinds = {kind_of(n) for n in names}
+  if symbol_table.Kind.FIELD in kinds:
+    return None
+  key = (name, None if variable is None else expression_key(variable))
+  return Address(key, frozenset(names), symbol_table.Kind.STATIC in kinds)
+
+
+class ThatPointer:
+  """
+  Tracks the address `pointer 1` holds while code is compiled in order.
+  Calls restore it on return, but a label must forget it since control can
+  arrive there from elsewhere.
+  """
+
+  def __init__(self) -> None:
+    self.address: Optional[Address] = None
+
+  def holds(self, address: Optional[Address]) -> bool:
+    return address is not None and address == self.address
+
+  def point_at(self, address: Optional[Address]) -> None:
+    self.address = address
+
+  def forget(self) -> None:
+    self.address = None
+
+  def assigned(self, name: str) -> None:
+    if self.address is not None and name in self.address.names:
+      self.address = None
+
+  def called(self) -> None:
+    if self.address is not None and self.address.reads_statics:
+      self.address = None
@@ -1,84 +1,120 @@
 """This module contains the ABC for the compilation engine."""
 
+from typing import List, Optional
 import abc
 
-from jack_compiler import jack_tokenizer
+from jack_compiler import jack_ast, jack_parser, jack_tokenizer, token_table
 
 
-class CompilationEngine(abc.ABC):
+class Backend(abc.ABC):
   """
-  Abstract interface for a CompilationEngine that reads from the input path
-  and writes to the output path.
+  Abstract interface for a backend: something that writes one output file
+  for the class in the input path.
+
+  The class is parsed on first use. Pass `tree` to feed one parse to several
+  backends, a pre-lexed token `table` to skip lexing, or `streaming` to lex
+  straight from a memory map.
   """
-  def __init__(self, input_path: str, output_path: str) -> None:
+  # extension of the files the backend writes, e.g. 'vm' for Main.vm
+  output_suffix: str
+
+  def __init__(self, input_path: str, output_path: str,
+               table: Optional[token_table.TokenTable] = None, streaming: bool = False,
+               tree: Optional[jack_ast.Class] = None) -> None:
     self.input_path = input_path
     self.output_path = output_path
-    self.tokenizer = jack_tokenizer.JackTokenizer(self.input_path)
+    self.tree = tree
+    self._table = table
+    self._streaming = streaming
+
+  @classmethod
+  def output_path_for(cls, source_file: str) -> str:
+    """Where the backend writes the output for a source file."""
+    return source_file.replace(".jack", f".{cls.output_suffix}")
+
+  def parse(self) -> jack_ast.Class:
+    """Return the AST of the input class, parsing it if needed."""
+    if self.tree is None:
+      if self._streaming:
+        # closed even if the class fails to parse, before the input ends
+        with jack_tokenizer.StreamingJackTokenizer(self.input_path) as tokenizer:
+          self.tree = jack_parser.JackParser(tokenizer).parse_class()
+      else:
+        tokenizer = jack_tokenizer.JackTokenizer(self.input_path, self._table)
+        self.tree = jack_parser.JackParser(tokenizer).parse_class()
+    return self.tree
 
   @abc.abstractmethod
   def compile_class(self) -> None:
     """Compiles a complete class."""
 
+
+class CompilationEngine(Backend):
+  """
+  Abstract interface for a CompilationEngine: a backend that walks the AST
+  of the class, one grammar rule at a time.
+  """
+
   @abc.abstractmethod
-  def compile_class_var_dec(self) -> None:
+  def compile_class_var_dec(self, node: jack_ast.ClassVarDec) -> None:
     """Compiles a static variable or class variable declaration."""
 
   @abc.abstractmethod
-  def compile_subroutine_dec(self) -> None:
+  def compile_subroutine_dec(self, node: jack_ast.SubroutineDec) -> None:
     """Compiles a complete method, function or constructor."""
 
   @abc.abstractmethod
-  def compile_parameter_list(self) -> None:
+  def compile_parameter_list(self, parameters: List[jack_ast.Parameter]) -> None:
     """Compiles a (possible empty) parameter list. Does not handle
     the enclosing '()'."""
 
   @abc.abstractmethod
-  def compile_subroutine_body(self) -> None:
+  def compile_subroutine_body(self, node: jack_ast.SubroutineDec) -> None:
     """Complies a subroutine's body."""
 
   @abc.abstractmethod
-  def compile_var_dec(self) -> None:
+  def compile_var_dec(self, node: jack_ast.VarDec) -> None:
     """Compiles a var declaration."""
 
   @abc.abstractmethod
-  def compile_statements(self) -> None:
+  def compile_statements(self, statements: List[jack_ast.Statement]) -> None:
     """Compiles a sequence of statements. Does not handle the
     enclosing '{}'."""
 
   @abc.abstractmethod
-  def compile_let(self) -> None:
+  def compile_let(self, node: jack_ast.LetStatement) -> None:
     """Compiles a let statement."""
 
   @abc.abstractmethod
-  def compile_if(self) -> None:
+  def compile_if(self, node: jack_ast.IfStatement) -> None:
     """Compiles an if statement."""
 
   @abc.abstractmethod
-  def compile_while(self) -> None:
+  def compile_while(self, node: jack_ast.WhileStatement) -> None:
     """Compiles a while statement."""
 
   @abc.abstractmethod
-  def compile_do(self) -> None:
+  def compile_do(self, node: jack_ast.DoStatement) -> None:
     """Compile a do statement"""
 
   @abc.abstractmethod
-  def compile_return(self) -> None:
+  def compile_return(self, node: jack_ast.ReturnStatement) -> None:
     """Compile a return statement."""
 
   @abc.abstractmethod
-  def compile_subroutine_call(self) -> None:
+  def compile_subroutine_call(self, node: jack_ast.SubroutineCall) -> None:
     """Compile a subroutine call."""
 
 
   @abc.abstractmethod
-  def compile_expression(self) -> None:
+  def compile_expression(self, node: jack_ast.Expression) -> None:
     """Compiles an expression."""
 
   @abc.abstractmethod
-  def compile_term(self) -> None:
-    """Compiles a term. Must do lookahead (LL2)."""
+  def compile_term(self, node: jack_ast.Expression) -> None:
+    """Compiles a term."""
 
   @abc.abstractmethod
-  def compile_expression_list(self) -> None:
+  def compile_expression_list(self, expressions: List[jack_ast.Expression]) -> None:
     """Compiles a (possibly empty) comma-seperated
     list of expressions."""
@@ -0,0 +1,387 @@
+"""
+This module contains loop-invariant code motion and common subexpression
+elimination. Both evaluate a pure expression once into a new local instead
+of re-evaluating it, which pays off most when the expression calls
+Math.multiply or Math.divide, or loads an array element through pointer 1.
+"""
+
+from typing import Dict, FrozenSet, Hashable, Iterator, List, NamedTuple
+
+from jack_compiler import jack_ast, lexicon
+from jack_compiler.compilation import constant_folding
+
+# the new locals get names no Jack identifier can have
+LOOP_INVARIANT_PREFIX = 'licm$'
+COMMON_SUBEXPRESSION_PREFIX = 'cse$'
+TEMP_TYPE = 'int'
+
+# rough VM command counts, to tell which expressions are worth a local
+CALL_COST = 20
+ARRAY_COST = 4
+# a binary operation on two variables; anything cheaper is as cheap as reading a local
+MIN_COST = 3
+# hoisting sets a local once per loop, which only a loop that runs pays back for
+# anything short of an array read or a call, so cheaper invariants stay put
+MIN_LOOP_INVARIANT_COST = 4
+# setting and reading a local, and pushing its initial 0 on every call
+TEMP_COST = 3
+
+MULTIPLICATIVE_OPS = {lexicon.Symbols.ASTERISK, lexicon.Symbols.FORWARD_SLASH}
+
+
+class Access(NamedTuple):
+  """
+  The variables some code reads or writes, and whether it reads or writes
+  memory: array elements, fields and statics, which a pointer or a call can
+  reach. Locals and arguments can only change by assignment.
+  """
+  variables: FrozenSet[str]
+  memory: bool
+
+  def conflicts(self, writes: 'Access') -> bool:
+    return bool(self.variables & writes.variables) or (self.memory and writes.memory)
+
+
+# everything a subroutine call may change
+CALL_WRITES = Access(frozenset(), True)
+
+
+def strip(node: jack_ast.Expression) -> jack_ast.Expression:
+  while isinstance(node, jack_ast.Parenthesized):
+    node = node.expression
+  return node
+
+
+def expression_key(node: jack_ast.Expression) -> Hashable:
+  """A hashable key, equal for expressions that only differ in parentheses."""
+  node = strip(node)
+  parts: List[Hashable] = [type(node).__name__]
+  for _, value in node.fields():
+    if isinstance(value, jack_ast.Node):
+      parts.append(expression_key(value))
+    elif isinstance(value, list):
+      parts.append(tuple(expression_key(item) for item in value))
+    else:
+      parts.append(value)
+  return tuple(parts)
+
+
+def cost(node: jack_ast.Expression) -> int:
+  """Estimate the VM commands evaluating an expression takes."""
+  node = strip(node)
+  if isinstance(node, jack_ast.ArrayRef):
+    return cost(node.index) + ARRAY_COST
+  if isinstance(node, jack_ast.UnaryOp):
+    return cost(node.operand) + 1
+  if isinstance(node, jack_ast.BinaryOp):
+    return cost(node.left) + cost(node.right) + (CALL_COST if node.op in MULTIPLICATIVE_OPS else 1)
+  if isinstance(node, jack_ast.SubroutineCall):
+    return CALL_COST + sum(cost(arg) for arg in node.args)
+  return 1
+
+
+def is_movable(node: jack_ast.Expression) -> bool:
+  """
+  Can the expression be evaluated somewhere else? It must call nothing,
+  and a string constant builds a new String every time it is evaluated.
+  """
+  return not any(isinstance(n, (jack_ast.SubroutineCall, jack_ast.StringConstant)) for n in jack_ast.walk(node))
+
+
+def can_fail(node: jack_ast.Expression) -> bool:
+  """True if the expression divides by something that may be 0, which Math.divide reports as an error."""
+  for n in jack_ast.walk(node):
+    if isinstance(n, jack_ast.BinaryOp) and n.op == lexicon.Symbols.FORWARD_SLASH and \
+        constant_folding.constant_value(n.right) in {None, 0}:
+      return True
+  return False
+
+
+def reads_of(node: jack_ast.Expression, local_names: FrozenSet[str]) -> Access:
+  """What evaluating a movable expression reads."""
+  names = {n.name for n in jack_ast.walk(node) if isinstance(n, (jack_ast.VarRef, jack_ast.ArrayRef))}
+  memory = any(isinstance(n, jack_ast.ArrayRef) for n in jack_ast.walk(node)) or not names <= local_names
+  return Access(frozenset(names), memory)
+
+
+def writes_of(node: jack_ast.Node, local_names: FrozenSet[str]) -> Access:
+  """What running a statement, or evaluating an expression, may change."""
+  names = set()
+  memory = False
+  for n in jack_ast.walk(node):
+    if isinstance(n, jack_ast.LetStatement):
+      names.add(n.name)
+      memory = memory or n.index is not None or n.name not in local_names
+    elif isinstance(n, (jack_ast.SubroutineCall, jack_ast.StringConstant)):
+      memory = True
+  return Access(frozenset(names), memory)
+
+
+def local_names_of(node: jack_ast.SubroutineDec) -> FrozenSet[str]:
+  return frozenset(p.name for p in node.parameters) | frozenset(n for d in node.var_decs for n in d.names)
+
+
+def subexpressions(node: jack_ast.Expression) -> Iterator[jack_ast.Expression]:
+  """The direct subexpressions of an expression, in evaluation order."""
+  for _, value in node.fields():
+    if isinstance(value, jack_ast.Node):
+      yield value
+    elif isinstance(value, list):
+      yield from value
+
+
+def statement_expressions(statement: jack_ast.Statement) -> Iterator[jack_ast.Expression]:
+  """The expressions of a statement and of the statements nested in it."""
+  if isinstance(statement, jack_ast.LetStatement):
+    if statement.index is not None:
+      yield statement.index
+    yield statement.value
+  elif isinstance(statement, jack_ast.DoStatement):
+    yield statement.call
+  elif isinstance(statement, jack_ast.ReturnStatement):
+    if statement.value is not None:
+      yield statement.value
+  elif isinstance(statement, jack_ast.IfStatement):
+    yield statement.condition
+    for nested in statement.then_statements + (statement.else_statements or []):
+      yield from statement_expressions(nested)
+  elif isinstance(statement, jack_ast.WhileStatement):
+    yield statement.condition
+    for nested in statement.statements:
+      yield from statement_expressions(nested)
+
+
+def with_temps(node: jack_ast.SubroutineDec, statements: List[jack_ast.Statement],
+               temps: List[str]) -> jack_ast.SubroutineDec:
+  """The subroutine with new statements, declaring the temps as locals."""
+  var_decs = node.var_decs + [jack_ast.VarDec(TEMP_TYPE, temps)] if temps else node.var_decs
+  return jack_ast.SubroutineDec(node.kind, node.return_type, node.name, node.parameters, var_decs, statements)
+
+
+class ExpressionReplacer(jack_ast.NodeTransformer):
+  """Replaces every expression equal to one of the keys by a read of its local."""
+  def __init__(self, temps: Dict[Hashable, str]) -> None:
+    self.temps = temps
+
+  def visit(self, node: jack_ast.Node) -> jack_ast.Node:
+    if not isinstance(node, (jack_ast.BinaryOp, jack_ast.UnaryOp, jack_ast.ArrayRef, jack_ast.Parenthesized)):
+      return super().visit(node)
+    temp = self.temps.get(expression_key(node))
+    return jack_ast.VarRef(temp) if temp is not None else super().visit(node)
+
+
+class LoopInvariantMover(jack_ast.NodeTransformer):
+  """
+  Moves the expressions of a while loop whose inputs nothing in the loop
+  can change out of it: each is evaluated once, into a new local, just
+  before the loop. Moved expressions call nothing and cannot fail, since
+  they now run even when the loop body, or the branch they were in, does
+  not. Outer loops are done first, so an expression leaves every loop it
+  is invariant in.
+  """
+  def visit_SubroutineDec(self, node: jack_ast.SubroutineDec) -> jack_ast.SubroutineDec:
+    self.local_names = local_names_of(node)
+    self.temps: List[str] = []
+    statements = self.visit_list(node.statements)
+    if statements is node.statements:
+      return node
+    return with_temps(node, statements, self.temps)
+
+  def visit_WhileStatement(self, node: jack_ast.WhileStatement) -> List[jack_ast.Statement]:
+    writes = writes_of(node, self.local_names)
+    invariants: Dict[Hashable, jack_ast.Expression] = {}
+    self._collect(node.condition, writes, invariants)
+    for statement in node.statements:
+      for expression in statement_expressions(statement):
+        self._collect(expression, writes, invariants)
+    hoisted: List[jack_ast.Statement] = []
+    temps: Dict[Hashable, str] = {}
+    # cheapest first, so a larger invariant can reuse the smaller ones inside it
+    for key, expression in sorted(invariants.items(), key=lambda item: cost(item[1])):
+      expression = ExpressionReplacer(temps).visit(expression)
+      temp = f"{LOOP_INVARIANT_PREFIX}{len(self.temps)}"
+      self.temps.append(temp)
+      self.local_names |= {temp}
+      temps[key] = temp
+      hoisted.append(jack_ast.LetStatement(temp, None, expression))
+    if not temps:
+      return self.generic_visit(node)
+    # then the loops nested in this one
+    return hoisted + [self.generic_visit(ExpressionReplacer(temps).visit(node))]
+
+  def _collect(self, node: jack_ast.Expression, writes: Access,
+               invariants: Dict[Hashable, jack_ast.Expression]) -> None:
+    """Add the largest invariant expressions in node to invariants."""
+    node = strip(node)
+    if cost(node) >= MIN_LOOP_INVARIANT_COST and is_movable(node) and not can_fail(node) and \
+        not reads_of(node, self.local_names).conflicts(writes):
+      invariants.setdefault(expression_key(node), node)
+      return
+    for subexpression in subexpressions(node):
+      self._collect(subexpression, writes, invariants)
+
+
+class AvailableExpressions:
+  """
+  Finds the expressions of a subroutine that are evaluated again while
+  their first value is still current: nothing they read was assigned, and
+  nothing since could have written memory if they read it. Follows the
+  statements in order; after an if only what both branches left is
+  available, and inside a while only what the loop does not change.
+
+  Nodes are identified by id(), for CommonSubexpressionEliminator to find
+  them again in the same tree.
+  """
+  def __init__(self, local_names: FrozenSet[str]) -> None:
+    self.local_names = local_names
+    self.available: Dict[Hashable, int] = {}
+    self.definitions: Dict[int, jack_ast.Expression] = {}
+    self.reads: Dict[int, Access] = {}
+    # id of a repeated evaluation -> id of the first one
+    self.reuses: Dict[int, int] = {}
+    self.in_loop_condition = False
+    self.called = False
+
+  def reuse_counts(self) -> Dict[int, int]:
+    counts = dict.fromkeys(self.definitions, 0)
+    for definition in self.reuses.values():
+      counts[definition] += 1
+    return counts
+
+  def kill(self, writes: Access) -> None:
+    self.available = {key: definition for key, definition in self.available.items()
+                      if not self.reads[definition].conflicts(writes)}
+
+  def statements(self, statements: List[jack_ast.Statement]) -> bool:
+    """Follow a block; returns False if it cannot complete normally (it returns)."""
+    for statement in statements:
+      if not self.statement(statement):
+        return False
+    return True
+
+  def statement(self, node: jack_ast.Statement) -> bool:
+    # a first evaluation is computed into its local before the statement, so
+    # nothing the statement does before it may have happened yet
+    self.called = False
+    if isinstance(node, jack_ast.LetStatement):
+      if node.index is not None:
+        self.expression(node.index)
+      self.expression(node.value)
+      self.kill(Access(frozenset({node.name}), node.index is not None or node.name not in self.local_names))
+    elif isinstance(node, jack_ast.DoStatement):
+      self.expression(node.call)
+    elif isinstance(node, jack_ast.ReturnStatement):
+      if node.value is not None:
+        self.expression(node.value)
+      return False
+    elif isinstance(node, jack_ast.IfStatement):
+      self.expression(node.condition)
+      before = dict(self.available)
+      then_completes = self.statements(node.then_statements)
+      after_then, self.available = self.available, before
+      else_completes = self.statements(node.else_statements or [])
+      after_else = self.available
+      if then_completes and else_completes:
+        self.available = {key: definition for key, definition in after_then.items()
+                          if after_else.get(key) == definition}
+      elif then_completes:
+        self.available = after_then
+      elif not else_completes:
+        return False
+    elif isinstance(node, jack_ast.WhileStatement):
+      self.kill(writes_of(node, self.local_names))
+      # the condition runs on every iteration, before anything could set a local for it
+      self.in_loop_condition = True
+      self.expression(node.condition)
+      self.in_loop_condition = False
+      after_condition = dict(self.available)
+      self.statements(node.statements)
+      self.available = after_condition
+    return True
+
+  def expression(self, node: jack_ast.Expression) -> None:
+    node = strip(node)
+    if cost(node) >= MIN_COST and is_movable(node):
+      key = expression_key(node)
+      definition = self.available.get(key)
+      if definition is not None:
+        self.reuses[id(node)] = definition
+        return
+      for subexpression in subexpressions(node):
+        self.expression(subexpression)
+      if not self.in_loop_condition and not self.called:
+        self.available[key] = id(node)
+        self.definitions[id(node)] = node
+        self.reads[id(node)] = reads_of(node, self.local_names)
+      return
+    for subexpression in subexpressions(node):
+      self.expression(subexpression)
+    if isinstance(node, (jack_ast.SubroutineCall, jack_ast.StringConstant)):
+      self.called = True
+      self.kill(CALL_WRITES)
+
+
+class CommonSubexpressionEliminator(jack_ast.NodeTransformer):
+  """
+  Evaluates an expression that AvailableExpressions finds repeated into a
+  new local, set just before the statement that first evaluates it, and
+  reads the local wherever it is evaluated again. Only done when the
+  repeats save more than the local costs.
+  """
+  def __init__(self) -> None:
+    self.temps: Dict[int, str] = {}
+    self.reuses: Dict[int, str] = {}
+    self.pending: List[jack_ast.Statement] = []
+
+  def visit_SubroutineDec(self, node: jack_ast.SubroutineDec) -> jack_ast.SubroutineDec:
+    analysis = AvailableExpressions(local_names_of(node))
+    analysis.statements(node.statements)
+    self.temps = {}
+    for definition, reuses in analysis.reuse_counts().items():
+      if reuses * (cost(analysis.definitions[definition]) - 1) > TEMP_COST:
+        self.temps[definition] = f"{COMMON_SUBEXPRESSION_PREFIX}{len(self.temps)}"
+    if not self.temps:
+      return node
+    self.reuses = {node_id: self.temps[definition] for node_id, definition in analysis.reuses.items()
+                   if definition in self.temps}
+    statements = self.visit_statements(node.statements)
+    return with_temps(node, statements, list(self.temps.values()))
+
+  def visit_statements(self, statements: List[jack_ast.Statement]) -> List[jack_ast.Statement]:
+    result: List[jack_ast.Statement] = []
+    for statement in statements:
+      outer, self.pending = self.pending, []
+      new_statement = self.visit(statement)
+      result.extend(self.pending)
+      result.append(new_statement)
+      self.pending = outer
+    return result
+
+  def visit_IfStatement(self, node: jack_ast.IfStatement) -> jack_ast.IfStatement:
+    condition = self.visit(node.condition)
+    then_statements = self.visit_statements(node.then_statements)
+    else_statements = None if node.else_statements is None else self.visit_statements(node.else_statements)
+    return jack_ast.IfStatement(condition, then_statements, else_statements)
+
+  def visit_WhileStatement(self, node: jack_ast.WhileStatement) -> jack_ast.WhileStatement:
+    return jack_ast.WhileStatement(self.visit(node.condition), self.visit_statements(node.statements))
+
+  def visit(self, node: jack_ast.Node) -> jack_ast.Node:
+    temp = self.reuses.get(id(node))
+    if temp is not None:
+      return jack_ast.VarRef(temp)
+    temp = self.temps.get(id(node))
+    if temp is None:
+      return super().visit(node)
+    self.pending.append(jack_ast.LetStatement(temp, None, super().visit(node)))
+    return jack_ast.VarRef(temp)
+
+
+def move_loop_invariants(tree: jack_ast.Class) -> jack_ast.Class:
+  """Return a copy of the class AST with loop invariants evaluated before their loops."""
+  return LoopInvariantMover().visit(tree)
+
+
+def eliminate_common_subexpressions(tree: jack_ast.Class) -> jack_ast.Class:
+  """Return a copy of the class AST where repeated expressions are evaluated once."""
+  return CommonSubexpressionEliminator().visit(tree)
@@ -0,0 +1,222 @@
+"""This module contains the constant folding and algebraic simplification pass."""
+
+from typing import Any, Optional
+
+from jack_compiler import jack_ast, lexicon
+
+WORD_MIN = -0x8000
+TRUE = -1
+
+
+def wrap(value: int) -> int:
+  """Wrap an int to the Hack platform's 16-bit two's complement range."""
+  return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+def constant_value(node: jack_ast.Expression) -> Optional[int]:
+  """The 16-bit value of a constant expression node, or None if it is not constant."""
+  if isinstance(node, jack_ast.IntegerConstant):
+    return wrap(node.value)
+  if isinstance(node, jack_ast.KeywordConstant):
+    if node.keyword == lexicon.KeywordTypes.TRUE:
+      return TRUE
+    if node.keyword in {lexicon.KeywordTypes.FALSE, lexicon.KeywordTypes.NULL}:
+      return 0
+  if isinstance(node, jack_ast.Parenthesized):
+    return constant_value(node.expression)
+  if isinstance(node, jack_ast.UnaryOp):
+    operand = constant_value(node.operand)
+    return None if operand is None else evaluate_unary(node.op, operand)
+  return None
+
+
+def is_pure(node: jack_ast.Expression) -> bool:
+  """True if evaluating the expression cannot have side effects (calls nothing)."""
+  if isinstance(node, jack_ast.SubroutineCall):
+    return False
+  if isinstance(node, jack_ast.ArrayRef):
+    return is_pure(node.index)
+  if isinstance(node, jack_ast.UnaryOp):
+    return is_pure(node.operand)
+  if isinstance(node, jack_ast.BinaryOp):
+    return is_pure(node.left) and is_pure(node.right)
+  if isinstance(node, jack_ast.Parenthesized):
+    return is_pure(node.expression)
+  return True
+
+
+def evaluate_binary(op: lexicon.Symbols, x: int, y: int) -> Optional[int]:
+  """
+  Compute `x op y` the way the compiled program would at run time, or
+  None where that cannot be done safely at compile time.
+  """
+  if op == lexicon.Symbols.PLUS:
+    return wrap(x + y)
+  if op == lexicon.Symbols.MINUS:
+    return wrap(x - y)
+  if op == lexicon.Symbols.ASTERISK:
+    # Math.multiply adds shifted copies of x, so it wraps like everything else
+    return wrap(x * y)
+  if op == lexicon.Symbols.FORWARD_SLASH:
+    # leave division by zero and Math.abs(-32768) overflow to the OS
+    if y == 0 or WORD_MIN in (x, y):
+      return None
+    quotient = abs(x) // abs(y)
+    return quotient if (x < 0) == (y < 0) else -quotient
+  if op == lexicon.Symbols.AMPERSAND:
+    return wrap(x & y)
+  if op == lexicon.Symbols.PIPE:
+    return wrap(x | y)
+  # the VM compares by the sign of the wrapped difference
+  if op == lexicon.Symbols.LT:
+    return TRUE if wrap(x - y) < 0 else 0
+  if op == lexicon.Symbols.GT:
+    return TRUE if wrap(x - y) > 0 else 0
+  if op == lexicon.Symbols.EQ:
+    return TRUE if x == y else 0
+  return None
+
+
+def evaluate_unary(op: lexicon.Symbols, x: int) -> int:
+  if op == lexicon.Symbols.MINUS:
+    return wrap(-x)
+  if op == lexicon.Symbols.TILDA:
+    return wrap(~x)
+  raise ValueError(op)
+
+
+def negate(node: jack_ast.Expression) -> jack_ast.Expression:
+  return jack_ast.UnaryOp(lexicon.Symbols.MINUS, node)
+
+
+class ConstantFolder(jack_ast.NodeTransformer):
+  """
+  Folds constant subexpressions with Hack 16-bit semantics, removes
+  algebraic identities (x+0, x*1, x&-1, --x, ...), and drops if/while
+  statements whose condition is a constant.
+
+  Subexpressions are only discarded (as in x*0) when they are pure, so
+  side effects of subroutine calls are always kept.
+  """
+  def visit_Parenthesized(self, node: jack_ast.Parenthesized) -> jack_ast.Expression:
+    # grouping is implicit in the tree; the VM code does not need it
+    return self.visit(node.expression)
+
+  def visit_KeywordConstant(self, node: jack_ast.KeywordConstant) -> jack_ast.Expression:
+    value = constant_value(node)
+    return node if value is None else jack_ast.IntegerConstant(value)
+
+  def visit_UnaryOp(self, node: jack_ast.UnaryOp) -> jack_ast.Expression:
+    operand = self.visit(node.operand)
+    value = constant_value(operand)
+    if value is not None:
+      return jack_ast.IntegerConstant(evaluate_unary(node.op, value))
+    if isinstance(operand, jack_ast.UnaryOp) and operand.op == node.op:
+      # --x and ~~x
+      return operand.operand
+    if node.op == lexicon.Symbols.MINUS and isinstance(operand, jack_ast.BinaryOp) and \
+        operand.op == lexicon.Symbols.MINUS and is_pure(operand.left) and is_pure(operand.right):
+      # -(a - b) = b - a; swaps evaluation order, hence the purity check
+      return jack_ast.BinaryOp(lexicon.Symbols.MINUS, operand.right, operand.left)
+    return node if operand is node.operand else jack_ast.UnaryOp(node.op, operand)
+
+  def visit_BinaryOp(self, node: jack_ast.BinaryOp) -> jack_ast.Expression:
+    left, right = self.visit(node.left), self.visit(node.right)
+    x, y = constant_value(left), constant_value(right)
+    if x is not None and y is not None:
+      value = evaluate_binary(node.op, x, y)
+      if value is not None:
+        return jack_ast.IntegerConstant(value)
+    simplified = self._simplify(node.op, left, right, x, y)
+    if simplified is not None:
+      return simplified
+    if left is node.left and right is node.right:
+      return node
+    return jack_ast.BinaryOp(node.op, left, right)
+
+  def _simplify(self, op: lexicon.Symbols, left: jack_ast.Expression, right: jack_ast.Expression,
+                x: Optional[int], y: Optional[int]) -> Optional[jack_ast.Expression]:
+    """Apply algebraic identities; None if none applies."""
+    if op == lexicon.Symbols.PLUS:
+      if x == 0:
+        return right
+      if y == 0:
+        return left
+      if y is not None and y < 0 and y != WORD_MIN:
+        # x + -c costs a neg more than x - c
+        return self.visit_BinaryOp(jack_ast.BinaryOp(lexicon.Symbols.MINUS, left, jack_ast.IntegerConstant(-y)))
+      return self._reassociate(op, left, y)
+    if op == lexicon.Symbols.MINUS:
+      if y == 0:
+        return left
+      if x == 0:
+        return self.visit_UnaryOp(negate(right))
+      if y is not None and y < 0 and y != WORD_MIN:
+        return self.visit_BinaryOp(jack_ast.BinaryOp(lexicon.Symbols.PLUS, left, jack_ast.IntegerConstant(-y)))
+      return self._reassociate(op, left, y)
+    if op == lexicon.Symbols.ASTERISK:
+      for constant, other in ((x, right), (y, left)):
+        if constant == 1:
+          return other
+        if constant == TRUE:
+          return self.visit_UnaryOp(negate(other))
+        if constant == 0 and is_pure(other):
+          return jack_ast.IntegerConstant(0)
+      return None
+    if op == lexicon.Symbols.FORWARD_SLASH:
+      if y == 1:
+        return left
+      if y == TRUE:
+        return self.visit_UnaryOp(negate(left))
+      return None
+    if op == lexicon.Symbols.AMPERSAND:
+      for constant, other in ((x, right), (y, left)):
+        if constant == TRUE:
+          return other
+        if constant == 0 and is_pure(other):
+          return jack_ast.IntegerConstant(0)
+      return None
+    if op == lexicon.Symbols.PIPE:
+      for constant, other in ((x, right), (y, left)):
+        if constant == 0:
+          return other
+        if constant == TRUE and is_pure(other):
+          return jack_ast.IntegerConstant(TRUE)
+      return None
+    return None
+
+  def _reassociate(self, op: lexicon.Symbols, left: jack_ast.Expression, y: Optional[int]) -> Optional[jack_ast.Expression]:
+    """(a +/- c1) +/- c2 becomes a +/- c, which is exact in 16-bit arithmetic."""
+    if y is None or not isinstance(left, jack_ast.BinaryOp) or \
+        left.op not in {lexicon.Symbols.PLUS, lexicon.Symbols.MINUS}:
+      return None
+    c1 = constant_value(left.right)
+    if c1 is None:
+      return None
+    inner = c1 if left.op == lexicon.Symbols.PLUS else -c1
+    outer = y if op == lexicon.Symbols.PLUS else -y
+    return self.visit_BinaryOp(jack_ast.BinaryOp(
+      lexicon.Symbols.PLUS, left.left, jack_ast.IntegerConstant(wrap(inner + outer))))
+
+  def visit_IfStatement(self, node: jack_ast.IfStatement) -> Any:
+    node = self.generic_visit(node)
+    value = constant_value(node.condition)
+    if value is None:
+      return node
+    # the compiled test is `not; if-goto`, so only true (-1) takes the then branch
+    if value == TRUE:
+      return node.then_statements
+    return node.else_statements
+
+  def visit_WhileStatement(self, node: jack_ast.WhileStatement) -> Any:
+    node = self.generic_visit(node)
+    value = constant_value(node.condition)
+    if value is not None and value != TRUE:
+      # never entered
+      return None
+    return node
+
+
+def fold_class(tree: jack_ast.Class) -> jack_ast.Class:
+  """Return a constant-folded copy of the class AST."""
+  return ConstantFolder().visit(tree)
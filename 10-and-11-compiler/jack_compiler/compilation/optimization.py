@@ -0,0 +1,56 @@
+"""This module contains the optional optimization passes of the VM compiler."""
+
+from typing import FrozenSet, Iterable
+import enum
+
+from jack_compiler import jack_ast
+from jack_compiler.compilation import code_motion, constant_folding
+
+
+class Optimization(str, enum.Enum):
+  CONSTANT_FOLDING = 'fold'
+  STRENGTH_REDUCTION = 'strength'
+  STRING_POOL = 'strings'
+  LOOP_INVARIANTS = 'licm'
+  COMMON_SUBEXPRESSIONS = 'cse'
+  ARRAY_ACCESS = 'arrays'
+
+
+# a pooled string literal is one String shared by every evaluation, which
+# breaks programs that modify or dispose a literal, so 'all' leaves it out
+ALL_OPTIMIZATIONS: FrozenSet[Optimization] = frozenset(Optimization) - {Optimization.STRING_POOL}
+# optimizations whose output for a class depends on the classes it references;
+# incremental builds recompile every dependent of a changed class while one is on
+WHOLE_PROGRAM_OPTIMIZATIONS: FrozenSet[Optimization] = frozenset()
+
+
+def parse_optimizations(spec: str) -> FrozenSet[Optimization]:
+  """Parse a command line spec: 'all', 'none' or a comma separated list such as 'fold' or 'all,strings'."""
+  spec = spec.strip()
+  if spec == 'all':
+    return ALL_OPTIMIZATIONS
+  if spec in {'', 'none'}:
+    return frozenset()
+  optimizations = set()
+  for name in spec.split(','):
+    if name.strip() == 'all':
+      optimizations.update(ALL_OPTIMIZATIONS)
+      continue
+    try:
+      optimizations.add(Optimization(name.strip()))
+    except ValueError:
+      choices = ", ".join(o.value for o in Optimization)
+      raise ValueError(f"unknown optimization {name.strip()!r}, expected one of: {choices}") from None
+  return frozenset(optimizations)
+
+
+def optimize_class(tree: jack_ast.Class, optimizations: Iterable[Optimization]) -> jack_ast.Class:
+  """Run the enabled AST passes over a class; the input tree is not modified."""
+  optimizations = frozenset(optimizations)
+  if Optimization.CONSTANT_FOLDING in optimizations:
+    tree = constant_folding.fold_class(tree)
+  if Optimization.LOOP_INVARIANTS in optimizations:
+    tree = code_motion.move_loop_invariants(tree)
+  if Optimization.COMMON_SUBEXPRESSIONS in optimizations:
+    tree = code_motion.eliminate_common_subexpressions(tree)
+  return tree
@@ -0,0 +1,156 @@
+"""
+This module lowers multiplication and division by constants into inline VM
+code, in place of calls to Math.multiply and Math.divide.
+"""
+
+from typing import List, Optional, Tuple
+
+from jack_compiler.compilation import vm_writing
+from jack_compiler.compilation.constant_folding import WORD_MIN, wrap
+
+# temp 0 is where statements discard values; the sequences below only use
+# temp 1-3, and never evaluate a subexpression while one of them is live
+SCRATCH_OPERAND = 1
+SCRATCH_ACCUMULATOR = 2
+SCRATCH_SIGN = 3
+
+# a multiplier with more nonzero signed digits than this is left to Math.multiply
+MAX_MULTIPLY_TERMS = 3
+
+Source = Tuple[vm_writing.VMSegment, int]
+
+
+def signed_digits(value: int) -> List[int]:
+  """
+  The non-adjacent form of a non-negative int: digits in {-1, 0, 1}, least
+  significant first, with no two adjacent digits nonzero. 255 is
+  2**8 - 1, so it needs two terms instead of eight.
+  """
+  digits = []
+  while value:
+    if value & 1:
+      digit = 2 - (value & 3)
+      value -= digit
+    else:
+      digit = 0
+    digits.append(digit)
+    value >>= 1
+  return digits
+
+
+def power_of_two_exponent(value: int) -> Optional[int]:
+  """k if value == 2**k for k >= 0, else None."""
+  if value > 0 and value & (value - 1) == 0:
+    return value.bit_length() - 1
+  return None
+
+
+def can_reduce_multiply(multiplier: int) -> bool:
+  multiplier = wrap(multiplier)
+  if multiplier == 0:
+    return True
+  return sum(1 for d in signed_digits(abs(multiplier)) if d) <= MAX_MULTIPLY_TERMS
+
+
+def can_reduce_divide(divisor: int) -> bool:
+  divisor = wrap(divisor)
+  return divisor != WORD_MIN and power_of_two_exponent(abs(divisor)) is not None
+
+
+def write_multiply(writer: vm_writing.VMWriter, operand: Source, multiplier: int) -> None:
+  """
+  Push operand * multiplier, reading the operand from `operand` as often as
+  needed. Evaluated Horner style over the signed digits of the multiplier:
+  each step doubles the accumulator, then adds or subtracts the operand.
+  The result wraps exactly like Math.multiply.
+  """
+  multiplier = wrap(multiplier)
+  if multiplier == 0:
+    writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
+    return
+  digits = signed_digits(abs(multiplier))
+  writer.write_push(*operand)
+  accumulator_is_operand = True
+  # the most significant digit is always 1 and seeds the accumulator
+  for digit in reversed(digits[:-1]):
+    if accumulator_is_operand:
+      writer.write_push(*operand)
+    else:
+      _write_duplicate(writer)
+    writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+    accumulator_is_operand = False
+    if digit:
+      writer.write_push(*operand)
+      writer.write_arithmetic(vm_writing.VMArithmetic.ADD if digit > 0 else vm_writing.VMArithmetic.SUB)
+  if multiplier < 0:
+    writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
+
+
+def write_divide(writer: vm_writing.VMWriter, divisor: int) -> None:
+  """
+  Replace the dividend on top of the stack by dividend / divisor, for a
+  divisor accepted by can_reduce_divide, truncating toward zero.
+
+  The VM has no shift, so |x| >> k is assembled from its bits k..15, each
+  moved down by masking: ((|x| & 2**i) != 0) & 2**(i-k). The sign is then
+  put back with r - (mask & 2r), where mask is -1 for a negative dividend.
+  A dividend of -32768 gives the true quotient, where Math.divide would
+  overflow in Math.abs.
+  """
+  divisor = wrap(divisor)
+  if abs(divisor) == 1:
+    if divisor < 0:
+      writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
+    return
+  shift = power_of_two_exponent(abs(divisor))
+  operand = (vm_writing.VMSegment.TEMP, SCRATCH_OPERAND)
+  sign = (vm_writing.VMSegment.TEMP, SCRATCH_SIGN)
+  writer.write_pop(*operand)
+  writer.write_push(*operand)
+  writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
+  writer.write_arithmetic(vm_writing.VMArithmetic.LT)
+  writer.write_pop(*sign)
+  # |x|, read as unsigned so that -32768 becomes 32768
+  writer.write_push(*operand)
+  _write_conditional_negate(writer, operand, sign)
+  writer.write_pop(*operand)
+  for bit in range(shift, 16):
+    writer.write_push(*operand)
+    if bit == 15:
+      # 32768 is not a valid constant: bit 15 is set iff the word is negative
+      writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
+      writer.write_arithmetic(vm_writing.VMArithmetic.LT)
+    else:
+      writer.write_push(vm_writing.VMSegment.CONSTANT, 1 << bit)
+      writer.write_arithmetic(vm_writing.VMArithmetic.AND)
+      writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
+      writer.write_arithmetic(vm_writing.VMArithmetic.EQ)
+      writer.write_arithmetic(vm_writing.VMArithmetic.NOT)
+    writer.write_push(vm_writing.VMSegment.CONSTANT, 1 << (bit - shift))
+    writer.write_arithmetic(vm_writing.VMArithmetic.AND)
+    if bit != shift:
+      writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+  accumulator = (vm_writing.VMSegment.TEMP, SCRATCH_ACCUMULATOR)
+  writer.write_pop(*accumulator)
+  writer.write_push(*accumulator)
+  _write_conditional_negate(writer, accumulator, sign)
+  if divisor < 0:
+    writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
+
+
+def _write_duplicate(writer: vm_writing.VMWriter) -> None:
+  """Replace the top of the stack x by x, x."""
+  accumulator = (vm_writing.VMSegment.TEMP, SCRATCH_ACCUMULATOR)
+  writer.write_pop(*accumulator)
+  writer.write_push(*accumulator)
+  writer.write_push(*accumulator)
+
+
+def _write_conditional_negate(writer: vm_writing.VMWriter, value: Source, mask: Source) -> None:
+  """With value on top of the stack, compute value - (mask & 2*value): -value when mask is -1."""
+  writer.write_push(*mask)
+  writer.write_push(*value)
+  writer.write_push(*value)
+  writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+  writer.write_arithmetic(vm_writing.VMArithmetic.AND)
+  writer.write_arithmetic(vm_writing.VMArithmetic.SUB)
@@ -1,21 +1,42 @@
 """This module contains the VM Compilation Engine which translated Jack to VM Code."""
 
-from typing import Optional, List, Callable
+from typing import Dict, Optional, List, Callable, Iterable, Tuple
 import os
 import argparse
-import copy
 
-from jack_compiler.compilation import base, symbol_table, vm_writing
-from jack_compiler import lexicon
+from jack_compiler.compilation import array_access, base, code_motion, constant_folding, optimization, \
+  strength_reduction, symbol_table, vm_writing
+from jack_compiler import jack_ast, lexicon, token_table
 
 IF_SUFFIX = 'AOF'
 WHILE_SUFFIX = 'AOWILE'
+STRING_SUFFIX = 'STR'
+
+KIND_SEGMENTS = {
+  symbol_table.Kind.ARG: vm_writing.VMSegment.ARGUMENT,
+  symbol_table.Kind.VAR: vm_writing.VMSegment.LOCAL,
+  symbol_table.Kind.FIELD: vm_writing.VMSegment.THIS,
+  symbol_table.Kind.STATIC: vm_writing.VMSegment.STATIC,
+}
 
 class VMCompilationEngine(base.CompilationEngine):
-  def __init__(self, input_path: str, output_path: str) -> None:
-    super().__init__(input_path, output_path)
-    self.tokenizer.advance()
-    if os.environ.get("VM_DEBUG"):
+  output_suffix = 'vm'
+
+  def __init__(self, input_path: str, output_path: str,
+               table: Optional[token_table.TokenTable] = None, streaming: bool = False,
+               tree: Optional[jack_ast.Class] = None,
+               optimizations: Iterable[optimization.Optimization] = (),
+               output_writer: Optional[vm_writing.OutputWriter] = None,
+               vm_writer: Optional[vm_writing.VMWriter] = None) -> None:
+    super().__init__(input_path, output_path, table, streaming, tree)
+    self.optimizations = frozenset(optimizations)
+    if vm_writer is not None:
+      # e.g. to hand structured commands straight to the VM translator
+      self.vm_writer = vm_writer
+    elif output_writer is not None:
+      # e.g. a MemoryWriter, to get the commands back instead of a file
+      self.vm_writer = vm_writing.VMWriter(output_writer=output_writer)
+    elif os.environ.get("VM_DEBUG"):
       self.vm_writer = vm_writing.VMWriter(output_writer=vm_writing.StdOutWriter())
     else: self.vm_writer = vm_writing.VMWriter(output_writer=vm_writing.FileWriter(self.output_path))
     self.class_symbols = symbol_table.SymbolTable()
@@ -23,462 +44,396 @@ class VMCompilationEngine(base.CompilationEngine):
 
   def compile_class(self) -> None:
     """Compiles a complete class."""
-    self.class_symbols.reset()
-    self.tokenizer.advance()
-    # class name
-    self.class_name = self.tokenizer.identifier()
-
-    self.label_incrementer: Callable[[], str] = get_label_incrementer(self.class_name)
-    self.tokenizer.advance()
-    # open curly
-    self.tokenizer.advance()
-    while self.tokenizer.token_type() != lexicon.TokenType.SYMBOL:
-      keyword = self.tokenizer.keyword()
-      if keyword == lexicon.KeywordTypes.STATIC:
-        self.compile_class_var_dec()
-      elif keyword == lexicon.KeywordTypes.FIELD:
-        self.compile_class_var_dec()
-      elif keyword == lexicon.KeywordTypes.CONSTRUCTOR:
-        self.compile_subroutine_dec()
-      elif keyword == lexicon.KeywordTypes.FUNCTION:
-        self.compile_subroutine_dec()
-      elif keyword == lexicon.KeywordTypes.METHOD:
-        self.compile_subroutine_dec()
-
-  def compile_class_var_dec(self) -> None:
+    try:
+      node = optimization.optimize_class(self.parse(), self.optimizations)
+      self.class_symbols.reset()
+      self.class_name = node.name
+      self.label_incrementer: Callable[[], str] = get_label_incrementer(self.class_name)
+      self.that = array_access.ThatPointer()
+      for class_var_dec in node.class_var_decs:
+        self.compile_class_var_dec(class_var_dec)
+      # pooled string literals live in statics after the declared ones
+      self.string_pool: Dict[str, int] = {}
+      self.first_pool_static = self.class_symbols.var_count(symbol_table.Kind.STATIC)
+      for subroutine_dec in node.subroutine_decs:
+        self.compile_subroutine_dec(subroutine_dec)
+    except BaseException:
+      # leave no truncated output behind for a class that failed
+      self.vm_writer.abort()
+      raise
+    # writers buffer, so the output is only complete once closed
+    self.vm_writer.close()
+
+  def compile_class_var_dec(self, node: jack_ast.ClassVarDec) -> None:
     """Compiles a static variable or class variable declaration."""
-    # field keyword
-    scope_kw = self.tokenizer.keyword()
-    if scope_kw == lexicon.KeywordTypes.FIELD:
+    if node.kind == lexicon.KeywordTypes.FIELD:
       scope = symbol_table.Kind.FIELD
-    elif scope_kw == lexicon.KeywordTypes.STATIC:
+    elif node.kind == lexicon.KeywordTypes.STATIC:
       scope = symbol_table.Kind.STATIC
-    else: raise ValueError(scope_kw)
-    self.tokenizer.advance()
-    # type
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      type_ = self.tokenizer.keyword().value
-    elif self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      type_ = self.tokenizer.identifier()
-    else: raise ValueError(f"Expected type declaration or classname, but got {self.tokenizer.token_type()}")
-    self.tokenizer.advance()
-    # variable name
-    varname = self.tokenizer.identifier()
-    self.class_symbols.define(varname, type_, scope)
-    self.tokenizer.advance()
-    while self.tokenizer.symbol() != lexicon.Symbols.SEMICOLON:
-      # comma
-      self.tokenizer.advance()
-      self.class_symbols.define(self.tokenizer.identifier(), type_, scope)
-      self.tokenizer.advance()
-    self.tokenizer.advance()
-
-  def compile_subroutine_dec(self) -> None:
+    else: raise ValueError(node.kind)
+    for name in node.names:
+      self.class_symbols.define(name, node.type_, scope)
+
+  def compile_subroutine_dec(self, node: jack_ast.SubroutineDec) -> None:
     """Compiles a complete method, function or constructor."""
     self.subroutine_symbols.reset()
-    subroutine_type = self.tokenizer.keyword().value
-    n_args: int
-    if subroutine_type == lexicon.KeywordTypes.FUNCTION:
-      n_args = 0
-    elif subroutine_type == lexicon.KeywordTypes.METHOD:
-      n_args = 1
+    if node.kind == lexicon.KeywordTypes.METHOD:
       self.subroutine_symbols.define('this', self.class_name, symbol_table.Kind.ARG)
-    elif subroutine_type == lexicon.KeywordTypes.CONSTRUCTOR:
-      n_args = 0
-    else: raise ValueError("")
-    self.tokenizer.advance()
-    # return type
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      if self.tokenizer.keyword() != lexicon.KeywordTypes.VOID:
-        ...
-    else:
-      ...
-    self.tokenizer.advance()
-    # subroutine name
-    subroutine_identifier = f"{self.class_name}.{self.tokenizer.identifier()}"
-    self.tokenizer.advance()
-    self.tokenizer.advance()
-    self.compile_parameter_list()
-    n_args += self.subroutine_symbols.var_count(symbol_table.Kind.ARG)
-    self.tokenizer.advance()
-    # subroutine body
-    # open curly
-    self.tokenizer.advance()
-    # variable declarations
-    while self.tokenizer.keyword() == lexicon.KeywordTypes.VAR:
-      self.compile_var_dec()
-      self.tokenizer.advance()
-    n_args += self.subroutine_symbols.var_count(symbol_table.Kind.VAR)
-    
-    if subroutine_type == lexicon.KeywordTypes.CONSTRUCTOR:
-      self.vm_writer.write_function(subroutine_identifier, 0)
+    self.compile_parameter_list(node.parameters)
+    for var_dec in node.var_decs:
+      self.compile_var_dec(var_dec)
+    n_vars = self.subroutine_symbols.var_count(symbol_table.Kind.VAR)
+
+    self.vm_writer.write_function(f"{self.class_name}.{node.name}", n_vars)
+    self.that.forget()
+    if node.kind == lexicon.KeywordTypes.CONSTRUCTOR:
       self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, self.class_symbols.var_count(symbol_table.Kind.FIELD))
-      self.vm_writer.write_call("Memory.alloc", 1)
+      self._write_call("Memory.alloc", 1)
       self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 0)
-    elif subroutine_type == lexicon.KeywordTypes.METHOD:
-      self.vm_writer.write_function(subroutine_identifier, n_args)
+    elif node.kind == lexicon.KeywordTypes.METHOD:
       self.vm_writer.write_push(vm_writing.VMSegment.ARGUMENT, 0)
       self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 0)
-    else:
-      self.vm_writer.write_function(subroutine_identifier, n_args)
-    self.compile_subroutine_body()
+    self.compile_subroutine_body(node)
 
-  def compile_parameter_list(self) -> None:
+  def compile_parameter_list(self, parameters: List[jack_ast.Parameter]) -> None:
     """Compiles a (possible empty) parameter list. Does not handle
     the enclosing '()'."""
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
-      # no params
-      return
-    if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      type_ = self.tokenizer.identifier()
-    else:
-      # keyword
-      type_ = self.tokenizer.keyword().value
-    self.tokenizer.advance()
-    varname = self.tokenizer.identifier()
-    self.tokenizer.advance()
-    self.subroutine_symbols.define(varname, type_, symbol_table.Kind.ARG)
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        self.tokenizer.symbol() == lexicon.Symbols.COMMA:
-      # comma
-      self.tokenizer.advance()
-      if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-        type_ = self.tokenizer.identifier()
-      else:
-        type_ = self.tokenizer.keyword()
-      self.tokenizer.advance()
-      varname = self.tokenizer.identifier()
-      self.tokenizer.advance()
-      self.subroutine_symbols.define(varname, type_, symbol_table.Kind.ARG)
+    for parameter in parameters:
+      self.subroutine_symbols.define(parameter.name, parameter.type_, symbol_table.Kind.ARG)
 
-  def compile_subroutine_body(self) -> None:
+  def compile_subroutine_body(self, node: jack_ast.SubroutineDec) -> None:
     """Complies a subroutine's body."""
-    self.compile_statements()
-    # close curly
-    self.tokenizer.advance()
+    self.compile_statements(node.statements)
 
-  def compile_var_dec(self) -> None:
+  def compile_var_dec(self, node: jack_ast.VarDec) -> None:
     """Compiles a var declaration."""
-    self.tokenizer.advance()
-    # type
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      type_ = self.tokenizer.keyword().value
-    else: type_ = self.tokenizer.identifier()
-    self.tokenizer.advance()
-    names: List[str] = [self.tokenizer.identifier()]
-    self.tokenizer.advance()
-    while self.tokenizer.symbol() != lexicon.Symbols.SEMICOLON:
-      # comma
-      self.tokenizer.advance()
-      names.append(self.tokenizer.identifier())
-      self.tokenizer.advance()
-    for name in names:
-      self.subroutine_symbols.define(name=name, type_=type_, kind=symbol_table.Kind.VAR)
-
-  def compile_statements(self) -> None:
+    for name in node.names:
+      self.subroutine_symbols.define(name=name, type_=node.type_, kind=symbol_table.Kind.VAR)
+
+  def compile_statements(self, statements: List[jack_ast.Statement]) -> None:
     """Compiles a sequence of statements. Does not handle the
     enclosing '{}'."""
-    while True:
-      if self.tokenizer.token_type() != lexicon.TokenType.KEYWORD:
-        break
-      if self.tokenizer.keyword() == lexicon.KeywordTypes.LET:
-        self.compile_let()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.IF:
-        self.compile_if()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.WHILE:
-        self.compile_while()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.DO:
-        self.compile_do()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.RETURN:
-        self.compile_return()
-      else:
-        self.tokenizer.advance()
-        break
+    for statement in statements:
+      if isinstance(statement, jack_ast.LetStatement):
+        self.compile_let(statement)
+      elif isinstance(statement, jack_ast.IfStatement):
+        self.compile_if(statement)
+      elif isinstance(statement, jack_ast.WhileStatement):
+        self.compile_while(statement)
+      elif isinstance(statement, jack_ast.DoStatement):
+        self.compile_do(statement)
+      elif isinstance(statement, jack_ast.ReturnStatement):
+        self.compile_return(statement)
+      else: raise ValueError(statement)
 
-  def compile_let(self) -> None:
+  def compile_let(self, node: jack_ast.LetStatement) -> None:
     """Compiles a let statement."""
-    # let keyword
-    self.tokenizer.advance()
-    # var name
-    varname = self.tokenizer.identifier()
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-      self.tokenizer.symbol() == lexicon.Symbols.LEFT_SQR_PAREN:
+    if node.index is not None and optimization.Optimization.ARRAY_ACCESS in self.optimizations:
+      self._compile_array_store(node)
+      return
+    if node.index is not None:
       # array, e.g. let a[expression1] = expression2
-      self.tokenizer.advance()
-      # expression1
-      table = self._get_symbol_table(varname)
-      kind = table.kind_of(varname)
-      if kind == symbol_table.Kind.ARG:
-        seg = vm_writing.VMSegment.ARGUMENT
-      elif kind == symbol_table.Kind.FIELD:
-        seg = vm_writing.VMSegment.THIS
-      elif kind == symbol_table.Kind.STATIC:
-        seg = vm_writing.VMSegment.STATIC
-      elif kind == symbol_table.Kind.VAR:
-        seg = vm_writing.VMSegment.LOCAL
-      else: raise ValueError(kind)
-      self.vm_writer.write_push(seg, table.index_of(varname))
-      self.compile_expression()
+      self.vm_writer.write_push(*self._segment_of(node.name))
+      self.compile_expression(node.index)
       # add [expression1] to array base address
       self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
-      self.tokenizer.advance(); self.tokenizer.advance()
-      # expression1
-      self.compile_expression()
+      self.compile_expression(node.value)
       self.vm_writer.write_pop(vm_writing.VMSegment.TEMP, 0)
       self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 1)
       self.vm_writer.write_push(vm_writing.VMSegment.TEMP, 0)
       self.vm_writer.write_pop(vm_writing.VMSegment.THAT, 0)
-      self.tokenizer.advance()
       return
-
     # assignment
-    self.tokenizer.advance()
-    self.compile_expression()
-    table = self._get_symbol_table(varname)
-    kind = table.kind_of(varname)
-    if kind == symbol_table.Kind.ARG:
-      seg = vm_writing.VMSegment.ARGUMENT
-    elif kind == symbol_table.Kind.VAR:
-      seg = vm_writing.VMSegment.LOCAL
-    elif kind == symbol_table.Kind.FIELD:
-      seg = vm_writing.VMSegment.THIS
-    elif kind == symbol_table.Kind.STATIC:
-      seg = vm_writing.VMSegment.STATIC
-    else: raise ValueError(kind)
-    self.vm_writer.write_pop(seg, table.index_of(varname))
-    # semi colon
-    self.tokenizer.advance()
-
-  def compile_if(self) -> None:
+    self.compile_expression(node.value)
+    self.vm_writer.write_pop(*self._segment_of(node.name))
+    self.that.assigned(node.name)
+
+  def compile_if(self, node: jack_ast.IfStatement) -> None:
     """Compiles an if statement."""
-    # if keyword; then open param
-    self.tokenizer.advance(); self.tokenizer.advance()
-    self.compile_expression()
+    self.compile_expression(node.condition)
     self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NOT)
     if_label = self.label_incrementer(IF_SUFFIX)
     self.vm_writer.write_if(if_label) # if-goto L1
-    # close paran; open curly
-    self.tokenizer.advance(); self.tokenizer.advance()
-    self.compile_statements()
+    self.compile_statements(node.then_statements)
     else_label = self.label_incrementer(IF_SUFFIX)
     self.vm_writer.write_goto(else_label) # goto L2
-    self.vm_writer.write_label(if_label) # label L1
-    # close paran
-    self.tokenizer.advance()
-
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD and \
-      self.tokenizer.keyword() == lexicon.KeywordTypes.ELSE:
-      # else keyword; then open paren
-      self.tokenizer.advance(); self.tokenizer.advance()
-      self.compile_statements()
-      # close paran
-      self.tokenizer.advance()
+    self._write_label(if_label) # label L1
+    if node.else_statements is not None:
+      self.compile_statements(node.else_statements)
+    self._write_label(else_label) # label L2
 
-    self.vm_writer.write_label(else_label) # label L2
-
-  def compile_while(self) -> None:
+  def compile_while(self, node: jack_ast.WhileStatement) -> None:
     """Compiles a while statement."""
-    # while keyword; then open paren
-    self.tokenizer.advance(); self.tokenizer.advance()
-    # while condition
     while_label = self.label_incrementer(WHILE_SUFFIX)
     statements_label = self.label_incrementer(WHILE_SUFFIX)
-    self.vm_writer.write_label(while_label)
-    self.compile_expression()
-    self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NOT)
-    self.vm_writer.write_if(statements_label)
-    # close paran; open curly
-    self.tokenizer.advance(); self.tokenizer.advance()
-    self.compile_statements()
+    self._write_label(while_label)
+    if not self._is_folded_true(node.condition):
+      self.compile_expression(node.condition)
+      self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NOT)
+      self.vm_writer.write_if(statements_label)
+    self.compile_statements(node.statements)
     self.vm_writer.write_goto(while_label)
-    self.vm_writer.write_label(statements_label)
-    # close paran
-    self.tokenizer.advance()
+    self._write_label(statements_label)
 
-  def compile_do(self) -> None:
+  def compile_do(self, node: jack_ast.DoStatement) -> None:
     """Compile a do statement"""
-    # do
-    self.tokenizer.advance()
-    self.compile_subroutine_call()
-    self.tokenizer.advance()
-    # semicolon
+    self.compile_subroutine_call(node.call)
+    # discard the return value
     self.vm_writer.write_pop(vm_writing.VMSegment.TEMP, 0)
-    self.tokenizer.advance()
 
-  def compile_return(self) -> None:
+  def compile_return(self, node: jack_ast.ReturnStatement) -> None:
     """Compile a return statement."""
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
+    if node.value is None:
       # need to push constant 0 for a null return
       self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
-      self.vm_writer.write_return()
-      self.tokenizer.advance()
-      return
-    self.compile_expression()
+    else:
+      self.compile_expression(node.value)
     self.vm_writer.write_return()
-    self.tokenizer.advance()
 
-  def compile_subroutine_call(self) -> None:
+  def compile_subroutine_call(self, node: jack_ast.SubroutineCall) -> None:
     """Compile a subroutine call."""
-    # caller name
-    subroutine_name = self.tokenizer.identifier()
-    self.tokenizer.advance()
-    if self.tokenizer.symbol() == lexicon.Symbols.PERIOD:
-      # period
-      self.tokenizer.advance()
-      # subroutine name
-      try:
-        self._get_symbol_table(subroutine_name).index_of(subroutine_name)
-      except KeyError:
-        is_method = False
-        type_of = subroutine_name
-      else:
-        # is a method, so need one more expression
-        table = self._get_symbol_table(subroutine_name)
-        is_method = True
-        kind = table.kind_of(subroutine_name)
-        type_of = table.type_of(subroutine_name)
-        if kind == symbol_table.Kind.FIELD:
-          seg = vm_writing.VMSegment.THIS
-        elif kind == symbol_table.Kind.VAR:
-          seg = vm_writing.VMSegment.LOCAL
-        else: raise ValueError(kind)
-        self.vm_writer.write_push(seg, table.index_of(subroutine_name))
-      subroutine_name = f'{type_of}.{self.tokenizer.identifier()}'
-      self.tokenizer.advance()
-    else:
+    n_args = len(node.args)
+    if node.receiver is None:
       # implicit caller
-      is_method = True
       self.vm_writer.write_push(vm_writing.VMSegment.POINTER, 0)
-      subroutine_name = f"{self.class_name}.{subroutine_name}"
-
-    # open paran
-    self.tokenizer.advance()
-    self.compile_expression_list()
-    assert isinstance(self.num_expressions, int)
-    # close paran
-    if is_method:
-      self.num_expressions += 1
-    self.vm_writer.write_call(subroutine_name, self.num_expressions)
-    self.num_expressions = None
-
+      subroutine_name = f"{self.class_name}.{node.name}"
+      n_args += 1
+    elif self._is_defined(node.receiver):
+      # is a method on a variable, which is passed as argument 0
+      table = self._get_symbol_table(node.receiver)
+      self.vm_writer.write_push(*self._segment_of(node.receiver))
+      subroutine_name = f"{table.type_of(node.receiver)}.{node.name}"
+      n_args += 1
+    else:
+      subroutine_name = f"{node.receiver}.{node.name}"
+    self.compile_expression_list(node.args)
+    self._write_call(subroutine_name, n_args)
 
-  def compile_expression(self) -> None:
+  def compile_expression(self, node: jack_ast.Expression) -> None:
     """Compiles an expression."""
-    self.compile_term()
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-          lexicon.Symbols.is_op(self.tokenizer.symbol()):
-      vm_op = self.tokenizer.symbol()
-      if vm_op == lexicon.Symbols.ASTERISK:
-        postfix_callable = lambda : self.vm_writer.write_call("Math.multiply", 2)
-      elif vm_op == lexicon.Symbols.FORWARD_SLASH:
-        postfix_callable = lambda : self.vm_writer.write_call("Math.divide", 2)
-      else:
-        postfix_callable = lambda : self.vm_writer.write_arithmetic(vm_op)
-      self.tokenizer.advance()
-      self.compile_term()
-      postfix_callable()
-
-  def compile_term(self) -> None:
-    """Compiles a term. Must do lookahead (LL2)."""
-    if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      lookahead_tokenizer = copy.deepcopy(self.tokenizer)
-      lookahead_tokenizer.advance()
-      if lookahead_tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        lookahead_tokenizer.symbol() in {lexicon.Symbols.LEFT_PAREN, lexicon.Symbols.PERIOD}:
-        self.compile_subroutine_call()
-        self.tokenizer.advance()
-      else:
-        identifier = self.tokenizer.identifier()
-        table = self._get_symbol_table(identifier)
-        idx = table.index_of(identifier)
-        kind = table.kind_of(identifier)
-        if kind == symbol_table.Kind.ARG:
-          seg = vm_writing.VMSegment.ARGUMENT
-        elif kind == symbol_table.Kind.VAR:
-          seg = vm_writing.VMSegment.LOCAL
-        elif kind == symbol_table.Kind.FIELD:
-          seg = vm_writing.VMSegment.THIS
-        elif kind == symbol_table.Kind.STATIC:
-          seg = vm_writing.VMSegment.STATIC
-        else: raise ValueError(kind)
-        self.vm_writer.write_push(seg, idx)
-        self.tokenizer.advance()
-        if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-            self.tokenizer.symbol() == lexicon.Symbols.LEFT_SQR_PAREN:
-          # a[i], now at [
-          self.tokenizer.advance()
-          self.compile_expression()
-          self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
-          self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 1)
-          self.vm_writer.write_push(vm_writing.VMSegment.THAT, 0)
-          self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      if self.tokenizer.keyword() == lexicon.KeywordTypes.TRUE:
+    if not isinstance(node, jack_ast.BinaryOp):
+      self.compile_term(node)
+      return
+    if optimization.Optimization.STRENGTH_REDUCTION in self.optimizations and self._compile_reduced(node):
+      return
+    self.compile_expression(node.left)
+    self.compile_expression(node.right)
+    if node.op == lexicon.Symbols.ASTERISK:
+      self._write_call("Math.multiply", 2)
+    elif node.op == lexicon.Symbols.FORWARD_SLASH:
+      self._write_call("Math.divide", 2)
+    else:
+      self.vm_writer.write_arithmetic(node.op)
+
+  def compile_term(self, node: jack_ast.Expression) -> None:
+    """Compiles a term."""
+    if isinstance(node, jack_ast.SubroutineCall):
+      self.compile_subroutine_call(node)
+    elif isinstance(node, jack_ast.VarRef):
+      self.vm_writer.write_push(*self._segment_of(node.name))
+    elif isinstance(node, jack_ast.ArrayRef) and optimization.Optimization.ARRAY_ACCESS in self.optimizations:
+      offset = self._point_that(node.name, node.index)
+      self.vm_writer.write_push(vm_writing.VMSegment.THAT, offset)
+    elif isinstance(node, jack_ast.ArrayRef):
+      # a[i]
+      self.vm_writer.write_push(*self._segment_of(node.name))
+      self.compile_expression(node.index)
+      self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+      self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 1)
+      self.vm_writer.write_push(vm_writing.VMSegment.THAT, 0)
+    elif isinstance(node, jack_ast.KeywordConstant):
+      if node.keyword == lexicon.KeywordTypes.TRUE:
         self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, 1)
         self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.FALSE:
+      elif node.keyword == lexicon.KeywordTypes.FALSE:
         self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.THIS:
+      elif node.keyword == lexicon.KeywordTypes.THIS:
         self.vm_writer.write_push(vm_writing.VMSegment.POINTER, 0)
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.NULL:
+      elif node.keyword == lexicon.KeywordTypes.NULL:
         self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, 0)
-      else: raise ValueError(self.tokenizer.keyword())
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.INT_CONST:
-      # int val
-      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, self.tokenizer.int_val())
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.STRING_CONST:
-      string_val = self.tokenizer.string_val()
-      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, len(string_val))
-      self.vm_writer.write_call("String.new", 1)
-      for s in string_val:
-        self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, ord(s))
-        self.vm_writer.write_call("String.appendChar", 2)
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-      self.tokenizer.symbol() == lexicon.Symbols.LEFT_PAREN:
-      self.tokenizer.advance()
-      self.compile_expression()
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        lexicon.Symbols.is_unary_op(self.tokenizer.symbol()):
-      op = self.tokenizer.symbol()
-      if op == lexicon.Symbols.MINUS:
+      else: raise ValueError(node.keyword)
+    elif isinstance(node, jack_ast.IntegerConstant):
+      self._push_constant(node.value)
+    elif isinstance(node, jack_ast.StringConstant):
+      if optimization.Optimization.STRING_POOL in self.optimizations:
+        self._push_pooled_string(node.value)
+      else:
+        self._write_new_string(node.value)
+    elif isinstance(node, jack_ast.Parenthesized):
+      self.compile_expression(node.expression)
+    elif isinstance(node, jack_ast.UnaryOp):
+      if node.op == lexicon.Symbols.MINUS:
         vm_op = vm_writing.VMArithmetic.NEG
-      elif op == lexicon.Symbols.TILDA:
+      elif node.op == lexicon.Symbols.TILDA:
         vm_op = vm_writing.VMArithmetic.NOT
-      else: raise ValueError(op)
-      self.tokenizer.advance()
-      self.compile_term()
+      else: raise ValueError(node.op)
+      self.compile_term(node.operand)
       self.vm_writer.write_arithmetic(vm_op)
+    elif isinstance(node, jack_ast.BinaryOp):
+      self.compile_expression(node)
     else:
-      raise NotImplementedError()
-    
+      raise NotImplementedError(node)
 
-  def compile_expression_list(self) -> None:
+  def compile_expression_list(self, expressions: List[jack_ast.Expression]) -> None:
     """Compiles a (possibly empty) comma-seperated
     list of expressions."""
-    self.num_expressions = 0
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
-      if not self.tokenizer.symbol() == lexicon.Symbols.LEFT_PAREN:
-        # no expressions
-        return
-    self.num_expressions += 1
-    self.compile_expression()
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and self.tokenizer.symbol() == lexicon.Symbols.COMMA:
-      # comma
-      self.tokenizer.advance()
-      self.compile_expression()
-      self.num_expressions += 1
-    
+    for expression in expressions:
+      self.compile_expression(expression)
+
+  def _compile_reduced(self, node: jack_ast.BinaryOp) -> bool:
+    """Compile `x * c` or `x / c` inline if the constant allows it. Returns False if it did not."""
+    if node.op == lexicon.Symbols.ASTERISK:
+      operand, multiplier = node.left, constant_folding.constant_value(node.right)
+      if multiplier is None:
+        # constants have no side effects, so c * x may evaluate x first
+        operand, multiplier = node.right, constant_folding.constant_value(node.left)
+      if multiplier is None or not strength_reduction.can_reduce_multiply(multiplier):
+        return False
+      if multiplier in {1, -1}:
+        self.compile_expression(operand)
+        if multiplier == -1:
+          self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
+        return True
+      strength_reduction.write_multiply(self.vm_writer, self._operand_source(operand), multiplier)
+      return True
+    if node.op == lexicon.Symbols.FORWARD_SLASH:
+      divisor = constant_folding.constant_value(node.right)
+      if divisor is None or not strength_reduction.can_reduce_divide(divisor):
+        return False
+      self.compile_expression(node.left)
+      strength_reduction.write_divide(self.vm_writer, divisor)
+      return True
+    return False
+
+  def _operand_source(self, node: jack_ast.Expression) -> Tuple[vm_writing.VMSegment, int]:
+    """Where an operand that is read several times can be pushed from, evaluating it once if needed."""
+    if isinstance(node, jack_ast.VarRef):
+      return self._segment_of(node.name)
+    if isinstance(node, jack_ast.IntegerConstant) and node.value >= 0:
+      return vm_writing.VMSegment.CONSTANT, node.value
+    self.compile_expression(node)
+    self.vm_writer.write_pop(vm_writing.VMSegment.TEMP, strength_reduction.SCRATCH_OPERAND)
+    return vm_writing.VMSegment.TEMP, strength_reduction.SCRATCH_OPERAND
+
+  def _compile_array_store(self, node: jack_ast.LetStatement) -> None:
+    """
+    Compile let a[i] = e. Unless evaluating e moves `pointer 1`, it can point
+    at a[i] first and e be popped straight into it; if neither i nor e calls
+    anything, the order they are evaluated in does not matter either.
+    """
+    variable, offset = array_access.split_index(node.index)
+    address = self._address_of(node.name, variable)
+    if not self._moves_that(node.value, address):
+      offset = self._point_that(node.name, node.index)
+      self.compile_expression(node.value)
+      self.vm_writer.write_pop(vm_writing.VMSegment.THAT, offset)
+    elif code_motion.is_movable(node.value) and code_motion.is_movable(node.index):
+      self.compile_expression(node.value)
+      offset = self._point_that(node.name, node.index)
+      self.vm_writer.write_pop(vm_writing.VMSegment.THAT, offset)
+    else:
+      self.vm_writer.write_push(*self._segment_of(node.name))
+      if variable is not None:
+        self.compile_expression(variable)
+        self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+      self.compile_expression(node.value)
+      self.vm_writer.write_pop(vm_writing.VMSegment.TEMP, 0)
+      self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 1)
+      # e may have changed what a[i] names since it was computed
+      self.that.forget()
+      self.vm_writer.write_push(vm_writing.VMSegment.TEMP, 0)
+      self.vm_writer.write_pop(vm_writing.VMSegment.THAT, offset)
+
+  def _point_that(self, name: str, index: jack_ast.Expression) -> int:
+    """Point `pointer 1` at name[index] unless it already does, returning the offset of the element from it."""
+    variable, offset = array_access.split_index(index)
+    address = self._address_of(name, variable)
+    if not self.that.holds(address):
+      self.vm_writer.write_push(*self._segment_of(name))
+      if variable is not None:
+        self.compile_expression(variable)
+        self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.ADD)
+      self.vm_writer.write_pop(vm_writing.VMSegment.POINTER, 1)
+      self.that.point_at(address)
+    return offset
+
+  def _address_of(self, name: str, variable: Optional[jack_ast.Expression]) -> Optional[array_access.Address]:
+    return array_access.address_of(name, variable, lambda n: self._get_symbol_table(n).kind_of(n))
+
+  def _moves_that(self, node: jack_ast.Expression, address: Optional[array_access.Address]) -> bool:
+    """Could evaluating the expression leave `pointer 1` pointing somewhere other than address?"""
+    arrays = [n for n in jack_ast.walk(node) if isinstance(n, jack_ast.ArrayRef)]
+    if not arrays:
+      # calls restore it on return
+      return False
+    if address is None or not code_motion.is_movable(node):
+      return True
+    return any(self._address_of(n.name, array_access.split_index(n.index)[0]) != address for n in arrays)
+
+  def _write_call(self, name: str, n_args: int) -> None:
+    self.vm_writer.write_call(name, n_args)
+    self.that.called()
+
+  def _write_label(self, label: str) -> None:
+    self.vm_writer.write_label(label)
+    # control can also arrive from a jump
+    self.that.forget()
+
+  def _push_constant(self, value: int) -> None:
+    """Push an int, which after constant folding may be negative."""
+    if value >= 0:
+      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, value)
+    elif value == constant_folding.WORD_MIN:
+      # 32768 is not a valid constant, but ~32767 is -32768
+      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, 32767)
+      self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NOT)
+    else:
+      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, -value)
+      self.vm_writer.write_arithmetic(vm_writing.VMArithmetic.NEG)
+
+  def _write_new_string(self, value: str) -> None:
+    """Build a new String holding value on the heap."""
+    self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, len(value))
+    self._write_call("String.new", 1)
+    for s in value:
+      self.vm_writer.write_push(vm_writing.VMSegment.CONSTANT, ord(s))
+      self._write_call("String.appendChar", 2)
+
+  def _push_pooled_string(self, value: str) -> None:
+    """
+    Push the String the class shares for a literal, building it the first time.
+    Jack has no class initializers, so a null static marks it as not built yet.
+    """
+    if value not in self.string_pool:
+      self.string_pool[value] = self.first_pool_static + len(self.string_pool)
+    index = self.string_pool[value]
+    built_label = self.label_incrementer(STRING_SUFFIX)
+    self.vm_writer.write_push(vm_writing.VMSegment.STATIC, index)
+    self.vm_writer.write_if(built_label)
+    self._write_new_string(value)
+    self.vm_writer.write_pop(vm_writing.VMSegment.STATIC, index)
+    self._write_label(built_label)
+    self.vm_writer.write_push(vm_writing.VMSegment.STATIC, index)
+
+  def _is_folded_true(self, node: jack_ast.Expression) -> bool:
+    """True if folding left a constant true condition, which needs no test."""
+    return optimization.Optimization.CONSTANT_FOLDING in self.optimizations and \
+      constant_folding.constant_value(node) == constant_folding.TRUE
+
   def _get_symbol_table(self, identifier: str) -> symbol_table.SymbolTable:
-    try:
-      self.subroutine_symbols.kind_of(identifier)
-    except KeyError: return self.class_symbols
-    return self.subroutine_symbols
+    if identifier in self.subroutine_symbols.data:
+      return self.subroutine_symbols
+    if identifier in self.class_symbols.data:
+      return self.class_symbols
+    raise ValueError(f"undefined variable {identifier} in {self.input_path}")
+
+  def _is_defined(self, identifier: str) -> bool:
+    return identifier in self.subroutine_symbols.data or identifier in self.class_symbols.data
+
+  def _segment_of(self, identifier: str) -> Tuple[vm_writing.VMSegment, int]:
+    """Return the VM segment and index a variable lives at."""
+    table = self._get_symbol_table(identifier)
+    return KIND_SEGMENTS[table.kind_of(identifier)], table.index_of(identifier)
 
 def get_label_incrementer(classname: str) -> Callable[[], str]:
   i = 0
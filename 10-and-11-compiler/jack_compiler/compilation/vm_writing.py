@@ -1,12 +1,15 @@
 """This module contains the VMWriter class."""
 
-from typing import Union
+from typing import List, Optional, TextIO, Union
 import abc
-import os
 import enum
+import os
 
 from jack_compiler import lexicon
 
+# bytes of VM code a FileWriter buffers before writing them out
+DEFAULT_FLUSH_THRESHOLD = 64 * 1024
+
 class VMSegment(str, enum.Enum):
   CONSTANT = 'constant'
   ARGUMENT = 'argument'
@@ -37,20 +40,72 @@ class OutputWriter(abc.ABC):
   def close(self) -> None:
     ...
 
+  def abort(self) -> None:
+    """Discard the output, e.g. when its class failed to compile."""
+
 class FileWriter(OutputWriter):
-  def __init__(self, output_path: str) -> None:
+  """
+  Writes commands to the output path through a single open file. Commands
+  are buffered and written in one go once flush_threshold bytes are
+  pending, and on close, which must be called to finish the file. As
+  before buffering, nothing is created until the first command is flushed,
+  and abort deletes whatever was written so far.
+  """
+  def __init__(self, output_path: str, flush_threshold: int = DEFAULT_FLUSH_THRESHOLD) -> None:
     self.output_path = output_path
+    self.flush_threshold = flush_threshold
     if os.path.exists(self.output_path):
       os.remove(self.output_path)
+    self._file: Optional[TextIO] = None
+    self._buffer: List[str] = []
+    self._buffered_bytes = 0
 
   def write(self, cmd: str) -> None:
-    with open(self.output_path, 'a') as f:
-      f.write(cmd)
-      f.write("\n")
-    
+    self._buffer.append(cmd)
+    self._buffered_bytes += len(cmd) + 1
+    if self._buffered_bytes >= self.flush_threshold:
+      self.flush()
+
+  def flush(self) -> None:
+    """Write the buffered commands to the file."""
+    if not self._buffer:
+      return
+    if self._file is None:
+      self._file = open(self.output_path, 'w')
+    self._buffer.append("")
+    self._file.write("\n".join(self._buffer))
+    self._file.flush()
+    self._buffer.clear()
+    self._buffered_bytes = 0
+
+  def close(self) -> None:
+    self.flush()
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def abort(self) -> None:
+    self._buffer.clear()
+    self._buffered_bytes = 0
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+      os.remove(self.output_path)
+
+class MemoryWriter(OutputWriter):
+  """Keeps the commands in memory, for callers that use the VM code directly."""
+  def __init__(self) -> None:
+    self.commands: List[str] = []
+
+  def write(self, cmd: str) -> None:
+    self.commands.append(cmd)
+
   def close(self) -> None:
     ...
 
+  def abort(self) -> None:
+    self.commands.clear()
+
 class StdOutWriter(OutputWriter):
   """Useful for debugging"""
   def write(self, cmd: str) -> None:
@@ -75,28 +130,8 @@ class VMWriter:
 
   def write_arithmetic(self, command: Union[lexicon.Symbols, VMArithmetic]) -> None:
     """Write a VM arithmetic-logical command."""
-    if isinstance(command, VMArithmetic):
-      self.output_writer.write(command.value)
-      return
-    if command == lexicon.Symbols.PLUS:
-      cmd = VMArithmetic.ADD
-    elif command == lexicon.Symbols.MINUS:
-      cmd = VMArithmetic.SUB
-    elif command == lexicon.Symbols.LT:
-      cmd = VMArithmetic.LT
-    elif command == lexicon.Symbols.GT:
-      cmd = VMArithmetic.GT
-    elif command == lexicon.Symbols.TILDA:
-      cmd = VMArithmetic.NOT
-    elif command == lexicon.Symbols.AMPERSAND:
-      cmd = VMArithmetic.AND
-    elif command == lexicon.Symbols.PIPE:
-      cmd = VMArithmetic.OR
-    elif command == lexicon.Symbols.EQ:
-      cmd = VMArithmetic.EQ
-    else: raise ValueError(command)
-    self.output_writer.write(cmd.value)
-  
+    self.output_writer.write(to_vm_arithmetic(command).value)
+
   def write_label(self, label: str) -> None:
     """Write a VM label comamnd."""
     cmd = f"label {label}"
@@ -129,3 +164,30 @@ class VMWriter:
   def close(self) -> None:
     """Close the output file / stream"""
     self.output_writer.close()
+
+  def abort(self) -> None:
+    """Discard the output written so far"""
+    self.output_writer.abort()
+
+
+def to_vm_arithmetic(command: Union[lexicon.Symbols, VMArithmetic]) -> VMArithmetic:
+  """The VM command of a binary operator symbol, or of ~ for not."""
+  if isinstance(command, VMArithmetic):
+    return command
+  if command == lexicon.Symbols.PLUS:
+    return VMArithmetic.ADD
+  elif command == lexicon.Symbols.MINUS:
+    return VMArithmetic.SUB
+  elif command == lexicon.Symbols.LT:
+    return VMArithmetic.LT
+  elif command == lexicon.Symbols.GT:
+    return VMArithmetic.GT
+  elif command == lexicon.Symbols.TILDA:
+    return VMArithmetic.NOT
+  elif command == lexicon.Symbols.AMPERSAND:
+    return VMArithmetic.AND
+  elif command == lexicon.Symbols.PIPE:
+    return VMArithmetic.OR
+  elif command == lexicon.Symbols.EQ:
+    return VMArithmetic.EQ
+  else: raise ValueError(command)
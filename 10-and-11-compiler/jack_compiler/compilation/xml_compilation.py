@@ -1,495 +1,309 @@
-"""This module contains an XML Compilation Engine."""
+"""This module contains an XML Compilation Engine, and a backend writing the tokens of a class as XML."""
 
-from lxml import etree as et
+from typing import Any, Iterator, List, Optional, TextIO
+from xml.sax.saxutils import escape
 import xml.etree.ElementTree as ET
-import copy
+import contextlib
+import enum
 
 from jack_compiler.compilation import base
-from jack_compiler import lexicon
+from jack_compiler import jack_ast, jack_tokenizer, lexicon, token_table
+
+INDENT = '  '
+
+TOKEN_TAGS = {
+  lexicon.TokenType.KEYWORD: 'keyword',
+  lexicon.TokenType.SYMBOL: 'symbol',
+  lexicon.TokenType.IDENTIFIER: 'identifier',
+  lexicon.TokenType.INT_CONST: 'integerConstant',
+  lexicon.TokenType.STRING_CONST: 'stringConstant',
+}
+
+
+class XMLWriter:
+  """
+  Writes elements to a file as they are produced, laid out the way
+  ElementTree.indent lays out a finished tree, so no tree is kept.
+  """
+  def __init__(self, f: TextIO) -> None:
+    self.f = f
+    # the open elements, and whether anything was written inside each yet
+    self._tags: List[str] = []
+    self._has_children: List[bool] = []
+
+  def start(self, tag: str) -> None:
+    self._begin_child()
+    self.f.write(f"<{tag}>")
+    self._tags.append(tag)
+    self._has_children.append(False)
+
+  def end(self) -> None:
+    tag = self._tags.pop()
+    if self._has_children.pop():
+      self.f.write("\n" + INDENT * len(self._tags))
+    self.f.write(f"</{tag}>")
+
+  def element(self, tag: str, text: str) -> None:
+    self._begin_child()
+    self.f.write(f"<{tag}>{escape(text)}</{tag}>")
+
+  def _begin_child(self) -> None:
+    if self._tags:
+      self._has_children[-1] = True
+      self.f.write("\n" + INDENT * len(self._tags))
 
-parser = et.XMLParser(remove_blank_text=True)
 
 class XMLCompilationEngine(base.CompilationEngine):
-  def __init__(self, input_path: str, output_path: str, display_symbol_table: bool= False) -> None:
-    super().__init__(input_path, output_path)
-    self.tokenizer.advance()
-    self._parent_element = None
+  output_suffix = 'xml'
+
+  def __init__(self, input_path: str, output_path: str, display_symbol_table: bool= False,
+               table: Optional[token_table.TokenTable] = None, streaming: bool = False,
+               tree: Optional[jack_ast.Class] = None) -> None:
+    super().__init__(input_path, output_path, table, streaming, tree)
+    self._xml: Optional[XMLWriter] = None
     if display_symbol_table:
       raise NotImplementedError("Haven't implemented symbol table display")
 
   def compile_class(self) -> None:
-    assert self.tokenizer.keyword() == lexicon.KeywordTypes.CLASS
-    self.root = et.Element("class")
-    self._parent_element = self.root
-    class_element = et.SubElement(self.root, 'keyword')
-    class_element.text = ' class '
-    self.tokenizer.advance()
-    classname_id = et.SubElement(self.root, 'identifier')
-    classname_id.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    assert (v := self.tokenizer.symbol().value) == '{'
-    open_body = et.SubElement(self.root, 'symbol')
-    open_body.text = f" {v} "
-    temp = self._parent_element
-    self.tokenizer.advance()
-    self._parent_element = temp
-
-    while self.tokenizer.token_type() != lexicon.TokenType.SYMBOL:
-      print(self.tokenizer.input_stream)
-      print(self.tokenizer._current_token)
-      keyword = self.tokenizer.keyword()
-      # is a class var dec
-      if keyword in {lexicon.KeywordTypes.STATIC, lexicon.KeywordTypes.FIELD}:
-        self.compile_class_var_dec()
-      # is subroutine dec
-      elif keyword in {lexicon.KeywordTypes.CONSTRUCTOR, lexicon.KeywordTypes.FUNCTION, lexicon.KeywordTypes.METHOD}:
-        self.compile_subroutine_dec()
-      else: raise ValueError(f"Should have been a classvardec or a subroutinedec, got {keyword}")
-
-    assert (v := self.tokenizer.symbol().value) == '}'
-    close_body = et.SubElement(self.root, 'symbol'); close_body.text = f" {v} "
-    print_tree(self.root)
+    node = self.parse()
     with open(self.output_path, 'w') as f:
-      f.write(get_element_tree_string(self.root))
-      
-  def compile_class_var_dec(self) -> None:
+      self._xml = XMLWriter(f)
+      with self._within('class'):
+        self._keyword(lexicon.KeywordTypes.CLASS)
+        self._identifier(node.name)
+        self._symbol(lexicon.Symbols.LEFT_CURLY)
+        for class_var_dec in node.class_var_decs:
+          self.compile_class_var_dec(class_var_dec)
+        for subroutine_dec in node.subroutine_decs:
+          self.compile_subroutine_dec(subroutine_dec)
+        self._symbol(lexicon.Symbols.RIGHT_CURLY)
+
+  def compile_class_var_dec(self, node: jack_ast.ClassVarDec) -> None:
     """Compiles a static variable or class variable declaration."""
-    classvardec = et.SubElement(self._parent_element, "classVarDec")
-    keyword = et.SubElement(classvardec, 'keyword')
-    keyword.text = f" {self.tokenizer.keyword().value} "
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      type_identifier = et.SubElement(classvardec, 'keyword')
-      type_identifier.text = f" {self.tokenizer.keyword().value} "
-    elif self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      classname = et.SubElement(classvardec, 'identifier')
-      classname.text = f" {self.tokenizer.identifier()} "
-    else: raise ValueError(f"Expected type declaration or classname, but got {self.tokenizer.token_type()}")
-    self.tokenizer.advance()
-    varname = et.SubElement(classvardec, 'identifier')
-    varname.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    while self.tokenizer.symbol() != lexicon.Symbols.SEMICOLON:
-      comma = et.SubElement(classvardec, 'symbol')
-      comma.text = f" {self.tokenizer.symbol().value} "
-      self.tokenizer.advance()
-      varname = et.SubElement(classvardec, 'identifier')
-      varname.text = f" {self.tokenizer.identifier()} "
-      self.tokenizer.advance()
-    endline = et.SubElement(classvardec, 'symbol')
-    endline.text = f" {self.tokenizer.symbol().value} "
-    self.tokenizer.advance()
-
-
-  def compile_subroutine_dec(self) -> None:
+    with self._within('classVarDec'):
+      self._keyword(node.kind)
+      self._type(node.type_)
+      self._names(node.names)
+
+  def compile_subroutine_dec(self, node: jack_ast.SubroutineDec) -> None:
     """Compiles a complete method, function or constructor."""
-    subroutine_dec = et.SubElement(self._parent_element, 'subroutineDec')
-    subroutine_type = et.SubElement(subroutine_dec, 'keyword')
-    subroutine_type.text = f" {self.tokenizer.keyword().value} "
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      type_ = et.SubElement(subroutine_dec, 'keyword')
-      type_.text = f" {self.tokenizer.keyword().value} "
-    else:
-      id_ = et.SubElement(subroutine_dec, 'identifier')
-      id_.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    # now subroutine name
-    e = et.SubElement(subroutine_dec, 'identifier')
-    e.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    # open paran
-    e = et.SubElement(subroutine_dec, 'symbol')
-    e.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = subroutine_dec
-    # now paramater list
-    self.compile_parameter_list()
-    self._parent_element = temp
-    # close paran
-    e = et.SubElement(subroutine_dec, 'symbol')
-    e.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    # now subroutine body
-    temp = self._parent_element
-    self._parent_element = subroutine_dec
-    self.compile_subroutine_body()
-    self._parent_element = temp
-
-
-  def compile_parameter_list(self) -> None:
+    with self._within('subroutineDec'):
+      self._keyword(node.kind)
+      self._type(node.return_type)
+      self._identifier(node.name)
+      self._symbol(lexicon.Symbols.LEFT_PAREN)
+      self.compile_parameter_list(node.parameters)
+      self._symbol(lexicon.Symbols.RIGHT_PAREN)
+      self.compile_subroutine_body(node)
+
+  def compile_parameter_list(self, parameters: List[jack_ast.Parameter]) -> None:
     """Compiles a (possible empty) parameter list. Does not handle
     the enclosing '()'."""
-    paramlist = et.SubElement(self._parent_element, 'parameterList')
-    # no params
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
-      return
-    if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      type_ = et.SubElement(paramlist, 'identifier')
-      type_.text = f" {self.tokenizer.identifier()} "
-    else:
-      type_ = et.SubElement(paramlist, 'keyword')
-      type_.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    varname = et.SubElement(paramlist, 'identifier')
-    varname.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        self.tokenizer.symbol() == lexicon.Symbols.COMMA:
-      comma = et.SubElement(paramlist, 'symbol')
-      comma.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-        type_ = et.SubElement(paramlist, 'identifier')
-        type_.text = f" {self.tokenizer.identifier()} "
-      else:
-        type_ = et.SubElement(paramlist, 'keyword')
-        type_.text = f" {self.tokenizer.keyword()} "
-      self.tokenizer.advance()
-      varname = et.SubElement(paramlist, 'identifier')
-      varname.text = f" {self.tokenizer.identifier()} "
-      self.tokenizer.advance()
-
-  def compile_subroutine_body(self) -> None:
+    with self._within('parameterList'):
+      for i, parameter in enumerate(parameters):
+        if i:
+          self._symbol(lexicon.Symbols.COMMA)
+        self._type(parameter.type_)
+        self._identifier(parameter.name)
+
+  def compile_subroutine_body(self, node: jack_ast.SubroutineDec) -> None:
     """Complies a subroutine's body."""
-    subroutine_body = et.SubElement(self._parent_element, 'subroutineBody')
-    # open curly
-    e = et.SubElement(subroutine_body, 'symbol')
-    e.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-    temp = self._parent_element
-    self._parent_element = subroutine_body
-    while self.tokenizer.keyword() == lexicon.KeywordTypes.VAR:
-      self.compile_var_dec()
-      self.tokenizer.advance()
-    self._parent_element = temp
-
-    temp = self._parent_element
-    self._parent_element = subroutine_body
-    self.compile_statements()
-    self._parent_element = temp
-    # close curly
-    e = et.SubElement(subroutine_body, 'symbol')
-    e.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-  def compile_var_dec(self) -> None:
+    with self._within('subroutineBody'):
+      self._symbol(lexicon.Symbols.LEFT_CURLY)
+      for var_dec in node.var_decs:
+        self.compile_var_dec(var_dec)
+      self.compile_statements(node.statements)
+      self._symbol(lexicon.Symbols.RIGHT_CURLY)
+
+  def compile_var_dec(self, node: jack_ast.VarDec) -> None:
     """Compiles a var declaration."""
-    vardec = et.SubElement(self._parent_element, 'varDec')   
-    var = et.SubElement(vardec, 'keyword')
-    var.text = f" {self.tokenizer.keyword().value} " # should be 'var'
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      type_ = et.SubElement(vardec, 'keyword')
-      type_.text = f" {self.tokenizer.keyword().value} "
-    else:
-      id_ = et.SubElement(vardec, 'identifier')
-      id_.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    varname = et.SubElement(vardec, 'identifier')
-    varname.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-
-    while self.tokenizer.symbol() != lexicon.Symbols.SEMICOLON:
-      comma = et.SubElement(vardec, 'symbol')
-      comma.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      extended_varname = et.SubElement(vardec, 'identifier')
-      extended_varname.text = f" {self.tokenizer.identifier()} "
-      self.tokenizer.advance()
-
-    end = et.SubElement(vardec, 'symbol')
-    end.text = f" {self.tokenizer.symbol()} "
-
-  def compile_statements(self) -> None:
+    with self._within('varDec'):
+      self._keyword(lexicon.KeywordTypes.VAR)
+      self._type(node.type_)
+      self._names(node.names)
+
+  def compile_statements(self, statements: List[jack_ast.Statement]) -> None:
     """Compiles a sequence of statements. Does not handle the
     enclosing '{}'."""
-    subroutine_body = et.SubElement(self._parent_element, 'statements')   
-    self._parent_element = subroutine_body
-    while True:
-      print()
-      print("stream:", self.tokenizer.input_stream)
-      print('current', self.tokenizer._current_token)
-      if self.tokenizer.token_type() != lexicon.TokenType.KEYWORD:
-        print('breaking - next item is not a statement')
-        break
-      if self.tokenizer.keyword() == lexicon.KeywordTypes.LET:
-        self.compile_let()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.IF:
-        self.compile_if()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.WHILE:
-        self.compile_while()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.DO:
-        self.compile_do()
-      elif self.tokenizer.keyword() == lexicon.KeywordTypes.RETURN:
-        self.compile_return()
-      else:
-        self.tokenizer.advance()
-        break
-    
-
-  def compile_let(self) -> None:
+    with self._within('statements'):
+      for statement in statements:
+        if isinstance(statement, jack_ast.LetStatement):
+          self.compile_let(statement)
+        elif isinstance(statement, jack_ast.IfStatement):
+          self.compile_if(statement)
+        elif isinstance(statement, jack_ast.WhileStatement):
+          self.compile_while(statement)
+        elif isinstance(statement, jack_ast.DoStatement):
+          self.compile_do(statement)
+        elif isinstance(statement, jack_ast.ReturnStatement):
+          self.compile_return(statement)
+        else: raise ValueError(statement)
+
+  def compile_let(self, node: jack_ast.LetStatement) -> None:
     """Compiles a let statement."""
-    let_statement = et.SubElement(self._parent_element, 'letStatement')   
-    let = et.SubElement(let_statement, 'keyword')
-    let.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    varname = et.SubElement(let_statement, 'identifier')
-    varname.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    # now, 0 or 1 expressions
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        self.tokenizer.symbol() == lexicon.Symbols.LEFT_SQR_PAREN:
-        left_paran = et.SubElement(let_statement, 'symbol')
-        left_paran.text = f" {self.tokenizer.symbol()} "
-        self.tokenizer.advance()
-        temp = self._parent_element
-        self._parent_element = let_statement
-        self.compile_expression()
-        self._parent_element = temp
-        assert self.tokenizer.symbol() == lexicon.Symbols.RIGHT_SQR_PAREN
-        right_paran = et.SubElement(let_statement, 'symbol')
-        right_paran.text = f" {self.tokenizer.symbol()} "
-        self.tokenizer.advance()
-    eq = et.SubElement(let_statement, 'symbol')
-    eq.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = let_statement
-    self.compile_expression()
-    self._parent_element = temp
-    # now, semicolon
-    assert self.tokenizer.symbol() == lexicon.Symbols.SEMICOLON
-    end = et.SubElement(let_statement, 'symbol')
-    end.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-  def compile_if(self) -> None:
+    with self._within('letStatement'):
+      self._keyword(lexicon.KeywordTypes.LET)
+      self._identifier(node.name)
+      if node.index is not None:
+        self._symbol(lexicon.Symbols.LEFT_SQR_PAREN)
+        self.compile_expression(node.index)
+        self._symbol(lexicon.Symbols.RIGHT_SQR_PAREN)
+      self._symbol(lexicon.Symbols.EQ)
+      self.compile_expression(node.value)
+      self._symbol(lexicon.Symbols.SEMICOLON)
+
+  def compile_if(self, node: jack_ast.IfStatement) -> None:
     """Compiles an if statement."""
-    if_statement = et.SubElement(self._parent_element, 'ifStatement')   
-    if_kw = et.SubElement(if_statement, 'keyword')
-    if_kw.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    open_paran = et.SubElement(if_statement, 'symbol')
-    open_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = if_statement
-    self.compile_expression()
-    self._parent_element = temp
-    close_paran = et.SubElement(if_statement, 'symbol')
-    close_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-    open_paran = et.SubElement(if_statement, 'symbol')
-    open_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = if_statement
-    self.compile_statements()
-    assert self.tokenizer.symbol() == lexicon.Symbols.RIGHT_CURLY
-    self._parent_element = temp
-    close_paran = et.SubElement(if_statement, 'symbol')
-    close_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-    if self.tokenizer.token_type() == lexicon.TokenType.KEYWORD and \
-        self.tokenizer.keyword() == lexicon.KeywordTypes.ELSE:
-      else_kw = et.SubElement(if_statement, 'keyword')
-      else_kw.text = f" {self.tokenizer.keyword()} "
-      self.tokenizer.advance()
-      open_paran = et.SubElement(if_statement, 'symbol')
-      open_paran.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      temp = self._parent_element
-      self._parent_element = if_statement
-      self.compile_statements()
-      self._parent_element = temp
-      close_paran = et.SubElement(if_statement, 'symbol')
-      close_paran.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-
-  def compile_while(self) -> None:
+    with self._within('ifStatement'):
+      self._keyword(lexicon.KeywordTypes.IF)
+      self._symbol(lexicon.Symbols.LEFT_PAREN)
+      self.compile_expression(node.condition)
+      self._symbol(lexicon.Symbols.RIGHT_PAREN)
+      self._block(node.then_statements)
+      if node.else_statements is not None:
+        self._keyword(lexicon.KeywordTypes.ELSE)
+        self._block(node.else_statements)
+
+  def compile_while(self, node: jack_ast.WhileStatement) -> None:
     """Compiles a while statement."""
-    while_statement = et.SubElement(self._parent_element, 'whileStatement')   
-    while_kw = et.SubElement(while_statement, 'keyword')
-    while_kw.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    open_paran = et.SubElement(while_statement, 'symbol')
-    open_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = while_statement
-    self.compile_expression()
-    close_paran = et.SubElement(while_statement, 'symbol')
-    close_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    # now, statements
-    open_paran = et.SubElement(while_statement, 'symbol')
-    open_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    self.compile_statements()
-    close_paran = et.SubElement(while_statement, 'symbol')
-    close_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    self._parent_element = temp
-
-  def compile_do(self) -> None:
+    with self._within('whileStatement'):
+      self._keyword(lexicon.KeywordTypes.WHILE)
+      self._symbol(lexicon.Symbols.LEFT_PAREN)
+      self.compile_expression(node.condition)
+      self._symbol(lexicon.Symbols.RIGHT_PAREN)
+      self._block(node.statements)
+
+  def compile_do(self, node: jack_ast.DoStatement) -> None:
     """Compile a do statement"""
-    do_statement = et.SubElement(self._parent_element, 'doStatement')   
-    do = et.SubElement(do_statement, 'keyword')
-    do.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = do_statement
-    self.compile_subroutine_call()
-    self._parent_element = temp
-    self.tokenizer.advance()
-    close = et.SubElement(do_statement, 'symbol')
-    close.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-  def compile_return(self) -> None:
+    with self._within('doStatement'):
+      self._keyword(lexicon.KeywordTypes.DO)
+      self.compile_subroutine_call(node.call)
+      self._symbol(lexicon.Symbols.SEMICOLON)
+
+  def compile_return(self, node: jack_ast.ReturnStatement) -> None:
     """Compile a return statement."""
-    return_statement = et.SubElement(self._parent_element, 'returnStatement')
-    close = et.SubElement(return_statement, 'keyword')
-    close.text = f" {self.tokenizer.keyword()} "
-    self.tokenizer.advance()
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
-      close = et.SubElement(return_statement, 'symbol')
-      close.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      return
-    temp = self._parent_element
-    self._parent_element = return_statement
-    self.compile_expression()
-    self._parent_element = temp
-    close = et.SubElement(return_statement, 'symbol')
-    close.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-
-
-  def compile_subroutine_call(self) -> None:
-    # subroutine_call = et.SubElement(self._parent_element, 'subroutineCall')
-    subroutine_call = self._parent_element
-    caller_name = et.SubElement(subroutine_call, 'identifier')   
-    caller_name.text = f" {self.tokenizer.identifier()} "
-    self.tokenizer.advance()
-    if self.tokenizer.symbol() == lexicon.Symbols.PERIOD:
-      period = et.SubElement(subroutine_call, 'symbol')   
-      period.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      subroutine_name = et.SubElement(subroutine_call, 'identifier')   
-      subroutine_name.text = f" {self.tokenizer.identifier()} "
-      self.tokenizer.advance()
-    open_paran = et.SubElement(subroutine_call, 'symbol')   
-    open_paran.text = f" {self.tokenizer.symbol()} "
-    self.tokenizer.advance()
-    temp = self._parent_element
-    self._parent_element = subroutine_call
-    self.compile_expression_list() 
-    self._parent_element = temp
-    close_paran = et.SubElement(subroutine_call, 'symbol')   
-    close_paran.text = f" {self.tokenizer.symbol()} "
-
-  def compile_expression(self) -> None:
+    with self._within('returnStatement'):
+      self._keyword(lexicon.KeywordTypes.RETURN)
+      if node.value is not None:
+        self.compile_expression(node.value)
+      self._symbol(lexicon.Symbols.SEMICOLON)
+
+  def compile_subroutine_call(self, node: jack_ast.SubroutineCall) -> None:
+    # the grammar has no subroutineCall element: emitted into the parent
+    if node.receiver is not None:
+      self._identifier(node.receiver)
+      self._symbol(lexicon.Symbols.PERIOD)
+    self._identifier(node.name)
+    self._symbol(lexicon.Symbols.LEFT_PAREN)
+    self.compile_expression_list(node.args)
+    self._symbol(lexicon.Symbols.RIGHT_PAREN)
+
+  def compile_expression(self, node: jack_ast.Expression) -> None:
     """Compiles an expression."""
-    expression = et.SubElement(self._parent_element, 'expression')   
-    temp = self._parent_element
-    self._parent_element = expression
-    self.compile_term()
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-          lexicon.Symbols.is_op(self.tokenizer.symbol()):
-      op = et.SubElement(expression, 'symbol')
-      op.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      self.compile_term()
-    self._parent_element = temp
-
-  def compile_term(self) -> None:
-    """Compiles a term. Must do lookahead (LL2)."""
-    term = et.SubElement(self._parent_element, 'term')   
-    temp = self._parent_element
-    self._parent_element = term
-    if self.tokenizer.token_type() == lexicon.TokenType.IDENTIFIER:
-      # need LL(2)
-      lookahead_tokenizer = copy.deepcopy(self.tokenizer)
-      lookahead_tokenizer.advance()
-      # a subroutine call
-      if lookahead_tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-          lookahead_tokenizer.symbol() in {lexicon.Symbols.LEFT_PAREN, lexicon.Symbols.PERIOD}:
-        self.compile_subroutine_call()
-        self.tokenizer.advance()
+    # undo the left grouping of binary operators: term (op term)*
+    operations = []
+    while isinstance(node, jack_ast.BinaryOp):
+      operations.append((node.op, node.right))
+      node = node.left
+    with self._within('expression'):
+      self.compile_term(node)
+      for op, term in reversed(operations):
+        self._symbol(op)
+        self.compile_term(term)
+
+  def compile_term(self, node: jack_ast.Expression) -> None:
+    """Compiles a term."""
+    with self._within('term'):
+      if isinstance(node, jack_ast.SubroutineCall):
+        self.compile_subroutine_call(node)
+      elif isinstance(node, jack_ast.VarRef):
+        self._identifier(node.name)
+      elif isinstance(node, jack_ast.ArrayRef):
+        self._identifier(node.name)
+        self._symbol(lexicon.Symbols.LEFT_SQR_PAREN)
+        self.compile_expression(node.index)
+        self._symbol(lexicon.Symbols.RIGHT_SQR_PAREN)
+      elif isinstance(node, jack_ast.KeywordConstant):
+        self._keyword(node.keyword)
+      elif isinstance(node, jack_ast.IntegerConstant):
+        self._element('integerConstant', node.value)
+      elif isinstance(node, jack_ast.StringConstant):
+        self._element('stringConstant', node.value)
+      elif isinstance(node, (jack_ast.Parenthesized, jack_ast.BinaryOp)):
+        self._symbol(lexicon.Symbols.LEFT_PAREN)
+        self.compile_expression(node.expression if isinstance(node, jack_ast.Parenthesized) else node)
+        self._symbol(lexicon.Symbols.RIGHT_PAREN)
+      elif isinstance(node, jack_ast.UnaryOp):
+        self._symbol(node.op)
+        self.compile_term(node.operand)
       else:
-        term_name = et.SubElement(term, 'identifier')
-        term_name.text = f" {self.tokenizer.identifier()} "
-        self.tokenizer.advance()
-        if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-            self.tokenizer.symbol() == lexicon.Symbols.LEFT_SQR_PAREN:
-          open_paren = et.SubElement(term, 'symbol')
-          open_paren.text = f" {self.tokenizer.symbol()} "
-          self.tokenizer.advance()
-          self.compile_expression()
-          close_paren = et.SubElement(term, 'symbol')
-          close_paren.text = f" {self.tokenizer.symbol()} "
-          self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.KEYWORD:
-      term_name = et.SubElement(term, 'keyword')
-      term_name.text = f" {self.tokenizer.keyword()} "
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.INT_CONST:
-      int_val = et.SubElement(term, 'integerConstant')
-      int_val.text = f" {self.tokenizer.int_val()} "
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.STRING_CONST:
-      str_val = et.SubElement(term, 'stringConstant')
-      str_val.text = f" {self.tokenizer.string_val()} "
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        self.tokenizer.symbol() == lexicon.Symbols.LEFT_PAREN:
-      open_paren = et.SubElement(term, 'symbol')
-      open_paren.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      self.compile_expression()
-      close_paren = et.SubElement(term, 'symbol')
-      close_paren.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-    elif self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
-        lexicon.Symbols.is_unary_op(self.tokenizer.symbol()):
-      op = et.SubElement(term, 'symbol')
-      op.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      self.compile_term()
-    else:
-      raise ValueError()
-    self._parent_element = temp
-
+        raise ValueError(node)
 
-  def compile_expression_list(self) -> None:
+  def compile_expression_list(self, expressions: List[jack_ast.Expression]) -> None:
     """Compiles a (possibly empty) comma-seperated
     list of expressions."""
-    expression_list = et.SubElement(self._parent_element, 'expressionList')   
-    temp = self._parent_element
-    self._parent_element = expression_list
-    if self.tokenizer.token_type() == lexicon.TokenType.SYMBOL:
-      if not self.tokenizer.symbol() == lexicon.Symbols.LEFT_PAREN:
-        return
-    self.compile_expression()
-    while self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and self.tokenizer.symbol() == lexicon.Symbols.COMMA:
-      comma = et.SubElement(expression_list, 'symbol')
-      comma.text = f" {self.tokenizer.symbol()} "
-      self.tokenizer.advance()
-      self.compile_expression()
-    self._parent_element = temp
-
-def get_element_tree_string(element: et.Element) -> str:
-    ET.indent(element)
-    return ET.tostring(element, encoding='unicode', short_empty_elements=False)
-
-def print_tree(element: et.Element) -> None:
-    print(get_element_tree_string(element))
+    with self._within('expressionList'):
+      for i, expression in enumerate(expressions):
+        if i:
+          self._symbol(lexicon.Symbols.COMMA)
+        self.compile_expression(expression)
+
+  def _block(self, statements: List[jack_ast.Statement]) -> None:
+    self._symbol(lexicon.Symbols.LEFT_CURLY)
+    self.compile_statements(statements)
+    self._symbol(lexicon.Symbols.RIGHT_CURLY)
+
+  def _names(self, names: List[str]) -> None:
+    for i, name in enumerate(names):
+      if i:
+        self._symbol(lexicon.Symbols.COMMA)
+      self._identifier(name)
+    self._symbol(lexicon.Symbols.SEMICOLON)
+
+  def _type(self, type_: str) -> None:
+    if jack_ast.is_primitive_type(type_):
+      self._element('keyword', type_)
+    else:
+      self._identifier(type_)
+
+  def _keyword(self, keyword: lexicon.KeywordTypes) -> None:
+    self._element('keyword', keyword.value)
+
+  def _symbol(self, symbol: lexicon.Symbols) -> None:
+    self._element('symbol', symbol.value)
+
+  def _identifier(self, name: str) -> None:
+    self._element('identifier', name)
+
+  def _element(self, tag: str, text: Any) -> None:
+    self._xml.element(tag, f" {text} ")
+
+  @contextlib.contextmanager
+  def _within(self, tag: str) -> Iterator[None]:
+    """Make a new element the parent of everything emitted in the block."""
+    self._xml.start(tag)
+    yield
+    self._xml.end()
+
+
+class TokenXMLBackend(base.Backend):
+  """Writes the tokens of a class as XML, e.g. Main.jack's to MainT.xml."""
+  output_suffix = 'T.xml'
+
+  @classmethod
+  def output_path_for(cls, source_file: str) -> str:
+    return source_file.replace(".jack", cls.output_suffix)
+
+  def compile_class(self) -> None:
+    table = self._table if self._table is not None else jack_tokenizer.tokenize_file(self.input_path)
+    with open(self.output_path, 'w') as f:
+      xml = XMLWriter(f)
+      xml.start('tokens')
+      for token in table:
+        value = token.value
+        xml.element(TOKEN_TAGS[token.token_type], f" {value.value if isinstance(value, enum.Enum) else value} ")
+      xml.end()
+
 
 def simple_xml_eq_check(file1, file2):
   tree1 = ET.parse(file1)
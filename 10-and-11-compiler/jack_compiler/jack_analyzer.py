@@ -1,34 +1,187 @@
 """The JackAnalyzer is the top-most module used to run compilation."""
 
-from typing import List, Type
+from typing import FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type, Union
+import concurrent.futures
+import contextlib
+import functools
+import io
 import os
 
-from jack_compiler.compilation import base, xml_compilation, vm_compilation
+from jack_compiler import build_manifest, class_cache, jack_tokenizer, token_cache
+from jack_compiler.compilation import base, optimization, vm_compilation
+
+
+class CompilationError(ValueError):
+  """Raised once every file has been tried, listing each file that failed to compile."""
+  def __init__(self, errors: List[Tuple[str, str]]) -> None:
+    self.errors = errors
+    lines = [f"{len(errors)} file(s) failed to compile:"]
+    lines.extend(f"  {source_file}: {error}" for source_file, error in errors)
+    super().__init__("\n".join(lines))
+
+
+BackendType = Type[base.Backend]
+
+
+class CompileResult(NamedTuple):
+  output: str
+  error: Optional[str]
+  references: FrozenSet[str]
+
 
 class JackAnalyzer:
-  def __init__(self, input_path: str, compilation_engine: Type[base.CompilationEngine]) -> None:
+  """
+  Compiles every class of the input path. Classes compile independently
+  (symbol tables and labels are per class), so with jobs > 1 they are spread
+  over a process pool; output and errors are still reported in file order.
+  jobs=None uses one process per CPU.
+
+  Given several backends, e.g. VM and XML, each class is lexed and parsed
+  once and every backend writes its output from the same tokens and AST.
+
+  With incremental, a BuildManifest next to the sources records each build
+  and classes whose inputs did not change are not compiled again. A
+  ClassCache of parsed classes only helps a long-running process with
+  jobs=1, since pool workers get their own copy.
+  """
+  def __init__(self, input_path: str, compilation_engine: Union[BackendType, Sequence[BackendType]],
+               streaming: bool = False, cache: Optional[token_cache.TokenCache] = None,
+               optimizations: Iterable[optimization.Optimization] = (), jobs: Optional[int] = 1,
+               incremental: bool = False, trees: Optional[class_cache.ClassCache] = None) -> None:
     self.input_path = input_path
-    self.compilation_engine = compilation_engine
+    if isinstance(compilation_engine, type):
+      compilation_engine = [compilation_engine]
+    self.compilation_engines: Tuple[BackendType, ...] = tuple(compilation_engine)
+    if not self.compilation_engines:
+      raise ValueError("no backend to compile with")
+    if incremental and len(self.compilation_engines) > 1:
+      raise ValueError("incremental builds track one output per class, so they take a single backend")
+    self.streaming = streaming
+    self.cache = cache
+    self.optimizations = frozenset(optimizations)
+    self.jobs = jobs or os.cpu_count() or 1
+    self.incremental = incremental
+    self.trees = trees
 
   def analyze(self) -> None:
     """Analyze the Jack code"""
     source_files = get_jack_source_files(self.input_path)
-    for source_file in source_files:
-      if self.compilation_engine == xml_compilation.XMLCompilationEngine:
-        suffix = 'xml'
-      elif self.compilation_engine == vm_compilation.VMCompilationEngine:
-        suffix = 'vm'
-      else: raise ValueError()
-      output_path = get_output_path(source_file, suffix)
-      print(f"compiling {source_file} into {output_path}")
-      self.compilation_engine(source_file, output_path).compile_class()
+    output_paths = [tuple(engine.output_path_for(source_file) for engine in self.compilation_engines)
+                    for source_file in source_files]
+    manifest = None
+    if self.incremental:
+      manifest = self._load_manifest(self.compilation_engines[0].output_suffix)
+      stale = set(manifest.stale_sources(((s, o[0]) for s, o in zip(source_files, output_paths)),
+                                         bool(self.optimizations & optimization.WHOLE_PROGRAM_OPTIMIZATIONS)))
+      print(f"{len(source_files) - len(stale)} of {len(source_files)} classes up to date")
+      manifest.prune(source_files)
+      output_paths = [o for s, o in zip(source_files, output_paths) if s in stale]
+      source_files = [s for s in source_files if s in stale]
+    errors = []
+    results = zip(source_files, output_paths, self._compile_all(source_files, output_paths))
+    for source_file, paths, result in results:
+      print(f"compiling {source_file} into {', '.join(paths)}")
+      print(result.output, end='')
+      if result.error is not None:
+        errors.append((source_file, result.error))
+        if manifest is not None:
+          manifest.forget(source_file)
+      elif manifest is not None:
+        manifest.record(source_file, paths[0], result.references)
+    if manifest is not None and source_files:
+      manifest.save()
+    if errors:
+      raise CompilationError(errors)
+
+  def _load_manifest(self, suffix: str) -> build_manifest.BuildManifest:
+    source_dir = self.input_path if os.path.isdir(self.input_path) else os.path.dirname(self.input_path)
+    options = sorted(o.value for o in self.optimizations) if suffix == 'vm' else []
+    key = build_manifest.build_key(suffix, *options)
+    return build_manifest.BuildManifest.load(os.path.join(source_dir, build_manifest.MANIFEST_NAME), key)
+
+  def _compile_all(self, source_files: List[str],
+                   output_paths: List[Tuple[str, ...]]) -> Iterator[CompileResult]:
+    """Yield the result of compiling each file, in order."""
+    compile_ = functools.partial(compile_file, compilation_engines=self.compilation_engines,
+                                 streaming=self.streaming, cache=self.cache, optimizations=self.optimizations,
+                                 track_references=self.incremental, trees=self.trees)
+    if self.jobs == 1 or len(source_files) < 2:
+      yield from map(compile_, source_files, output_paths)
+      return
+    # a few chunks per worker amortizes the pickling without leaving workers idle at the end
+    chunksize = max(1, len(source_files) // (4 * self.jobs))
+    with concurrent.futures.ProcessPoolExecutor(self.jobs) as executor:
+      yield from executor.map(compile_, source_files, output_paths, chunksize=chunksize)
+
+
+def get_compilation_engine(compiler: str) -> BackendType:
+  """The backend for a compiler name: 'vm', 'xml' for the parse tree or 'tokens'."""
+  if compiler == 'vm':
+    return vm_compilation.VMCompilationEngine
+  if compiler == 'xml':
+    from jack_compiler.compilation import xml_compilation
+    return xml_compilation.XMLCompilationEngine
+  if compiler == 'tokens':
+    from jack_compiler.compilation import xml_compilation
+    return xml_compilation.TokenXMLBackend
+  raise ValueError(f"did not recognize {compiler=}")
+
+
+def get_compilation_engines(spec: str) -> List[BackendType]:
+  """The backends for a comma separated list of compiler names, such as 'vm,xml,tokens'."""
+  engines: List[BackendType] = []
+  for compiler in spec.split(','):
+    engine = get_compilation_engine(compiler.strip())
+    if engine not in engines:
+      engines.append(engine)
+  return engines
+
+
+def compile_file(source_file: str, output_paths: Sequence[str], compilation_engines: Sequence[BackendType],
+                 streaming: bool, cache: Optional[token_cache.TokenCache],
+                 optimizations: FrozenSet[optimization.Optimization],
+                 track_references: bool = False, trees: Optional[class_cache.ClassCache] = None) -> CompileResult:
+  """
+  Compile one class with every backend, returning what it printed, the
+  error message if it failed and, with track_references, the classes it
+  references. Runs in pool workers, so the output is captured to be
+  printed in file order rather than interleaved.
+  """
+  output = io.StringIO()
+  references: FrozenSet[str] = frozenset()
+  try:
+    table = tree = None
+    if trees is not None:
+      tree = trees.parse_file(source_file)
+    elif cache is not None and not streaming:
+      table = cache.tokenize_file(source_file)
+    elif len(compilation_engines) > 1 and not streaming:
+      # lex once for every backend
+      table = jack_tokenizer.tokenize_file(source_file)
+    for compilation_engine, output_path in zip(compilation_engines, output_paths):
+      kwargs = {}
+      if compilation_engine == vm_compilation.VMCompilationEngine:
+        # optimizations change the generated code, so the XML parse tree ignores them
+        kwargs['optimizations'] = optimizations
+      engine = compilation_engine(source_file, output_path, table=table, streaming=streaming, tree=tree, **kwargs)
+      with contextlib.redirect_stdout(output):
+        engine.compile_class()
+      # the passes copy what they change, so the next backend can take the same tree
+      tree = engine.tree
+    if track_references:
+      references = frozenset(build_manifest.referenced_classes(engine.parse()))
+  except (OSError, IndexError, ValueError) as e:
+    return CompileResult(output.getvalue(), str(e), references)
+  return CompileResult(output.getvalue(), None, references)
+
 
 def get_jack_source_files(path: str) -> List[str]:
-  """Get the list of Jack files in the input path as a list."""
+  """Get the list of Jack files in the input path as a list, sorted so output order is stable."""
   is_dir = os.path.isdir(path)
   if is_dir:
-    return [os.path.join(path, p) for p in os.listdir(path) if p.endswith(".jack")]
-  assert path.endswith(".jack")
+    return sorted(os.path.join(path, p) for p in os.listdir(path) if p.endswith(".jack"))
+  if not path.endswith(".jack"):
+    raise ValueError(f"{path} is not a directory or .jack file")
   return [path]
 
 
@@ -0,0 +1,270 @@
+"""This module contains the node classes of the Jack abstract syntax tree."""
+
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from jack_compiler import lexicon
+
+
+class Node:
+  """Base class of every AST node. Nodes only store their fields in slots."""
+  __slots__ = ()
+
+  def fields(self) -> Iterator[Tuple[str, Any]]:
+    """Yield the (name, value) pairs of the node's fields, in order."""
+    for cls in reversed(type(self).__mro__):
+      for name in getattr(cls, '__slots__', ()):
+        yield name, getattr(self, name)
+
+  def __eq__(self, other: Any) -> bool:
+    return type(self) is type(other) and list(self.fields()) == list(other.fields())
+
+  def __repr__(self) -> str:
+    args = ", ".join(f"{name}={value!r}" for name, value in self.fields())
+    return f"{type(self).__name__}({args})"
+
+
+# --- expressions ---
+
+class IntegerConstant(Node):
+  __slots__ = ('value',)
+
+  def __init__(self, value: int) -> None:
+    self.value = value
+
+
+class StringConstant(Node):
+  __slots__ = ('value',)
+
+  def __init__(self, value: str) -> None:
+    self.value = value
+
+
+class KeywordConstant(Node):
+  """true, false, null or this."""
+  __slots__ = ('keyword',)
+
+  def __init__(self, keyword: lexicon.KeywordTypes) -> None:
+    self.keyword = keyword
+
+
+class VarRef(Node):
+  __slots__ = ('name',)
+
+  def __init__(self, name: str) -> None:
+    self.name = name
+
+
+class ArrayRef(Node):
+  """name[index]"""
+  __slots__ = ('name', 'index')
+
+  def __init__(self, name: str, index: 'Expression') -> None:
+    self.name = name
+    self.index = index
+
+
+class SubroutineCall(Node):
+  """name(args) or receiver.name(args); receiver is a class or variable name."""
+  __slots__ = ('receiver', 'name', 'args')
+
+  def __init__(self, receiver: Optional[str], name: str, args: List['Expression']) -> None:
+    self.receiver = receiver
+    self.name = name
+    self.args = args
+
+
+class UnaryOp(Node):
+  __slots__ = ('op', 'operand')
+
+  def __init__(self, op: lexicon.Symbols, operand: 'Expression') -> None:
+    self.op = op
+    self.operand = operand
+
+
+class BinaryOp(Node):
+  """Jack has no operator precedence, so `a + b * c` is BinaryOp(*, BinaryOp(+, a, b), c)."""
+  __slots__ = ('op', 'left', 'right')
+
+  def __init__(self, op: lexicon.Symbols, left: 'Expression', right: 'Expression') -> None:
+    self.op = op
+    self.left = left
+    self.right = right
+
+
+class Parenthesized(Node):
+  """( expression ), kept so the parse tree can be reproduced exactly."""
+  __slots__ = ('expression',)
+
+  def __init__(self, expression: 'Expression') -> None:
+    self.expression = expression
+
+
+Expression = Union[IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayRef,
+                   SubroutineCall, UnaryOp, BinaryOp, Parenthesized]
+
+
+# --- statements ---
+
+class LetStatement(Node):
+  """let name = value; or let name[index] = value;"""
+  __slots__ = ('name', 'index', 'value')
+
+  def __init__(self, name: str, index: Optional[Expression], value: Expression) -> None:
+    self.name = name
+    self.index = index
+    self.value = value
+
+
+class IfStatement(Node):
+  __slots__ = ('condition', 'then_statements', 'else_statements')
+
+  def __init__(self, condition: Expression, then_statements: List['Statement'],
+               else_statements: Optional[List['Statement']]) -> None:
+    self.condition = condition
+    self.then_statements = then_statements
+    self.else_statements = else_statements
+
+
+class WhileStatement(Node):
+  __slots__ = ('condition', 'statements')
+
+  def __init__(self, condition: Expression, statements: List['Statement']) -> None:
+    self.condition = condition
+    self.statements = statements
+
+
+class DoStatement(Node):
+  __slots__ = ('call',)
+
+  def __init__(self, call: SubroutineCall) -> None:
+    self.call = call
+
+
+class ReturnStatement(Node):
+  __slots__ = ('value',)
+
+  def __init__(self, value: Optional[Expression]) -> None:
+    self.value = value
+
+
+Statement = Union[LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement]
+
+
+# --- declarations ---
+
+class ClassVarDec(Node):
+  """static|field type name (, name)*;"""
+  __slots__ = ('kind', 'type_', 'names')
+
+  def __init__(self, kind: lexicon.KeywordTypes, type_: str, names: List[str]) -> None:
+    self.kind = kind
+    self.type_ = type_
+    self.names = names
+
+
+class VarDec(Node):
+  __slots__ = ('type_', 'names')
+
+  def __init__(self, type_: str, names: List[str]) -> None:
+    self.type_ = type_
+    self.names = names
+
+
+class Parameter(Node):
+  __slots__ = ('type_', 'name')
+
+  def __init__(self, type_: str, name: str) -> None:
+    self.type_ = type_
+    self.name = name
+
+
+class SubroutineDec(Node):
+  """constructor|function|method return_type name(parameters) { var_decs statements }"""
+  __slots__ = ('kind', 'return_type', 'name', 'parameters', 'var_decs', 'statements')
+
+  def __init__(self, kind: lexicon.KeywordTypes, return_type: str, name: str,
+               parameters: List[Parameter], var_decs: List[VarDec], statements: List[Statement]) -> None:
+    self.kind = kind
+    self.return_type = return_type
+    self.name = name
+    self.parameters = parameters
+    self.var_decs = var_decs
+    self.statements = statements
+
+
+class Class(Node):
+  __slots__ = ('name', 'class_var_decs', 'subroutine_decs')
+
+  def __init__(self, name: str, class_var_decs: List[ClassVarDec], subroutine_decs: List[SubroutineDec]) -> None:
+    self.name = name
+    self.class_var_decs = class_var_decs
+    self.subroutine_decs = subroutine_decs
+
+
+PRIMITIVE_TYPES = frozenset(k.value for k in (
+  lexicon.KeywordTypes.INT, lexicon.KeywordTypes.CHAR, lexicon.KeywordTypes.BOOLEAN, lexicon.KeywordTypes.VOID))
+
+
+def is_primitive_type(type_: str) -> bool:
+  """True for int/char/boolean/void, which are keywords rather than class names."""
+  return type_ in PRIMITIVE_TYPES
+
+
+def walk(node: Node) -> Iterator[Node]:
+  """Yield the node and every node below it, in no particular order, like ast.walk."""
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    yield node
+    for _, value in node.fields():
+      if isinstance(value, Node):
+        pending.append(value)
+      elif isinstance(value, list):
+        pending.extend(item for item in value if isinstance(item, Node))
+
+
+class NodeTransformer:
+  """
+  Walks an AST and rebuilds it from the results of visit_<NodeClass>
+  methods, like ast.NodeTransformer. Unchanged subtrees are shared, never
+  copied, and the input tree is never mutated.
+
+  Inside a list field a visitor may return a node, a list of nodes to
+  splice in, or None to drop the node.
+  """
+  def visit(self, node: Node) -> Any:
+    visitor = getattr(self, f"visit_{type(node).__name__}", self.generic_visit)
+    return visitor(node)
+
+  def generic_visit(self, node: Node) -> Node:
+    changed = False
+    values = []
+    for _, value in node.fields():
+      if isinstance(value, Node):
+        new_value = self.visit(value)
+      elif isinstance(value, list):
+        new_value = self.visit_list(value)
+      else:
+        new_value = value
+      changed = changed or new_value is not value
+      values.append(new_value)
+    return type(node)(*values) if changed else node
+
+  def visit_list(self, nodes: List[Any]) -> List[Any]:
+    """Visit every node of a list field; returns the same list if nothing changed."""
+    result: List[Any] = []
+    changed = False
+    for node in nodes:
+      if not isinstance(node, Node):
+        result.append(node)
+        continue
+      new_node = self.visit(node)
+      if isinstance(new_node, list):
+        result.extend(new_node)
+        changed = True
+      elif new_node is None:
+        changed = True
+      else:
+        result.append(new_node)
+        changed = changed or new_node is not node
+    return result if changed else nodes
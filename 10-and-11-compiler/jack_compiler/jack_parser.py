@@ -0,0 +1,293 @@
+"""This module contains the JackParser, which builds an AST from the tokens of a class."""
+
+from typing import List, Optional
+
+from jack_compiler import jack_ast, jack_tokenizer, lexicon, token_table
+
+TYPE_KEYWORDS = frozenset({lexicon.KeywordTypes.INT, lexicon.KeywordTypes.CHAR,
+                           lexicon.KeywordTypes.BOOLEAN, lexicon.KeywordTypes.VOID})
+KEYWORD_CONSTANTS = frozenset({lexicon.KeywordTypes.TRUE, lexicon.KeywordTypes.FALSE,
+                               lexicon.KeywordTypes.NULL, lexicon.KeywordTypes.THIS})
+SUBROUTINE_KINDS = frozenset({lexicon.KeywordTypes.CONSTRUCTOR, lexicon.KeywordTypes.FUNCTION,
+                              lexicon.KeywordTypes.METHOD})
+
+
+class JackSyntaxError(ValueError):
+  """Raised when the token stream does not follow the Jack grammar."""
+
+
+class JackParser:
+  """
+  Recursive descent parser over a JackTokenizer. Needs a single token of
+  lookahead (peek) beyond the current token, so it works on both the
+  table-backed and the streaming tokenizer.
+  """
+  def __init__(self, tokenizer: jack_tokenizer.JackTokenizer) -> None:
+    self.tokenizer = tokenizer
+    self._at_end = False
+
+  def parse_class(self) -> jack_ast.Class:
+    """class name { classVarDec* subroutineDec* }"""
+    self._next()
+    self._expect_keyword(lexicon.KeywordTypes.CLASS)
+    name = self._identifier()
+    self._expect_symbol(lexicon.Symbols.LEFT_CURLY)
+    class_var_decs: List[jack_ast.ClassVarDec] = []
+    subroutine_decs: List[jack_ast.SubroutineDec] = []
+    while not self._at_symbol(lexicon.Symbols.RIGHT_CURLY):
+      if self._at_keyword(lexicon.KeywordTypes.STATIC, lexicon.KeywordTypes.FIELD):
+        class_var_decs.append(self.parse_class_var_dec())
+      elif self._at_keyword(*SUBROUTINE_KINDS):
+        subroutine_decs.append(self.parse_subroutine_dec())
+      else: raise self._error("a class variable or subroutine declaration")
+    self._expect_symbol(lexicon.Symbols.RIGHT_CURLY)
+    return jack_ast.Class(name, class_var_decs, subroutine_decs)
+
+  def parse_class_var_dec(self) -> jack_ast.ClassVarDec:
+    """(static|field) type name (, name)* ;"""
+    kind = self._keyword()
+    type_ = self._type()
+    names = self._names()
+    return jack_ast.ClassVarDec(kind, type_, names)
+
+  def parse_subroutine_dec(self) -> jack_ast.SubroutineDec:
+    """(constructor|function|method) type name ( parameterList ) subroutineBody"""
+    kind = self._keyword()
+    return_type = self._type()
+    name = self._identifier()
+    self._expect_symbol(lexicon.Symbols.LEFT_PAREN)
+    parameters = self.parse_parameter_list()
+    self._expect_symbol(lexicon.Symbols.RIGHT_PAREN)
+    self._expect_symbol(lexicon.Symbols.LEFT_CURLY)
+    var_decs: List[jack_ast.VarDec] = []
+    while self._at_keyword(lexicon.KeywordTypes.VAR):
+      var_decs.append(self.parse_var_dec())
+    statements = self.parse_statements()
+    self._expect_symbol(lexicon.Symbols.RIGHT_CURLY)
+    return jack_ast.SubroutineDec(kind, return_type, name, parameters, var_decs, statements)
+
+  def parse_parameter_list(self) -> List[jack_ast.Parameter]:
+    """((type name) (, type name)*)?"""
+    parameters: List[jack_ast.Parameter] = []
+    if self._at_symbol(lexicon.Symbols.RIGHT_PAREN):
+      return parameters
+    parameters.append(jack_ast.Parameter(self._type(), self._identifier()))
+    while self._at_symbol(lexicon.Symbols.COMMA):
+      self._next()
+      parameters.append(jack_ast.Parameter(self._type(), self._identifier()))
+    return parameters
+
+  def parse_var_dec(self) -> jack_ast.VarDec:
+    """var type name (, name)* ;"""
+    self._expect_keyword(lexicon.KeywordTypes.VAR)
+    type_ = self._type()
+    return jack_ast.VarDec(type_, self._names())
+
+  def parse_statements(self) -> List[jack_ast.Statement]:
+    """statement*"""
+    statements: List[jack_ast.Statement] = []
+    while True:
+      if self._at_keyword(lexicon.KeywordTypes.LET):
+        statements.append(self.parse_let())
+      elif self._at_keyword(lexicon.KeywordTypes.IF):
+        statements.append(self.parse_if())
+      elif self._at_keyword(lexicon.KeywordTypes.WHILE):
+        statements.append(self.parse_while())
+      elif self._at_keyword(lexicon.KeywordTypes.DO):
+        statements.append(self.parse_do())
+      elif self._at_keyword(lexicon.KeywordTypes.RETURN):
+        statements.append(self.parse_return())
+      else:
+        return statements
+
+  def parse_let(self) -> jack_ast.LetStatement:
+    """let name ([ expression ])? = expression ;"""
+    self._expect_keyword(lexicon.KeywordTypes.LET)
+    name = self._identifier()
+    index = None
+    if self._at_symbol(lexicon.Symbols.LEFT_SQR_PAREN):
+      self._next()
+      index = self.parse_expression()
+      self._expect_symbol(lexicon.Symbols.RIGHT_SQR_PAREN)
+    self._expect_symbol(lexicon.Symbols.EQ)
+    value = self.parse_expression()
+    self._expect_symbol(lexicon.Symbols.SEMICOLON)
+    return jack_ast.LetStatement(name, index, value)
+
+  def parse_if(self) -> jack_ast.IfStatement:
+    """if ( expression ) { statements } (else { statements })?"""
+    self._expect_keyword(lexicon.KeywordTypes.IF)
+    condition = self._parenthesized_expression()
+    then_statements = self._block()
+    else_statements = None
+    if self._at_keyword(lexicon.KeywordTypes.ELSE):
+      self._next()
+      else_statements = self._block()
+    return jack_ast.IfStatement(condition, then_statements, else_statements)
+
+  def parse_while(self) -> jack_ast.WhileStatement:
+    """while ( expression ) { statements }"""
+    self._expect_keyword(lexicon.KeywordTypes.WHILE)
+    condition = self._parenthesized_expression()
+    return jack_ast.WhileStatement(condition, self._block())
+
+  def parse_do(self) -> jack_ast.DoStatement:
+    """do subroutineCall ;"""
+    self._expect_keyword(lexicon.KeywordTypes.DO)
+    call = self.parse_subroutine_call()
+    self._expect_symbol(lexicon.Symbols.SEMICOLON)
+    return jack_ast.DoStatement(call)
+
+  def parse_return(self) -> jack_ast.ReturnStatement:
+    """return expression? ;"""
+    self._expect_keyword(lexicon.KeywordTypes.RETURN)
+    value = None
+    if not self._at_symbol(lexicon.Symbols.SEMICOLON):
+      value = self.parse_expression()
+    self._expect_symbol(lexicon.Symbols.SEMICOLON)
+    return jack_ast.ReturnStatement(value)
+
+  def parse_subroutine_call(self) -> jack_ast.SubroutineCall:
+    """name ( expressionList ) | (className|varName) . name ( expressionList )"""
+    receiver: Optional[str] = None
+    name = self._identifier()
+    if self._at_symbol(lexicon.Symbols.PERIOD):
+      self._next()
+      receiver, name = name, self._identifier()
+    self._expect_symbol(lexicon.Symbols.LEFT_PAREN)
+    args = self.parse_expression_list()
+    self._expect_symbol(lexicon.Symbols.RIGHT_PAREN)
+    return jack_ast.SubroutineCall(receiver, name, args)
+
+  def parse_expression(self) -> jack_ast.Expression:
+    """term (op term)*, grouped to the left."""
+    expression = self.parse_term()
+    while not self._at_end and self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
+        lexicon.Symbols.is_op(self.tokenizer.symbol()):
+      op = self.tokenizer.symbol()
+      self._next()
+      expression = jack_ast.BinaryOp(op, expression, self.parse_term())
+    return expression
+
+  def parse_term(self) -> jack_ast.Expression:
+    """Parses a term. Needs LL(2) to tell variables from subroutine calls."""
+    if self._at_end:
+      raise self._error("a term")
+    token_type = self.tokenizer.token_type()
+    if token_type == lexicon.TokenType.IDENTIFIER:
+      lookahead = self.tokenizer.peek()
+      if lookahead is not None and lookahead.token_type == lexicon.TokenType.SYMBOL and \
+          lookahead.value in {lexicon.Symbols.LEFT_PAREN, lexicon.Symbols.PERIOD}:
+        return self.parse_subroutine_call()
+      name = self._identifier()
+      if self._at_symbol(lexicon.Symbols.LEFT_SQR_PAREN):
+        self._next()
+        index = self.parse_expression()
+        self._expect_symbol(lexicon.Symbols.RIGHT_SQR_PAREN)
+        return jack_ast.ArrayRef(name, index)
+      return jack_ast.VarRef(name)
+    if token_type == lexicon.TokenType.INT_CONST:
+      value = self.tokenizer.int_val()
+      self._next()
+      return jack_ast.IntegerConstant(value)
+    if token_type == lexicon.TokenType.STRING_CONST:
+      value = self.tokenizer.string_val()
+      self._next()
+      return jack_ast.StringConstant(value)
+    if token_type == lexicon.TokenType.KEYWORD and self.tokenizer.keyword() in KEYWORD_CONSTANTS:
+      return jack_ast.KeywordConstant(self._keyword())
+    if self._at_symbol(lexicon.Symbols.LEFT_PAREN):
+      return jack_ast.Parenthesized(self._parenthesized_expression())
+    if token_type == lexicon.TokenType.SYMBOL and lexicon.Symbols.is_unary_op(self.tokenizer.symbol()):
+      op = self.tokenizer.symbol()
+      self._next()
+      return jack_ast.UnaryOp(op, self.parse_term())
+    raise self._error("a term")
+
+  def parse_expression_list(self) -> List[jack_ast.Expression]:
+    """(expression (, expression)*)?"""
+    expressions: List[jack_ast.Expression] = []
+    if self._at_symbol(lexicon.Symbols.RIGHT_PAREN):
+      return expressions
+    expressions.append(self.parse_expression())
+    while self._at_symbol(lexicon.Symbols.COMMA):
+      self._next()
+      expressions.append(self.parse_expression())
+    return expressions
+
+  def _parenthesized_expression(self) -> jack_ast.Expression:
+    self._expect_symbol(lexicon.Symbols.LEFT_PAREN)
+    expression = self.parse_expression()
+    self._expect_symbol(lexicon.Symbols.RIGHT_PAREN)
+    return expression
+
+  def _block(self) -> List[jack_ast.Statement]:
+    self._expect_symbol(lexicon.Symbols.LEFT_CURLY)
+    statements = self.parse_statements()
+    self._expect_symbol(lexicon.Symbols.RIGHT_CURLY)
+    return statements
+
+  def _names(self) -> List[str]:
+    """name (, name)* ;"""
+    names = [self._identifier()]
+    while self._at_symbol(lexicon.Symbols.COMMA):
+      self._next()
+      names.append(self._identifier())
+    self._expect_symbol(lexicon.Symbols.SEMICOLON)
+    return names
+
+  def _type(self) -> str:
+    if self._at_keyword(*TYPE_KEYWORDS):
+      return self._keyword().value
+    return self._identifier()
+
+  def _identifier(self) -> str:
+    if self._at_end or self.tokenizer.token_type() != lexicon.TokenType.IDENTIFIER:
+      raise self._error("an identifier")
+    name = self.tokenizer.identifier()
+    self._next()
+    return name
+
+  def _keyword(self) -> lexicon.KeywordTypes:
+    if self._at_end or self.tokenizer.token_type() != lexicon.TokenType.KEYWORD:
+      raise self._error("a keyword")
+    keyword = self.tokenizer.keyword()
+    self._next()
+    return keyword
+
+  def _at_symbol(self, symbol: lexicon.Symbols) -> bool:
+    return not self._at_end and self.tokenizer.token_type() == lexicon.TokenType.SYMBOL and \
+      self.tokenizer.symbol() == symbol
+
+  def _at_keyword(self, *keywords: lexicon.KeywordTypes) -> bool:
+    return not self._at_end and self.tokenizer.token_type() == lexicon.TokenType.KEYWORD and \
+      self.tokenizer.keyword() in keywords
+
+  def _expect_symbol(self, symbol: lexicon.Symbols) -> None:
+    if not self._at_symbol(symbol):
+      raise self._error(repr(symbol.value))
+    self._next()
+
+  def _expect_keyword(self, keyword: lexicon.KeywordTypes) -> None:
+    if not self._at_keyword(keyword):
+      raise self._error(repr(keyword.value))
+    self._next()
+
+  def _next(self) -> None:
+    if self.tokenizer.has_more_tokens():
+      self.tokenizer.advance()
+    else:
+      self._at_end = True
+
+  def _error(self, expected: str) -> JackSyntaxError:
+    if self._at_end:
+      return JackSyntaxError(f"{self.tokenizer.file_path}: expected {expected}, got end of input")
+    token = self.tokenizer.current()
+    got = getattr(token.value, 'value', token.value)
+    return JackSyntaxError(f"{self.tokenizer.file_path}:{token.line}:{token.column}: "
+                           f"expected {expected}, got {got!r}")
+
+
+def parse_file(file_path: str, table: Optional[token_table.TokenTable] = None) -> jack_ast.Class:
+  """Parse the Jack class in file_path (or its pre-lexed table) into an AST."""
+  return JackParser(jack_tokenizer.JackTokenizer(file_path, table)).parse_class()
@@ -1,66 +1,139 @@
 """This module contains the Jack Tokenizer."""
 
-from typing import Any, Optional, List
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple, Union
+from collections import deque
+import copy
+import mmap
 import re
 
-from jack_compiler import lexicon
+from jack_compiler import lexicon, token_table
+
+# bump whenever lexing changes, to invalidate cached token tables
+TOKENIZER_VERSION = "2"
+
+# A single alternation over the whole lexical grammar. Whitespace and both
+# comment forms are matched as 'skip' so the scanner never has to pre-process
+# the source; the whole file is lexed by anchored matches at a moving offset.
+_TOKEN_PATTERN = r"""
+  (?P<skip>\s+|//[^\n]*|/\*.*?\*/)
+  |(?P<string>"[^"\n]*")
+  |(?P<int>\d+)
+  |(?P<word>[A-Za-z_]\w*)
+  |(?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+"""
+TOKEN_RE = re.compile(_TOKEN_PATTERN, re.VERBOSE | re.DOTALL)
+TOKEN_RE_BYTES = re.compile(_TOKEN_PATTERN.encode(), re.VERBOSE | re.DOTALL)
+
+KEYWORDS: Dict[str, lexicon.KeywordTypes] = {k.value: k for k in lexicon.KeywordTypes}
+SYMBOLS: Dict[str, lexicon.Symbols] = {s.value: s for s in lexicon.Symbols}
+
+
+def iter_tokens(source: Union[str, bytes, mmap.mmap], file_path: str = '<string>') -> Iterator[token_table.LexedToken]:
+  """
+  Lex a Jack source one token at a time. The source may be text or any
+  bytes-like buffer (including an mmap), which is matched in place.
+  Columns count characters either way.
+  """
+  is_text = isinstance(source, str)
+  if is_text:
+    pattern, newline = TOKEN_RE, "\n"
+  else:
+    pattern, newline = TOKEN_RE_BYTES, b"\n"
+  pos, line, line_start = 0, 1, 0
+  # bytes of the current line beyond one per character, which only
+  # comments and strings can hold
+  extra = 0
+  end = len(source)
+  while pos < end:
+    match = pattern.match(source, pos)
+    if match is None:
+      column = pos - line_start - extra + 1
+      raise ValueError(f"Unexpected character {source[pos:pos + 1]!r} at {file_path}:{line}:{column}")
+    group, text = match.lastgroup, match.group()
+    if group == 'skip':
+      newlines = text.count(newline)
+      if newlines:
+        line += newlines
+        line_start = pos + text.rindex(newline) + 1
+        extra = 0
+      if not is_text and not text.isascii():
+        tail = text[text.rindex(newline) + 1:] if newlines else text
+        extra += len(tail) - len(tail.decode('utf-8'))
+    else:
+      column = pos - line_start - extra + 1
+      if not is_text:
+        raw, text = text, text.decode('utf-8')
+        extra += len(raw) - len(text)
+      token_type, value = _decode(group, text)
+      yield token_table.LexedToken(token_type, value, line, column)
+    pos = match.end()
+
+
+def tokenize(source: str, file_path: str = '<string>') -> token_table.TokenTable:
+  """Lex a whole Jack source into a TokenTable in a single pass."""
+  table = token_table.TokenTable()
+  for token in iter_tokens(source, file_path):
+    table.append(*token)
+  return table
+
+
+def tokenize_file(file_path: str) -> token_table.TokenTable:
+  """Lex the Jack file at file_path into a TokenTable."""
+  with open(file_path, 'r', encoding='utf-8') as f:
+    return tokenize(f.read(), file_path)
+
 
 class JackTokenizer:
-  def __init__(self, file_path: str) -> None:
+  """
+  A cursor over the tokens of one Jack source. The source is lexed up
+  front into a TokenTable (or an existing table is reused), so moving
+  the cursor never touches the source text again.
+  """
+  def __init__(self, file_path: str, table: Optional[token_table.TokenTable] = None) -> None:
     self.file_path = file_path
-    with open(self.file_path, 'r', encoding='utf-8') as f:
-      text = f.read()
-    text = re.sub(r'/\*\*.*?\*/', '', text, flags=re.DOTALL) # remove multiline comments
-    lines = text.split("\n")
-    lines = [line.split("//")[0] for line in lines if not line.strip().startswith("/")] # remove single line comments
-    self.input_stream = " ".join([l.replace("\n", " ").strip() for l in lines if l.replace("\n", " ").strip()])
-    keywords = [v.value for v in lexicon.KeywordTypes]
-    self._re_keyword_pattern = r"\b(" + "|".join(keywords) + r")\b"
-    self._re_symbol_pattern = "|".join([re.escape(v.value) for v in lexicon.Symbols])
-    # self.advance()
-  
+    self.table = table if table is not None else tokenize_file(file_path)
+    self._index = -1
+    self._current_token: Any = None
+    self._token_type: Optional[lexicon.TokenType] = None
+
+  def __deepcopy__(self, memo: Dict[int, Any]) -> 'JackTokenizer':
+    # the table is never mutated after lexing, so copies share it
+    clone = copy.copy(self)
+    memo[id(self)] = clone
+    return clone
+
   def has_more_tokens(self) -> bool:
     """Are there any more tokens in the input?"""
-    return bool(len(self.input_stream.strip()))
+    return self._index + 1 < len(self.table)
 
   def advance(self) -> Any:
     """
     Gets the next token from the input and makes it the
     current token.
     """
-    keyword_match = re.search(self._re_keyword_pattern, self.input_stream)
-    symbol_match = re.search(self._re_symbol_pattern, self.input_stream)
-    int_match = re.search(r'-?\d+', self.input_stream)
-    string_cont_match = re.search(r'"[^"]*"', self.input_stream)
-    span_end = None
-    if keyword_match and keyword_match.span()[0] == 0:
-      self._current_token = lexicon.KeywordTypes(keyword_match.group())
-      self._token_type = lexicon.TokenType.KEYWORD
-      span_end = keyword_match.span()[1]
-    elif symbol_match and symbol_match.span()[0] == 0:
-      self._current_token = lexicon.Symbols(symbol_match.group())
-      self._token_type = lexicon.TokenType.SYMBOL
-      span_end = symbol_match.span()[1]
-    elif int_match and int_match.span()[0] == 0:
-      self._current_token = int(int_match.group())
-      self._token_type = lexicon.TokenType.INT_CONST
-      span_end = int_match.span()[1]
-    elif string_cont_match and string_cont_match.span()[0] == 0:
-      self._current_token = string_cont_match.group().strip('"')
-      self._token_type = lexicon.TokenType.STRING_CONST
-      span_end = string_cont_match.span()[1]
-    else:
-      # identifier
-      next_match_start = self._get_min_span_start([keyword_match, symbol_match, int_match, string_cont_match])
-      if next_match_start is not None:
-        self._current_token = self.input_stream[:next_match_start].strip()
-      else:
-        self._current_token = self.input_stream.strip()
-      span_end = len(self._current_token)
-      self._token_type = lexicon.TokenType.IDENTIFIER
-    # reset input_stream
-    assert span_end is not None
-    self.input_stream = self.input_stream[span_end:].strip()
+    self.seek(self._index + 1)
+
+  def peek(self, k: int = 1) -> Optional[token_table.Token]:
+    """Return the token k places after the current one without moving
+    the cursor, or None if the input ends before it."""
+    index = self._index + k
+    if index >= len(self.table):
+      return None
+    return self.table[index]
+
+  def tell(self) -> int:
+    """Return the index of the current token in the token table."""
+    return self._index
+
+  def seek(self, index: int) -> None:
+    """Make the token at index the current token (for backtracking)."""
+    self._index = index
+    self._token_type = self.table.token_type(index)
+    self._current_token = self.table.value(index)
+
+  def current(self) -> token_table.Token:
+    """Return a view of the current token, including its source position."""
+    return self.table[self._index]
 
   def token_type(self) -> lexicon.TokenType:
     """Return the type of the current token."""
@@ -91,14 +164,95 @@ class JackTokenizer:
     assert self.token_type() == lexicon.TokenType.STRING_CONST
     return self._current_token
 
-  def _get_min_span_start(self, matches: List[Optional[re.Match]]) -> int:
-    min_start = self.input_stream.find(" ")
-    for match in matches:
-      if not match:
-        continue
-      match_start = match.span()[0]
-      if min_start is None:
-        min_start = match_start
-      else:
-        min_start = min(min_start, match_start)
-    return min_start
+
+class StreamingJackTokenizer(JackTokenizer):
+  """
+  A JackTokenizer that lexes straight out of a memory-mapped file. Only
+  the current token and the tokens requested through peek() are held in
+  memory, so very large (e.g. machine generated) sources are never
+  copied. The cursor only moves forward: tell() works, seek() does not.
+  Use it as a context manager, or close() it, to release the file early;
+  it is closed on its own once the input ends.
+  """
+  def __init__(self, file_path: str) -> None:
+    self.file_path = file_path
+    self._file = open(file_path, 'rb')
+    try:
+      self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      # empty files cannot be mapped
+      self._buffer = b''
+    self._tokens: Optional[Iterator[token_table.LexedToken]] = iter_tokens(self._buffer, file_path)
+    self._window: Deque[token_table.LexedToken] = deque()
+    self._current: Optional[token_table.LexedToken] = None
+    self._index = -1
+    self._current_token: Any = None
+    self._token_type: Optional[lexicon.TokenType] = None
+
+  def has_more_tokens(self) -> bool:
+    """Are there any more tokens in the input?"""
+    return self._fill(1)
+
+  def advance(self) -> Any:
+    """
+    Gets the next token from the input and makes it the
+    current token.
+    """
+    if not self._fill(1):
+      raise IndexError(f"No more tokens in {self.file_path}")
+    self._current = self._window.popleft()
+    self._index += 1
+    self._token_type, self._current_token = self._current.token_type, self._current.value
+
+  def peek(self, k: int = 1) -> Optional[token_table.LexedToken]:
+    """Return the token k places after the current one without moving
+    the cursor, or None if the input ends before it."""
+    if not self._fill(k):
+      return None
+    return self._window[k - 1]
+
+  def __enter__(self) -> 'StreamingJackTokenizer':
+    return self
+
+  def __exit__(self, *exc_info: Any) -> None:
+    self.close()
+
+  def seek(self, index: int) -> None:
+    raise TypeError("A StreamingJackTokenizer cannot seek; use a JackTokenizer to backtrack.")
+
+  def current(self) -> token_table.LexedToken:
+    """Return the current token, including its source position."""
+    return self._current
+
+  def close(self) -> None:
+    """Release the memory map and the underlying file."""
+    self._tokens = None
+    if isinstance(self._buffer, mmap.mmap):
+      self._buffer.close()
+    self._file.close()
+
+  def _fill(self, n: int) -> bool:
+    """Lex until the lookahead window holds n tokens; False if the input ends first."""
+    while len(self._window) < n:
+      token = next(self._tokens, None) if self._tokens is not None else None
+      if token is None:
+        self.close()
+        return False
+      self._window.append(token)
+    return True
+
+
+def _decode(group: str, text: str) -> Tuple[lexicon.TokenType, Any]:
+  """Turn a raw match of TOKEN_RE into a (token type, token value) pair."""
+  if group == 'word':
+    keyword = KEYWORDS.get(text)
+    if keyword is not None:
+      return lexicon.TokenType.KEYWORD, keyword
+    return lexicon.TokenType.IDENTIFIER, text
+  if group == 'symbol':
+    return lexicon.TokenType.SYMBOL, SYMBOLS[text]
+  if group == 'int':
+    return lexicon.TokenType.INT_CONST, int(text)
+  if group == 'string':
+    return lexicon.TokenType.STRING_CONST, text[1:-1]
+  raise ValueError(f"Not a token: {text!r}")
@@ -1,25 +1,49 @@
 import argparse
+import sys
 
-from jack_compiler import jack_analyzer
-from jack_compiler.compilation import vm_compilation, xml_compilation
+from jack_compiler import build_manifest, jack_analyzer, token_cache
+from jack_compiler.compilation import optimization
 
 
 def parse_args():
   parser = argparse.ArgumentParser()
   parser.add_argument("source_code_path")
-  parser.add_argument("compiler")
-  return parser.parse_args()
+  parser.add_argument("compiler", nargs="?",
+                      help="what to write for each class: vm, xml (the parse tree) or tokens, or several "
+                           "separated by commas, which share one lexing and parsing pass")
+  parser.add_argument("--emit", help="the same as compiler, e.g. --emit vm,xml,tokens")
+  parser.add_argument("--stream", action="store_true",
+                      help="tokenize straight from a memory map instead of lexing whole files up front")
+  parser.add_argument("--no-token-cache", action="store_true",
+                      help="always lex sources instead of reusing cached token tables")
+  parser.add_argument("--token-cache-dir", default=token_cache.DEFAULT_CACHE_DIR)
+  parser.add_argument("-O", "--optimize", default="none", type=optimization.parse_optimizations,
+                      help="VM optimizations to run: 'all' (all but strings), 'none' or a comma separated list "
+                           f"of {', '.join(o.value for o in optimization.Optimization)}")
+  parser.add_argument("-j", "--jobs", default=1, type=int,
+                      help="compile classes in this many processes, 0 for one per CPU")
+  parser.add_argument("--incremental", action="store_true",
+                      help=f"only compile classes changed since the last build, tracked in {build_manifest.MANIFEST_NAME}")
+  args = parser.parse_args()
+  if (args.compiler is None) == (args.emit is None):
+    parser.error("give what to compile to either as the compiler argument or with --emit")
+  return args
 
 
 def main():
   args = parse_args()
-  if args.compiler == 'xml':
-    compiler_class = xml_compilation.XMLCompilationEngine
-  elif args.compiler == 'vm':
-    compiler_class = vm_compilation.VMCompilationEngine
-  else: raise ValueError(f"did not recognize {args.compiler=}")
-  analyzer = jack_analyzer.JackAnalyzer(args.source_code_path, compiler_class)
-  analyzer.analyze()
+  cache = None if args.no_token_cache else token_cache.TokenCache(args.token_cache_dir)
+  try:
+    compiler_classes = jack_analyzer.get_compilation_engines(args.emit or args.compiler)
+    analyzer = jack_analyzer.JackAnalyzer(args.source_code_path, compiler_classes, streaming=args.stream,
+                                          cache=cache, optimizations=args.optimize, jobs=args.jobs,
+                                          incremental=args.incremental)
+  except ValueError as e:
+    sys.exit(str(e))
+  try:
+    analyzer.analyze()
+  except jack_analyzer.CompilationError as e:
+    sys.exit(str(e))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""
+Compiles Jack straight to Hack assembly in one process. The compiler hands
+its VM commands to the VM translator as structured commands, so no VM code
+is formatted, written or parsed in between; .vm files are only written
+when asked for. Needs the vmtranslator package (08-vmtranslator).
+
+  $ python -m jack_compiler.pipeline MyGame -O all --tree-shake
+"""
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+import argparse
+import os
+import sys
+
+from jack_compiler import class_cache, jack_analyzer
+from jack_compiler.compilation import optimization, vm_compilation, vm_writing
+
+try:
+  from vmtranslator import main as vm_translator, vm
+except ImportError:
+  vm_translator = None
+
+
+class VMCommandWriter(vm_writing.VMWriter):
+  """
+  A VMWriter that records each command as the translator's VMCommand
+  instead of formatting it. Given an output_writer, the commands are also
+  written there as VM code, e.g. to keep the .vm files.
+  """
+  def __init__(self, output_writer: Optional[vm_writing.OutputWriter] = None) -> None:
+    super().__init__(output_writer)
+    self.commands: List['vm.VMCommand'] = []
+
+  def write_push(self, segment: vm_writing.VMSegment, index: int) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_PUSH, segment.value, index))
+    if self.output_writer is not None:
+      super().write_push(segment, index)
+
+  def write_pop(self, segment: vm_writing.VMSegment, index: int) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_POP, segment.value, index))
+    if self.output_writer is not None:
+      super().write_pop(segment, index)
+
+  def write_arithmetic(self, command) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_ARITHMETIC, vm_writing.to_vm_arithmetic(command).value))
+    if self.output_writer is not None:
+      super().write_arithmetic(command)
+
+  def write_label(self, label: str) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_LABEL, label))
+    if self.output_writer is not None:
+      super().write_label(label)
+
+  def write_goto(self, label: str) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_GOTO, label))
+    if self.output_writer is not None:
+      super().write_goto(label)
+
+  def write_if(self, label: str) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_IF, label))
+    if self.output_writer is not None:
+      super().write_if(label)
+
+  def write_call(self, name: str, num_args: int) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_CALL, name, num_args))
+    if self.output_writer is not None:
+      super().write_call(name, num_args)
+
+  def write_function(self, name: str, num_vars: int) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_FUNCTION, name, num_vars))
+    if self.output_writer is not None:
+      super().write_function(name, num_vars)
+
+  def write_return(self) -> None:
+    self.commands.append(vm.VMCommand(vm.VMCommandTypes.C_RETURN))
+    if self.output_writer is not None:
+      super().write_return()
+
+  def close(self) -> None:
+    if self.output_writer is not None:
+      super().close()
+
+  def abort(self) -> None:
+    self.commands.clear()
+    if self.output_writer is not None:
+      super().abort()
+
+
+def compile_to_hack(input_path: str, output_path: Optional[str] = None,
+                    optimizations: Iterable[optimization.Optimization] = (), write_vm: bool = False,
+                    tree_shake: bool = False, inline: bool = False,
+                    inline_max_size: Optional[int] = None, inline_max_growth: Optional[float] = None,
+                    peephole: bool = False, compact_runtime: bool = False, ram_report: bool = False,
+                    trees: Optional[class_cache.ClassCache] = None) -> str:
+  """
+  Compile the classes of the input path and translate them to Hack assembly,
+  returning the path of the .asm file. peephole, tree_shake, compact_runtime,
+  ram_report and the inline options are those of the VM translator. Classes that fail to compile are
+  left out; once every class has been tried a CompilationError lists them
+  and no assembly is kept.
+  """
+  if vm_translator is None:
+    raise ValueError("cannot translate: the vmtranslator package is not installed")
+  if output_path is None:
+    if os.path.isdir(input_path):
+      output_path = vm_translator.make_output_path_for_input_dir(input_path)
+    else:
+      output_path = jack_analyzer.get_output_path(input_path, 'asm')
+  optimizations = frozenset(optimizations)
+  errors: List[Tuple[str, str]] = []
+
+  def program() -> Iterator[Tuple[str, List['vm.VMCommand']]]:
+    for source_file in jack_analyzer.get_jack_source_files(input_path):
+      vm_path = jack_analyzer.get_output_path(source_file, 'vm')
+      print(f"compiling {source_file}" + (f" into {vm_path}" if write_vm else ""))
+      writer = VMCommandWriter(vm_writing.FileWriter(vm_path) if write_vm else None)
+      try:
+        tree = trees.parse_file(source_file) if trees is not None else None
+        vm_compilation.VMCompilationEngine(source_file, vm_path, tree=tree, optimizations=optimizations,
+                                           vm_writer=writer).compile_class()
+      except (OSError, IndexError, ValueError) as e:
+        errors.append((source_file, str(e)))
+        continue
+      # the translator names a file's statics after it, and Main.jack gives the same Main as Main.vm
+      yield source_file, writer.commands
+
+  print("output file path:", output_path)
+  kwargs = {}
+  if inline_max_size is not None:
+    kwargs['inline_max_size'] = inline_max_size
+  if inline_max_growth is not None:
+    kwargs['inline_max_growth'] = inline_max_growth
+  vm_translator.translate_program(program(), output_path, tree_shake=tree_shake, inline=inline,
+                                 peephole=peephole, compact_runtime=compact_runtime, ram_report=ram_report,
+                                 **kwargs)
+  if errors:
+    os.remove(output_path)
+    raise jack_analyzer.CompilationError(errors)
+  return output_path
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Compile Jack code to Hack assembly without intermediate files.")
+  parser.add_argument("source_code_path")
+  parser.add_argument("-o", "--output", help="the .asm file to write, next to the sources by default")
+  parser.add_argument("-O", "--optimize", default="none", type=optimization.parse_optimizations,
+                      help="VM optimizations to run, as for jack_compiler.main")
+  parser.add_argument("--write-vm", action="store_true", help="also write the .vm file of every class")
+  parser.add_argument("--peephole", action="store_true",
+                      help="rewrite wasteful VM command sequences before translating them")
+  parser.add_argument("--tree-shake", action="store_true",
+                      help="drop functions that are never called, directly or not, from Sys.init")
+  parser.add_argument("--inline", action="store_true", help="replace calls to small leaf functions by their bodies")
+  parser.add_argument("--inline-max-size", type=int, help="largest function body, in VM commands, to inline")
+  parser.add_argument("--inline-max-growth", type=float,
+                      help="how much inlining may grow the program, as a fraction of its VM commands")
+  parser.add_argument("--compact-runtime", action="store_true",
+                      help="jump to shared call, return and comparison routines instead of inlining them")
+  parser.add_argument("--ram-report", action="store_true", help="print the cells of static RAM each class takes")
+  return parser.parse_args()
+
+
+def main():
+  args = parse_args()
+  try:
+    compile_to_hack(args.source_code_path, args.output, optimizations=args.optimize, write_vm=args.write_vm,
+                    tree_shake=args.tree_shake, inline=args.inline, inline_max_size=args.inline_max_size,
+                    inline_max_growth=args.inline_max_growth, peephole=args.peephole,
+                    compact_runtime=args.compact_runtime, ram_report=args.ram_report)
+  except ValueError as e:
+    sys.exit(str(e))
+
+
+if __name__ == "__main__":
+  main()
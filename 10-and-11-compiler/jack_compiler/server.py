@@ -0,0 +1,181 @@
+"""
+This module contains the CompileServer, a long-running process that keeps
+the compiler warm and takes compile requests over a Unix socket, and
+optionally rebuilds watched projects as soon as their sources change.
+
+  $ python -m jack_compiler.server --socket /tmp/jack.sock --watch MyGame
+  $ python -m jack_compiler.client --socket /tmp/jack.sock MyGame vm -O all
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+
+from jack_compiler import class_cache, client, jack_analyzer, token_cache
+from jack_compiler.compilation import optimization, vm_compilation
+
+try:
+  # a separate package: when it is installed, requests can also ask for Hack assembly
+  from vmtranslator import main as vm_translator
+except ImportError:
+  vm_translator = None
+
+DEFAULT_SOCKET_PATH = client.DEFAULT_SOCKET_PATH
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+def compile_request(request: Dict[str, Any], trees: Optional[class_cache.ClassCache] = None) -> Dict[str, Any]:
+  """
+  Run one build and return its response. A request has a `path` and may set
+  `compiler` ('vm', 'xml', 'tokens' or several, e.g. 'vm,xml'), `optimize`
+  (as for -O), `incremental` and `translate`, to also translate the VM code
+  to Hack assembly. The response holds `ok`, everything the build printed as
+  `output`, and `error`.
+  """
+  try:
+    path = request['path']
+  except KeyError as e:
+    return {'ok': False, 'output': '', 'error': f"request is missing {e}"}
+  output = io.StringIO()
+  error = None
+  try:
+    compiler = request.get('compiler', 'vm')
+    analyzer = jack_analyzer.JackAnalyzer(
+      path, jack_analyzer.get_compilation_engines(compiler),
+      optimizations=optimization.parse_optimizations(request.get('optimize', 'none')),
+      incremental=request.get('incremental', False), trees=trees)
+    with contextlib.redirect_stdout(output):
+      analyzer.analyze()
+      if request.get('translate'):
+        if vm_compilation.VMCompilationEngine not in analyzer.compilation_engines:
+          raise ValueError("only VM code can be translated to Hack assembly")
+        if vm_translator is None:
+          raise ValueError("cannot translate: the vmtranslator package is not installed")
+        vm_translator.translate_to_hack(path if os.path.isdir(path) else jack_analyzer.get_output_path(path, 'vm'))
+  except (OSError, LookupError, ValueError) as e:
+    error = str(e)
+  return {'ok': error is None, 'output': output.getvalue(), 'error': error}
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+  """Answers each line of JSON read from the connection with a line of JSON."""
+  def handle(self) -> None:
+    for line in self.rfile:
+      try:
+        request = json.loads(line)
+      except ValueError as e:
+        response = {'ok': False, 'output': '', 'error': f"not a JSON request: {e}"}
+      else:
+        response = self.server.compile(request)
+      self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class Watcher:
+  """Polls the mtimes of a project's Jack sources and rebuilds it when one changes."""
+  def __init__(self, request: Dict[str, Any]) -> None:
+    self.request = request
+    self._mtimes: Optional[Dict[str, Tuple[int, int]]] = None
+
+  def changed(self) -> bool:
+    """Have the sources changed since the last call? Always true on the first."""
+    mtimes = {}
+    for source_file in jack_analyzer.get_jack_source_files(self.request['path']):
+      try:
+        stat = os.stat(source_file)
+      except FileNotFoundError:
+        continue
+      mtimes[source_file] = (stat.st_mtime_ns, stat.st_size)
+    changed = mtimes != self._mtimes
+    self._mtimes = mtimes
+    return changed
+
+
+class CompileServer(socketserver.UnixStreamServer):
+  """
+  Serves compile requests one at a time, so builds never interleave, and
+  between requests polls the watched projects. Parsed classes are shared
+  across requests through a bounded ClassCache.
+  """
+  def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH,
+               max_classes: int = class_cache.DEFAULT_MAX_CLASSES,
+               tokens: Optional[token_cache.TokenCache] = None) -> None:
+    self.trees = class_cache.ClassCache(max_classes, tokens)
+    self.watchers: List[Watcher] = []
+    if os.path.exists(socket_path):
+      # left behind by a server that did not shut down cleanly
+      os.remove(socket_path)
+    super().__init__(socket_path, CompileRequestHandler)
+
+  def compile(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    return compile_request(request, self.trees)
+
+  def watch(self, request: Dict[str, Any]) -> None:
+    """Rebuild the project of the request whenever its sources change."""
+    if not os.path.exists(request['path']):
+      raise FileNotFoundError(f"cannot watch {request['path']}: no such file or directory")
+    jack_analyzer.get_jack_source_files(request['path'])
+    self.watchers.append(Watcher(dict(request, incremental=True)))
+
+  def service_actions(self) -> None:
+    for watcher in self.watchers:
+      try:
+        changed = watcher.changed()
+      except Exception as e:
+        # e.g. the project was deleted: keep serving the others
+        print(f"cannot watch {watcher.request['path']}: {e}")
+        continue
+      if changed:
+        response = self.compile(watcher.request)
+        print(response['output'], end='')
+        if response['error'] is not None:
+          print(response['error'])
+
+  def server_close(self) -> None:
+    super().server_close()
+    with contextlib.suppress(FileNotFoundError):
+      os.remove(self.server_address)
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Keep the Jack compiler running and serve compile requests.")
+  parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+  parser.add_argument("--watch", action="append", default=[], metavar="PATH",
+                      help="rebuild this project whenever a source changes, may be repeated")
+  parser.add_argument("--compiler", default="vm", help="compiler for watched projects: 'vm' or 'xml'")
+  parser.add_argument("-O", "--optimize", default="none", help="optimizations for watched projects, as for main")
+  parser.add_argument("--translate", action="store_true", help="also translate watched projects to Hack assembly")
+  parser.add_argument("--poll-interval", default=DEFAULT_POLL_INTERVAL, type=float,
+                      help="seconds between checks of the watched sources")
+  parser.add_argument("--max-cached-classes", default=class_cache.DEFAULT_MAX_CLASSES, type=int,
+                      help="how many parsed classes to keep in memory")
+  parser.add_argument("--no-token-cache", action="store_true",
+                      help="always lex sources instead of reusing cached token tables")
+  parser.add_argument("--token-cache-dir", default=token_cache.DEFAULT_CACHE_DIR)
+  return parser.parse_args()
+
+
+def main():
+  args = parse_args()
+  tokens = None if args.no_token_cache else token_cache.TokenCache(args.token_cache_dir)
+  with CompileServer(args.socket, args.max_cached_classes, tokens) as server:
+    for path in args.watch:
+      try:
+        server.watch({'path': path, 'compiler': args.compiler, 'optimize': args.optimize,
+                      'translate': args.translate})
+      except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    # exit through the with block on kill too, so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"serving on {args.socket}")
+    with contextlib.suppress(KeyboardInterrupt):
+      server.serve_forever(args.poll_interval)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,107 @@
+"""This module contains the TokenCache, a persistent on-disk cache of lexed sources."""
+
+from typing import Optional
+import contextlib
+import hashlib
+import os
+import tempfile
+
+from jack_compiler import jack_tokenizer, token_table
+
+DEFAULT_CACHE_DIR = os.environ.get(
+  "JACK_TOKEN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "jack_compiler", "tokens"))
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ENTRY_SUFFIX = ".tok"
+
+
+class TokenCache:
+  """
+  Stores the TokenTable of every source it has lexed, keyed by a hash of
+  the source bytes and the tokenizer version, so unchanged sources are
+  never lexed twice. The least recently used entries are evicted once
+  the cache grows past max_bytes.
+  """
+  def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(self.cache_dir, exist_ok=True)
+
+  def tokenize_file(self, file_path: str) -> token_table.TokenTable:
+    """Return the TokenTable of the file, lexing it only on a cache miss."""
+    with open(file_path, 'rb') as f:
+      source = f.read()
+    table = self.get(source)
+    if table is not None:
+      self.hits += 1
+      return table
+    self.misses += 1
+    table = jack_tokenizer.tokenize(source.decode('utf-8'), file_path)
+    self.put(source, table)
+    return table
+
+  def get(self, source: bytes) -> Optional[token_table.TokenTable]:
+    """Return the cached table for source, or None on a miss."""
+    entry_path = self._entry_path(source)
+    try:
+      with open(entry_path, 'rb') as f:
+        table = token_table.TokenTable.from_bytes(f.read())
+    except FileNotFoundError:
+      return None
+    except ValueError:
+      # written by another format version or truncated: drop it
+      self._remove(entry_path)
+      return None
+    # mark as recently used for eviction, unless another compiler just evicted it
+    with contextlib.suppress(FileNotFoundError):
+      os.utime(entry_path)
+    return table
+
+  def put(self, source: bytes, table: token_table.TokenTable) -> None:
+    """Store the table for source, evicting old entries if needed."""
+    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(table.to_bytes())
+      # atomic so concurrent compilers never read half an entry
+      os.replace(tmp_path, self._entry_path(source))
+    except BaseException:
+      self._remove(tmp_path)
+      raise
+    self.evict()
+
+  def evict(self) -> None:
+    """Remove least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.endswith(ENTRY_SUFFIX):
+        try:
+          stat = entry.stat()
+        except FileNotFoundError:
+          # evicted by another compiler since the scan
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      self._remove(path)
+      total -= size
+
+  def clear(self) -> None:
+    """Remove every entry from the cache."""
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.endswith(ENTRY_SUFFIX):
+        self._remove(entry.path)
+
+  def _entry_path(self, source: bytes) -> str:
+    digest = hashlib.sha256(jack_tokenizer.TOKENIZER_VERSION.encode() + b"\0" + source).hexdigest()
+    return os.path.join(self.cache_dir, digest + ENTRY_SUFFIX)
+
+  @staticmethod
+  def _remove(path: str) -> None:
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
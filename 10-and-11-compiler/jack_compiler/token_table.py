@@ -0,0 +1,176 @@
+"""This module contains the TokenTable, a compact store of pre-lexed tokens."""
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+from array import array
+import struct
+import sys
+
+from jack_compiler import lexicon
+
+# token kinds are stored as a single byte: the index into this tuple
+TOKEN_TYPES: Tuple[lexicon.TokenType, ...] = tuple(lexicon.TokenType)
+KIND_CODES: Dict[lexicon.TokenType, int] = {t: i for i, t in enumerate(TOKEN_TYPES)}
+
+
+class LexedToken(NamedTuple):
+  """A token as it comes out of the scanner, before it is stored in a table."""
+  token_type: lexicon.TokenType
+  value: Any
+  line: int
+  column: int
+
+
+class Token:
+  """A read-only view of one entry in a TokenTable."""
+  __slots__ = ('_table', 'index')
+
+  def __init__(self, table: 'TokenTable', index: int) -> None:
+    self._table = table
+    self.index = index
+
+  @property
+  def token_type(self) -> lexicon.TokenType:
+    return TOKEN_TYPES[self._table.kinds[self.index]]
+
+  @property
+  def value(self) -> Any:
+    return self._table.pool[self._table.values[self.index]]
+
+  @property
+  def line(self) -> int:
+    return self._table.lines[self.index]
+
+  @property
+  def column(self) -> int:
+    return self._table.columns[self.index]
+
+  def __repr__(self) -> str:
+    return f"Token({self.token_type.value}, {self.value!r}, {self.line}:{self.column})"
+
+
+class TokenTable:
+  """
+  All tokens of one source, stored column-wise in parallel arrays:
+
+  kinds (B) | values (I) | lines (I) | columns (I)
+
+  `values` index into `pool`, where each distinct token value is kept
+  once, so a token costs a few bytes however often it repeats.
+  """
+  __slots__ = ('kinds', 'values', 'lines', 'columns', 'pool', 'pool_kinds', '_pool_index')
+
+  def __init__(self) -> None:
+    self.kinds = array('B')
+    self.values = array('I')
+    self.lines = array('I')
+    self.columns = array('I')
+    self.pool: List[Any] = []
+    self.pool_kinds = array('B')
+    self._pool_index: Dict[Tuple[int, Any], int] = {}
+
+  def append(self, token_type: lexicon.TokenType, value: Any, line: int, column: int) -> None:
+    """Add a token to the end of the table."""
+    kind = KIND_CODES[token_type]
+    key = (kind, value)
+    slot = self._pool_index.get(key)
+    if slot is None:
+      slot = len(self.pool)
+      self.pool.append(sys.intern(value) if type(value) is str else value)
+      self.pool_kinds.append(kind)
+      self._pool_index[key] = slot
+    self.kinds.append(kind)
+    self.values.append(slot)
+    self.lines.append(line)
+    self.columns.append(column)
+
+  def token_type(self, index: int) -> lexicon.TokenType:
+    """Return the type of the token at index."""
+    return TOKEN_TYPES[self.kinds[index]]
+
+  def value(self, index: int) -> Any:
+    """Return the value of the token at index."""
+    return self.pool[self.values[index]]
+
+  def to_bytes(self) -> bytes:
+    """Serialize the table into the compact binary form read by from_bytes."""
+    pool_text = [_value_text(value).encode('utf-8') for value in self.pool]
+    chunks = [_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(self), len(self.pool))]
+    chunks.append(self.pool_kinds.tobytes())
+    chunks.append(array('I', [len(text) for text in pool_text]).tobytes())
+    chunks.extend(pool_text)
+    for column in (self.kinds, self.values, self.lines, self.columns):
+      chunks.append(column.tobytes())
+    return b''.join(chunks)
+
+  @classmethod
+  def from_bytes(cls, data: bytes) -> 'TokenTable':
+    """Rebuild a table serialized by to_bytes. Raises ValueError if data is not one."""
+    try:
+      magic, version, n_tokens, n_pool = _HEADER.unpack_from(data)
+    except struct.error as e:
+      raise ValueError("truncated token table") from e
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+      raise ValueError("not a token table of this format version")
+    table = cls()
+    view = memoryview(data)
+    offset = _HEADER.size
+    offset = _read_array(table.pool_kinds, view, offset, n_pool)
+    lengths = array('I')
+    offset = _read_array(lengths, view, offset, n_pool)
+    for kind, length in zip(table.pool_kinds, lengths):
+      text = bytes(view[offset:offset + length]).decode('utf-8')
+      offset += length
+      value = _text_value(TOKEN_TYPES[kind], text)
+      table._pool_index[(kind, value)] = len(table.pool)
+      table.pool.append(value)
+    for column in (table.kinds, table.values, table.lines, table.columns):
+      offset = _read_array(column, view, offset, n_tokens)
+    if offset != len(data):
+      raise ValueError("trailing bytes after token table")
+    return table
+
+  def __len__(self) -> int:
+    return len(self.kinds)
+
+  def __getitem__(self, index: int) -> Token:
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError(index)
+    return Token(self, index)
+
+  def __iter__(self) -> Iterator[Token]:
+    for index in range(len(self)):
+      yield Token(self, index)
+
+
+# serialized layout: header, pool kinds, pool text lengths, pool text,
+# then the kinds/values/lines/columns arrays (native byte order)
+_MAGIC = b'JTOK'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHII')
+
+
+def _value_text(value: Any) -> str:
+  if isinstance(value, (lexicon.KeywordTypes, lexicon.Symbols)):
+    return value.value
+  return str(value)
+
+
+def _text_value(token_type: lexicon.TokenType, text: str) -> Any:
+  if token_type == lexicon.TokenType.KEYWORD:
+    return lexicon.KeywordTypes(text)
+  if token_type == lexicon.TokenType.SYMBOL:
+    return lexicon.Symbols(text)
+  if token_type == lexicon.TokenType.INT_CONST:
+    return int(text)
+  return sys.intern(text)
+
+
+def _read_array(target: array, view: memoryview, offset: int, count: int) -> int:
+  """Fill target with count items from view at offset; return the new offset."""
+  end = offset + count * target.itemsize
+  if end > len(view):
+    raise ValueError("truncated token table")
+  target.frombytes(view[offset:end])
+  return end
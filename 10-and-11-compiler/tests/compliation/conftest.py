@@ -0,0 +1,27 @@
+from typing import List
+
+import pytest
+
+from jack_compiler.compilation.vm_compilation import VMCompilationEngine
+from jack_compiler.compilation.vm_writing import MemoryWriter
+
+
+@pytest.fixture
+def compile_main(tmp_path):
+    """
+    Compiles body as `function int main(int x, int n)` of class Main, after
+    var_decs, and returns the VM commands of main, its function command
+    first. The prelude is declared before main, e.g. statics and a
+    Main.touch() to call.
+    """
+    def compile_main(body: str, optimizations=(), prelude: str = "", var_decs: str = "") -> List[str]:
+        source = tmp_path / "Main.jack"
+        source.write_text("class Main {\n  " + prelude + "\n  function int main(int x, int n) {\n    "
+                          + var_decs + "\n    " + body + "\n  }\n}\n")
+        writer = MemoryWriter()
+        VMCompilationEngine(str(source), str(tmp_path / "Main.vm"), optimizations=optimizations,
+                            output_writer=writer).compile_class()
+        # main comes last, after any functions of the prelude
+        start = next(n for n, command in enumerate(writer.commands) if command.startswith("function Main.main "))
+        return writer.commands[start:]
+    return compile_main
@@ -0,0 +1,78 @@
+import pytest
+
+from jack_compiler import jack_ast, lexicon
+from jack_compiler.compilation import array_access, optimization
+
+ARRAYS = optimization.Optimization.ARRAY_ACCESS
+
+
+@pytest.fixture
+def compile_main(compile_main):
+    """The commands of main's body, with array access optimized unless told otherwise."""
+    def compile_body(body: str, optimizations=(ARRAYS,)):
+        return compile_main(body, optimizations, prelude="static Array table;\n  function int touch() { return 0; }",
+                            var_decs="var Array a;\n    var int s;")[1:]
+    return compile_body
+
+
+X = jack_ast.VarRef("x")
+
+
+def constant(value: int) -> jack_ast.IntegerConstant:
+    return jack_ast.IntegerConstant(value)
+
+
+@pytest.mark.parametrize("index, expected", [
+    (constant(3), (None, 3)),
+    (X, (X, 0)),
+    (jack_ast.BinaryOp(lexicon.Symbols.PLUS, X, constant(2)), (X, 2)),
+    (jack_ast.BinaryOp(lexicon.Symbols.PLUS, constant(2), X), (X, 2)),
+    (jack_ast.BinaryOp(lexicon.Symbols.MINUS, X, constant(2)), None),
+    (jack_ast.UnaryOp(lexicon.Symbols.MINUS, constant(1)), None),
+])
+def test_split_index(index, expected):
+    assert array_access.split_index(index) == (expected or (index, 0))
+
+
+def test_constant_indices(compile_main):
+    assert compile_main("let table[3] = x; return table[0];") == [
+        "push static 0", "pop pointer 1", "push argument 0", "pop that 3",
+        "push that 0", "return"]
+
+
+def test_element_is_pointed_at_once(compile_main):
+    assert compile_main("let table[x + 1] = table[x + 1] + table[x]; return 0;") == [
+        "push static 0", "push argument 0", "add", "pop pointer 1",
+        "push that 1", "push that 0", "add", "pop that 1",
+        "push constant 0", "return"]
+
+
+def test_value_reading_another_array_is_evaluated_first(compile_main):
+    assert compile_main("let a[x] = table[n]; return 0;")[:9] == [
+        "push static 0", "push argument 1", "add", "pop pointer 1", "push that 0",
+        "push local 0", "push argument 0", "add", "pop pointer 1"]
+    # a call may change the array, so the address comes first
+    assert "pop temp 0" in compile_main("let a[x] = table[n] + Main.touch(); return 0;")
+
+
+def test_calls_leave_the_pointer_alone(compile_main):
+    assert compile_main("let a[x] = Main.touch(); return a[x];") == [
+        "push local 0", "push argument 0", "add", "pop pointer 1",
+        "call Main.touch 0", "pop that 0",
+        "push that 0", "return"]
+    # but may assign statics
+    assert compile_main("let table[x] = Main.touch(); return table[x];").count("pop pointer 1") == 2
+
+
+@pytest.mark.parametrize("between", ["let x = 1;", "let a = table;", "if (n) { let s = 1; }", "while (n) { let n = 0; }"])
+def test_pointer_is_forgotten(compile_main, between):
+    lines = compile_main(f"let s = a[x]; {between} return a[x];")
+    assert lines.count("pop pointer 1") == 2
+
+
+def test_off_by_default(compile_main):
+    assert compile_main("let a[0] = a[0]; return 0;", ()) == [
+        "push local 0", "push constant 0", "add",
+        "push local 0", "push constant 0", "add", "pop pointer 1", "push that 0",
+        "pop temp 0", "pop pointer 1", "push temp 0", "pop that 0",
+        "push constant 0", "return"]
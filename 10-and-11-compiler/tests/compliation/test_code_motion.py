@@ -0,0 +1,73 @@
+import functools
+
+import pytest
+
+from jack_compiler.compilation import optimization
+
+LICM = optimization.Optimization.LOOP_INVARIANTS
+CSE = optimization.Optimization.COMMON_SUBEXPRESSIONS
+
+
+@pytest.fixture
+def compile_main(compile_main):
+    """main with locals i and s, a static array and a Main.touch() to call."""
+    return functools.partial(compile_main, prelude="static Array table;\n  function void touch() { return; }",
+                             var_decs="var int i, s;")
+
+
+def test_repeated_expression_is_evaluated_once(compile_main):
+    assert compile_main("let s = (x + table[x]) * (x + table[x]); return s + (x + table[x]);", [CSE]) == [
+        "function Main.main 3",
+        "push argument 0", "push static 0", "push argument 0", "add", "pop pointer 1", "push that 0", "add",
+        "pop local 2",
+        "push local 2", "push local 2", "call Math.multiply 2", "pop local 1",
+        "push local 1", "push local 2", "add", "return"]
+
+
+def test_repeats_after_a_change_are_evaluated_again(compile_main):
+    for change in ["let x = 1;", "let table[0] = 1;", "do Main.touch();"]:
+        lines = compile_main(f"let s = x + table[x]; {change} return s + (x + table[x]);", [CSE])
+        assert lines[0] == "function Main.main 2"
+
+
+def test_locals_survive_calls(compile_main):
+    lines = compile_main("let s = x * n; do Main.touch(); return s + (x * n);", [CSE])
+    assert lines[0] == "function Main.main 3"
+    assert lines.count("call Math.multiply 2") == 1
+
+
+def test_branches_only_keep_what_both_evaluate(compile_main):
+    body = "if (s) { let s = x * n; } else { let i = x * n; } return x * n;"
+    assert compile_main(body, [CSE]).count("call Math.multiply 2") == 3
+    body = "let i = x * n; if (s) { let s = x * n; } return x * n;"
+    assert compile_main(body, [CSE]).count("call Math.multiply 2") == 1
+
+
+def test_invariant_is_moved_before_the_loop(compile_main):
+    assert compile_main("while (i < (x * n)) { let s = s + (x * n); let i = i + 1; } return s;", [LICM]) == [
+        "function Main.main 3",
+        "push argument 0", "push argument 1", "call Math.multiply 2", "pop local 2",
+        "label Main_L1AOWILE",
+        "push local 0", "push local 2", "lt", "not", "if-goto Main_L2AOWILE",
+        "push local 1", "push local 2", "add", "pop local 1",
+        "push local 0", "push constant 1", "add", "pop local 0",
+        "goto Main_L1AOWILE", "label Main_L2AOWILE",
+        "push local 1", "return"]
+
+
+def test_values_the_loop_changes_stay_in_it(compile_main):
+    for body in ["while (i < 10) { let s = s + (x * n); let x = i; }",
+                 "while (i < 10) { let s = table[x] + 1; let table[i] = s; }",
+                 "while (i < 10) { let s = table[x] + 1; do Main.touch(); }",
+                 # would divide before the loop even when it never runs
+                 "while (i < 10) { let s = x / n; }"]:
+        assert compile_main(body.replace("}", "let i = i + 1; }") + " return s;", [LICM])[0] == "function Main.main 2"
+
+
+def test_nested_loops(compile_main):
+    body = "while (i < 10) { while (s < 10) { let s = s + (x * n) + (i * n); } let i = i + 1; } return s;"
+    lines = compile_main(body, [LICM])
+    assert lines[0] == "function Main.main 4"
+    # x * n leaves both loops, i * n only the inner one
+    assert lines[1:5] == ["push argument 0", "push argument 1", "call Math.multiply 2", "pop local 2"]
+    assert lines.count("call Math.multiply 2") == 2
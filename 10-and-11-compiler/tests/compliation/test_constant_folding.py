@@ -0,0 +1,66 @@
+import pytest
+
+from jack_compiler.compilation import constant_folding, optimization
+
+
+@pytest.fixture
+def compile_main(compile_main):
+    """The commands of main's body, folded unless told otherwise."""
+    def compile_body(body: str, optimizations=(optimization.Optimization.CONSTANT_FOLDING,)):
+        return compile_main(body, optimizations)[1:]
+    return compile_body
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2*3 + 4", ["push constant 10"]),
+    ("32767 + 1", ["push constant 32767", "not"]),
+    ("200 * 200", ["push constant 25536", "neg"]),
+    ("-7 / 2", ["push constant 3", "neg"]),
+    ("(-32000) < 32000", ["push constant 0"]),
+    ("~false", ["push constant 1", "neg"]),
+    ("x + 0", ["push argument 0"]),
+    ("x * 1", ["push argument 0"]),
+    ("-(-(x))", ["push argument 0"]),
+    ("x * -1", ["push argument 0", "neg"]),
+    ("x + -5", ["push argument 0", "push constant 5", "sub"]),
+    ("(x + 3) - 10", ["push argument 0", "push constant 7", "sub"]),
+    ("x & 0", ["push constant 0"]),
+])
+def test_folds_expressions(compile_main, expression, expected):
+    assert compile_main(f"return {expression};") == expected + ["return"]
+
+
+def test_keeps_calls_with_side_effects(compile_main):
+    assert compile_main("return Main.main(x) * 0;") == [
+        "push argument 0", "call Main.main 1", "push constant 0", "call Math.multiply 2", "return"]
+
+
+def test_division_by_zero_is_left_to_the_os(compile_main):
+    assert compile_main("return 1 / 0;") == [
+        "push constant 1", "push constant 0", "call Math.divide 2", "return"]
+
+
+def test_constant_conditions(compile_main):
+    assert compile_main("if (false) { let x = 1; } else { let x = 2; } while (0) { let x = 3; } return x;") == [
+        "push constant 2", "pop argument 0", "push argument 0", "return"]
+    assert compile_main("while (true) { return x; } return 0;") == [
+        "label Main_L1AOWILE", "push argument 0", "return", "goto Main_L1AOWILE", "label Main_L2AOWILE",
+        "push constant 0", "return"]
+
+
+def test_disabled_by_default(compile_main):
+    assert compile_main("return 2 * 3;", optimizations=()) == [
+        "push constant 2", "push constant 3", "call Math.multiply 2", "return"]
+
+
+@pytest.mark.parametrize("value, expected", [(32768, -32768), (-32769, 32767), (65535, -1), (5, 5)])
+def test_wrap(value, expected):
+    assert constant_folding.wrap(value) == expected
+
+
+def test_parse_optimizations():
+    assert optimization.parse_optimizations("all") == optimization.ALL_OPTIMIZATIONS
+    assert optimization.parse_optimizations("none") == frozenset()
+    assert optimization.parse_optimizations("fold") == {optimization.Optimization.CONSTANT_FOLDING}
+    with pytest.raises(ValueError, match="unknown optimization 'inline-everything'"):
+        optimization.parse_optimizations("inline-everything")
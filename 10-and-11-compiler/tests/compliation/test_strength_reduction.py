@@ -0,0 +1,78 @@
+from typing import List
+
+import pytest
+
+from jack_compiler.compilation import optimization, strength_reduction
+from jack_compiler.compilation.constant_folding import wrap
+from jack_compiler.compilation.vm_compilation import VMCompilationEngine
+from jack_compiler.compilation.vm_writing import MemoryWriter, VMSegment, VMWriter
+
+
+def run(commands: List[str], x: int) -> int:
+    """Evaluate straight-line VM code with x in argument 0."""
+    stack, segments = [], {"argument": [x], "temp": [0] * 8}
+    binary = {
+        "add": lambda a, b: a + b, "sub": lambda a, b: a - b,
+        "and": lambda a, b: a & b, "or": lambda a, b: a | b,
+        "eq": lambda a, b: -1 if a == b else 0, "lt": lambda a, b: -1 if wrap(a - b) < 0 else 0,
+    }
+    for command in commands:
+        op, *args = command.split()
+        if op == "push":
+            stack.append(int(args[1]) if args[0] == "constant" else segments[args[0]][int(args[1])])
+        elif op == "pop":
+            segments[args[0]][int(args[1])] = stack.pop()
+        elif op in binary:
+            b, a = stack.pop(), stack.pop()
+            stack.append(wrap(binary[op](a, b)))
+        elif op == "neg":
+            stack.append(wrap(-stack.pop()))
+        elif op == "not":
+            stack.append(wrap(~stack.pop()))
+        else:
+            raise ValueError(command)
+    assert len(stack) == 1
+    return stack[0]
+
+
+def truncating_divide(x: int, y: int) -> int:
+    quotient = abs(x) // abs(y)
+    return wrap(quotient if (x < 0) == (y < 0) else -quotient)
+
+
+SAMPLES = list(range(-32768, 32768, 251)) + [-32768, -32767, -1, 0, 1, 32767]
+
+
+@pytest.mark.parametrize("multiplier", [0, 2, 3, 5, 7, 10, 32, 255, 1023, 16384, -6, -32768])
+def test_multiply(multiplier):
+    writer = MemoryWriter()
+    strength_reduction.write_multiply(VMWriter(writer), (VMSegment.ARGUMENT, 0), multiplier)
+    for x in SAMPLES:
+        assert run(writer.commands, x) == wrap(x * multiplier), x
+
+
+@pytest.mark.parametrize("divisor", [2, 4, 16, 1024, 16384, -1, -2, -64])
+def test_divide(divisor):
+    writer = MemoryWriter()
+    strength_reduction.write_divide(VMWriter(writer), divisor)
+    commands = ["push argument 0"] + writer.commands
+    for x in SAMPLES + list(range(-300, 300)):
+        assert run(commands, x) == truncating_divide(x, divisor), x
+
+
+def test_signed_digits():
+    assert strength_reduction.signed_digits(255) == [-1, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert strength_reduction.signed_digits(32) == [0, 0, 0, 0, 0, 1]
+    assert not strength_reduction.can_reduce_multiply(0b1010101)
+    assert not strength_reduction.can_reduce_divide(3)
+    assert not strength_reduction.can_reduce_divide(-32768)
+
+
+def test_compiles_without_math_calls(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text("class Main { function int f(int x, int y) { return (y*32) + (x/16) + (x*y); } }")
+    output = tmp_path / "Main.vm"
+    VMCompilationEngine(str(source), str(output),
+                        optimizations=[optimization.Optimization.STRENGTH_REDUCTION]).compile_class()
+    calls = [line for line in output.read_text().splitlines() if line.startswith("call")]
+    assert calls == ["call Math.multiply 2"]
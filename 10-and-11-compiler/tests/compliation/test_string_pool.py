@@ -0,0 +1,37 @@
+from jack_compiler.compilation import optimization
+
+BODY = '''do Output.printString("hi");
+    do Output.printString("hi");
+    do Output.printString("yo");
+    return 0;'''
+
+
+def test_literals_are_built_once_into_statics(compile_main):
+    commands = compile_main(BODY, {optimization.Optimization.STRING_POOL}, prelude="static int count;")
+    assert commands[1:12] == [
+        "push static 1",
+        "if-goto Main_L1STR",
+        "push constant 2",
+        "call String.new 1",
+        "push constant 104",
+        "call String.appendChar 2",
+        "push constant 105",
+        "call String.appendChar 2",
+        "pop static 1",
+        "label Main_L1STR",
+        "push static 1",
+    ]
+    # every site can build the literal, but they share one static per distinct
+    # literal, after the declared one, so each is only built once
+    assert [c for c in commands if c.startswith("pop static")] == ["pop static 1", "pop static 1", "pop static 2"]
+
+
+def test_literals_are_rebuilt_without_pooling(compile_main):
+    commands = compile_main(BODY, optimization.ALL_OPTIMIZATIONS, prelude="static int count;")
+    assert commands.count("call String.new 1") == 3
+    assert not any("static" in command for command in commands)
+
+
+def test_string_pool_is_opt_in():
+    assert optimization.Optimization.STRING_POOL not in optimization.parse_optimizations("all")
+    assert optimization.parse_optimizations("all,strings") == frozenset(optimization.Optimization)
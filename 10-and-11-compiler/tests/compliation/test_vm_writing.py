@@ -0,0 +1,57 @@
+import pytest
+
+from jack_compiler.compilation.vm_compilation import VMCompilationEngine
+from jack_compiler.compilation.vm_writing import FileWriter, MemoryWriter, VMSegment, VMWriter
+
+SOURCE = 'class Main {\n  function int f() {\n    return 7;\n  }\n}\n'
+
+
+def test_file_writer_buffers_until_threshold(tmp_path):
+    output = tmp_path / "Main.vm"
+    writer = VMWriter(FileWriter(str(output), flush_threshold=40))
+    writer.write_function("Main.f", 0)
+    assert not output.exists()
+    for i in range(3):
+        writer.write_push(VMSegment.CONSTANT, i)
+    assert output.read_text() == "function Main.f 0\npush constant 0\npush constant 1\n"
+    writer.write_return()
+    writer.close()
+    writer.close()
+    assert output.read_text().splitlines()[-2:] == ["push constant 2", "return"]
+
+
+def test_file_writer_replaces_old_output(tmp_path):
+    output = tmp_path / "Main.vm"
+    output.write_text("stale\n")
+    writer = FileWriter(str(output))
+    writer.close()
+    assert not output.exists()
+
+
+def test_file_writer_abort_removes_output(tmp_path):
+    output = tmp_path / "Main.vm"
+    writer = VMWriter(FileWriter(str(output), flush_threshold=1))
+    writer.write_function("Main.f", 0)
+    assert output.exists()
+    writer.write_push(VMSegment.CONSTANT, 1)
+    writer.abort()
+    assert not output.exists()
+
+
+def test_failed_class_leaves_no_output(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text('class Main {\n  function int f() {\n    return 7;\n  }\n  function int g() {\n    return y;\n  }\n}\n')
+    output = tmp_path / "Main.vm"
+    engine = VMCompilationEngine(str(source), str(output), output_writer=FileWriter(str(output), flush_threshold=1))
+    with pytest.raises(ValueError):
+        engine.compile_class()
+    assert not output.exists()
+
+
+def test_memory_writer_returns_commands(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text(SOURCE)
+    writer = MemoryWriter()
+    VMCompilationEngine(str(source), str(tmp_path / "Main.vm"), output_writer=writer).compile_class()
+    assert writer.commands == ["function Main.f 0", "push constant 7", "return"]
+    assert not (tmp_path / "Main.vm").exists()
@@ -2,7 +2,6 @@ from typing import List, Tuple
 import pytest
 import xml.etree.ElementTree as ET
 import glob
-from lxml import etree as et
 
 from jack_compiler.compilation.xml_compilation import XMLCompilationEngine
 from jack_compiler.jack_tokenizer import JackTokenizer
@@ -28,6 +27,16 @@ def test_arratest_compilation(jack, expected_xml):
 def test_arratest_compilation(jack, expected_xml):
   assert simple_xml_eq_check(jack, expected_xml)
 
+def test_streamed_layout_matches_element_tree(tmp_path):
+  source = tmp_path / "Main.jack"
+  source.write_text('class Main { field int x; method void f() { if (x < 1) { let x = "a&b"; } return; } }')
+  XMLCompilationEngine(str(source), str(tmp_path / "Main.xml")).compile_class()
+  written = (tmp_path / "Main.xml").read_text()
+  root = ET.fromstring(written)
+  ET.indent(root)
+  assert ET.tostring(root, encoding='unicode', short_empty_elements=False) == written
+  assert "<parameterList></parameterList>" in written
+
 def simple_xml_eq_check(file1, file2):
   compiler = XMLCompilationEngine(file1, "tmp1")
   tree1 = ET.parse(file2)
@@ -0,0 +1,81 @@
+import pytest
+
+from jack_compiler import build_manifest, jack_parser, jack_tokenizer
+from jack_compiler.compilation import optimization, vm_compilation
+from jack_compiler.jack_analyzer import CompilationError, JackAnalyzer
+
+MAIN = '''class Main {
+  static Point origin;
+  function void main() {
+    var Array a;
+    let a = Array.new(2);
+    do Output.printInt(Point.distance(origin, origin) + a.length());
+    return;
+  }
+}
+'''
+POINT = '''class Point {
+  field int x, y;
+  function int distance(Point a, Point b) {
+    return Math.abs(a.getX() - b.getX());
+  }
+  method int getX() { return x; }
+}
+'''
+
+
+def write_project(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN)
+    (tmp_path / "Point.jack").write_text(POINT)
+
+
+def build(tmp_path, capsys, **kwargs):
+    """Build incrementally and return the names of the compiled classes."""
+    JackAnalyzer(str(tmp_path), vm_compilation.VMCompilationEngine, incremental=True, **kwargs).analyze()
+    lines = capsys.readouterr().out.splitlines()
+    return [line.split()[1].rsplit("/", 1)[-1] for line in lines if line.startswith("compiling")]
+
+
+def test_referenced_classes():
+    tokenizer = jack_tokenizer.JackTokenizer("Main.jack", jack_tokenizer.tokenize(MAIN))
+    tree = jack_parser.JackParser(tokenizer).parse_class()
+    assert build_manifest.referenced_classes(tree) == {"Point", "Array", "Output"}
+
+
+def test_unchanged_classes_are_skipped(tmp_path, capsys):
+    write_project(tmp_path)
+    assert build(tmp_path, capsys) == ["Main.jack", "Point.jack"]
+    assert build(tmp_path, capsys) == []
+    (tmp_path / "Point.jack").write_text(POINT.replace("x, y", "x, y, z"))
+    assert build(tmp_path, capsys) == ["Point.jack"]
+    (tmp_path / "Main.vm").unlink()
+    assert build(tmp_path, capsys) == ["Main.jack"]
+    assert (tmp_path / "Main.vm").exists()
+
+
+def test_options_change_rebuilds_everything(tmp_path, capsys):
+    write_project(tmp_path)
+    build(tmp_path, capsys)
+    assert build(tmp_path, capsys, optimizations=optimization.ALL_OPTIMIZATIONS) == ["Main.jack", "Point.jack"]
+
+
+def test_failed_classes_are_retried(tmp_path, capsys):
+    write_project(tmp_path)
+    (tmp_path / "Point.jack").write_text("class Point {")
+    with pytest.raises(CompilationError):
+        build(tmp_path, capsys)
+    assert capsys.readouterr().out.count("compiling") == 2
+    (tmp_path / "Point.jack").write_text(POINT)
+    assert build(tmp_path, capsys) == ["Point.jack"]
+
+
+def test_whole_program_changes_rebuild_dependents(tmp_path, capsys):
+    write_project(tmp_path)
+    build(tmp_path, capsys)
+    (tmp_path / "Point.jack").write_text(POINT.replace("x, y", "x, y, z"))
+    manifest = build_manifest.BuildManifest.load(
+        str(tmp_path / build_manifest.MANIFEST_NAME), build_manifest.build_key("vm"))
+    files = [(str(tmp_path / name), str(tmp_path / name.replace(".jack", ".vm")))
+             for name in ("Main.jack", "Point.jack")]
+    assert manifest.stale_sources(files) == [files[1][0]]
+    assert manifest.stale_sources(files, whole_program=True) == [files[0][0], files[1][0]]
@@ -0,0 +1,81 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from jack_compiler import jack_parser, jack_tokenizer
+from jack_compiler.compilation import vm_compilation, xml_compilation
+from jack_compiler.jack_analyzer import CompilationError, JackAnalyzer, get_compilation_engines
+
+SOURCE = 'class {name} {{\n  function int f(int x) {{\n    return x * {i} + 1;\n  }}\n}}\n'
+
+
+def write_classes(dir_path, n):
+    for i in range(n):
+        (dir_path / f"Class{i}.jack").write_text(SOURCE.format(name=f"Class{i}", i=i))
+
+
+def read_outputs(dir_path):
+    return {path.name: path.read_text() for path in sorted(dir_path.glob("*.vm"))}
+
+
+def test_parallel_output_matches_serial(tmp_path, capsys):
+    serial, parallel = tmp_path / "serial", tmp_path / "parallel"
+    for dir_path, jobs in ((serial, 1), (parallel, 2)):
+        dir_path.mkdir()
+        write_classes(dir_path, 12)
+        JackAnalyzer(str(dir_path), vm_compilation.VMCompilationEngine, jobs=jobs).analyze()
+    assert len(read_outputs(serial)) == 12
+    assert read_outputs(serial) == read_outputs(parallel)
+    printed = capsys.readouterr().out.splitlines()
+    half = len(printed) // 2
+    assert [line.replace("serial", "parallel") for line in printed[:half]] == printed[half:]
+    assert printed[0].startswith("compiling") and printed[0].endswith("Class0.vm")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_errors_are_aggregated(tmp_path, jobs):
+    write_classes(tmp_path, 3)
+    (tmp_path / "Broken1.jack").write_text("class Broken1 { function void f() { return }")
+    (tmp_path / "Broken2.jack").write_text("class Broken2 { let }")
+    (tmp_path / "Broken3.jack").write_text("class Broken3 { function void f() { let y = 1; return; } }")
+    with pytest.raises(CompilationError) as info:
+        JackAnalyzer(str(tmp_path), vm_compilation.VMCompilationEngine, jobs=jobs).analyze()
+    assert [source_file for source_file, _ in info.value.errors] == [
+        str(tmp_path / "Broken1.jack"), str(tmp_path / "Broken2.jack"), str(tmp_path / "Broken3.jack")]
+    assert "undefined variable y" in info.value.errors[2][1]
+    assert str(info.value).startswith("3 file(s) failed to compile:")
+    # the classes that do compile are still written, and no part of the others
+    assert list(read_outputs(tmp_path)) == ["Class0.vm", "Class1.vm", "Class2.vm"]
+
+
+def test_several_backends_share_one_parse(tmp_path, monkeypatch, capsys):
+    separate, together = tmp_path / "separate", tmp_path / "together"
+    for dir_path in (separate, together):
+        dir_path.mkdir()
+        write_classes(dir_path, 2)
+    for compiler in ("vm", "xml", "tokens"):
+        JackAnalyzer(str(separate), get_compilation_engines(compiler)).analyze()
+    calls = []
+    for module, name in ((jack_tokenizer, "tokenize_file"), (jack_parser.JackParser, "parse_class")):
+        original = getattr(module, name)
+        monkeypatch.setattr(module, name, lambda *args, f=original, n=name: calls.append(n) or f(*args))
+    capsys.readouterr()
+    JackAnalyzer(str(together), get_compilation_engines("vm,xml,tokens")).analyze()
+    assert calls == ["tokenize_file", "parse_class"] * 2
+    assert capsys.readouterr().out.splitlines()[0].endswith("Class0.vm, " + str(together / "Class0.xml") + ", "
+                                                            + str(together / "Class0T.xml"))
+    for name in ("Class0.vm", "Class0.xml", "Class0T.xml", "Class1.vm", "Class1.xml", "Class1T.xml"):
+        assert (together / name).read_text() == (separate / name).read_text()
+
+
+def test_tokens(tmp_path):
+    (tmp_path / "Main.jack").write_text('class Main { function void f() { do Output.printString("a<b"); return; } }')
+    JackAnalyzer(str(tmp_path), xml_compilation.TokenXMLBackend).analyze()
+    tokens = ET.parse(tmp_path / "MainT.xml").getroot()
+    assert [(token.tag, token.text) for token in tokens][:2] == [("keyword", " class "), ("identifier", " Main ")]
+    assert ("stringConstant", " a<b ") in [(token.tag, token.text) for token in tokens]
+
+
+def test_incremental_builds_take_one_backend(tmp_path):
+    with pytest.raises(ValueError):
+        JackAnalyzer(str(tmp_path), get_compilation_engines("vm,xml"), incremental=True)
@@ -0,0 +1,45 @@
+import pytest
+
+from jack_compiler import jack_ast as ast
+from jack_compiler.jack_parser import JackParser, JackSyntaxError
+from jack_compiler.jack_tokenizer import JackTokenizer, tokenize
+from jack_compiler.lexicon import KeywordTypes, Symbols
+
+
+def parse(source: str) -> ast.Class:
+    return JackParser(JackTokenizer("Main.jack", tokenize(source))).parse_class()
+
+
+def test_parse_class():
+    tree = parse("""
+    class Main {
+      static int count;
+      method int get(int i) {
+        var Array a;
+        let a[i] = -(count + 1) * 2;
+        if (~(i = 0)) { do Output.printInt(a[i]); } else { return this; }
+        return get(i - 1);
+      }
+    }""")
+    assert tree.name == "Main"
+    assert tree.class_var_decs == [ast.ClassVarDec(KeywordTypes.STATIC, "int", ["count"])]
+    get = tree.subroutine_decs[0]
+    assert (get.kind, get.return_type, get.name) == (KeywordTypes.METHOD, "int", "get")
+    assert get.parameters == [ast.Parameter("int", "i")]
+    assert get.var_decs == [ast.VarDec("Array", ["a"])]
+    let, if_, return_ = get.statements
+    assert let == ast.LetStatement("a", ast.VarRef("i"), ast.BinaryOp(
+        Symbols.ASTERISK,
+        ast.UnaryOp(Symbols.MINUS, ast.Parenthesized(
+            ast.BinaryOp(Symbols.PLUS, ast.VarRef("count"), ast.IntegerConstant(1)))),
+        ast.IntegerConstant(2)))
+    assert if_.then_statements == [ast.DoStatement(
+        ast.SubroutineCall("Output", "printInt", [ast.ArrayRef("a", ast.VarRef("i"))]))]
+    assert if_.else_statements == [ast.ReturnStatement(ast.KeywordConstant(KeywordTypes.THIS))]
+    assert return_ == ast.ReturnStatement(ast.SubroutineCall(None, "get", [
+        ast.BinaryOp(Symbols.MINUS, ast.VarRef("i"), ast.IntegerConstant(1))]))
+
+
+def test_syntax_error_reports_position():
+    with pytest.raises(JackSyntaxError, match=r"Main.jack:3:1: expected ';'"):
+        parse("class Main {\n  field int x\n}")
@@ -1,9 +1,11 @@
 from typing import Tuple, List
 import glob
-from lxml import etree as et
+import xml.etree.ElementTree as et
+import pytest
 
-from jack_compiler.jack_tokenizer import JackTokenizer
-from jack_compiler.lexicon import TokenType
+from jack_compiler.compilation.vm_compilation import VMCompilationEngine
+from jack_compiler.jack_tokenizer import JackTokenizer, StreamingJackTokenizer, tokenize
+from jack_compiler.lexicon import TokenType, KeywordTypes, Symbols
 
 ARRAYTEST_DIR_PATH = '../../official_nand2tetris/nand2tetris/projects/10/ArrayTest'
 SQUARE_DIR_PATH = '../../official_nand2tetris/nand2tetris/projects/10/Square'
@@ -51,8 +53,10 @@ def check_tokenization(input_path: str, output_path: str):
         answer = et.fromstring(f.read())
         answer = et.tostring(answer).decode()
     answer_lines = answer.split("\n")[1:-1]
-    tokenized = et.tostring(tester.emit_xml(), pretty_print=True).decode()
-    tokenized_lines = [e.strip() for e in tokenized.split('\n')[1:-2]]
+    root = tester.emit_xml()
+    et.indent(root)
+    tokenized = et.tostring(root).decode()
+    tokenized_lines = [e.strip() for e in tokenized.split('\n')[1:-1]]
     assert tokenized_lines == answer_lines
 
 def test_square_tokenization():
@@ -70,3 +74,105 @@ def test_expressionless_square_tokenization():
     paths = get_inputs_and_expected_paths(EXPRESSIONLESS_SQUARE_PATH)
     for input_, out in paths:
         check_tokenization(input_, out)
+
+
+def tokenize_source(tmp_path, source: str) -> List[Tuple[TokenType, object]]:
+    path = tmp_path / "Source.jack"
+    path.write_text(source)
+    tokenizer = JackTokenizer(str(path))
+    tokens = []
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        tokens.append((tokenizer.token_type(), tokenizer._current_token))
+    return tokens
+
+
+def test_comments_and_identifiers_with_digits(tmp_path):
+    source = '/** doc\n * comment */\nlet x1 = y2/2; // trailing\n/* block */ do f("a // b");'
+    tokens = tokenize_source(tmp_path, source)
+    assert [value for _, value in tokens] == [
+        KeywordTypes.LET, "x1", Symbols.EQ, "y2", Symbols.FORWARD_SLASH, 2, Symbols.SEMICOLON,
+        KeywordTypes.DO, "f", Symbols.LEFT_PAREN, "a // b", Symbols.RIGHT_PAREN, Symbols.SEMICOLON,
+    ]
+    assert tokens[1][0] == TokenType.IDENTIFIER
+    assert tokens[10][0] == TokenType.STRING_CONST
+
+
+def test_token_table_positions_and_reuse():
+    table = tokenize("class Main {\n  field int x1, x2;\n}")
+    assert len(table) == 10
+    assert [(t.line, t.column) for t in table][:4] == [(1, 1), (1, 7), (1, 12), (2, 3)]
+    assert table[5].token_type == TokenType.IDENTIFIER and table[5].value == "x1"
+    # repeated values share one pool entry, keyed by kind and value
+    repeated = tokenize('field int int; "int"')
+    assert list(repeated.values) == [0, 1, 1, 2, 3] and len(repeated.pool) == 4
+
+    first, second = JackTokenizer("Main.jack", table), JackTokenizer("Main.jack", table)
+    first.advance(); first.advance()
+    second.advance()
+    assert first.identifier() == "Main" and second.keyword() == KeywordTypes.CLASS
+    first.seek(0)
+    assert first.keyword() == KeywordTypes.CLASS
+
+
+def test_peek_does_not_move_the_cursor():
+    tokenizer = JackTokenizer("Main.jack", tokenize("do Main.run();"))
+    tokenizer.advance(); tokenizer.advance()
+    assert tokenizer.peek().value == Symbols.PERIOD
+    assert tokenizer.peek(2).value == "run"
+    assert tokenizer.peek(6) is None
+    assert tokenizer.identifier() == "Main"
+
+
+def test_streaming_tokenizer_matches_table(tmp_path):
+    source = '/** doc */ class Main {\n  function void main() { do Output.printString("hi // there"); return; }\n}'
+    path = tmp_path / "Main.jack"
+    path.write_text(source)
+    streaming = StreamingJackTokenizer(str(path))
+    assert streaming.peek(2).value == "Main"
+    streamed = []
+    while streaming.has_more_tokens():
+        streaming.advance()
+        current = streaming.current()
+        streamed.append((current.token_type, current.value, current.line, current.column))
+    expected = [(t.token_type, t.value, t.line, t.column) for t in tokenize(source)]
+    assert streamed == expected
+
+
+def test_streaming_tokenizer_empty_file(tmp_path):
+    path = tmp_path / "Empty.jack"
+    path.write_text("")
+    assert not StreamingJackTokenizer(str(path)).has_more_tokens()
+
+
+def test_streaming_tokenizer_cannot_seek(tmp_path):
+    path = tmp_path / "Main.jack"
+    path.write_text("class Main {}")
+    with StreamingJackTokenizer(str(path)) as streaming:
+        streaming.advance()
+        with pytest.raises(TypeError, match="cannot seek"):
+            streaming.seek(0)
+    assert streaming._file.closed
+
+
+def test_streaming_columns_count_characters(tmp_path):
+    source = 'class Main { /* é */ field int x; // ü\n  field String s; function void f() { do g("ä", y); } }'
+    path = tmp_path / "Main.jack"
+    path.write_text(source, encoding="utf-8")
+    with StreamingJackTokenizer(str(path)) as streaming:
+        streamed = []
+        while streaming.has_more_tokens():
+            streaming.advance()
+            streamed.append((streaming.current().line, streaming.current().column))
+    assert streamed == [(t.line, t.column) for t in tokenize(source)]
+
+
+def test_streaming_parse_closes_the_file_on_errors(tmp_path, monkeypatch):
+    path = tmp_path / "Main.jack"
+    path.write_text("class Main { function void f() { let = 1; } }")
+    closed = []
+    close = StreamingJackTokenizer.close
+    monkeypatch.setattr(StreamingJackTokenizer, "close", lambda self: closed.append(self) or close(self))
+    with pytest.raises(ValueError):
+        VMCompilationEngine(str(path), str(tmp_path / "Main.vm"), streaming=True).parse()
+    assert closed and all(tokenizer._file.closed for tokenizer in closed)
@@ -0,0 +1,60 @@
+import pytest
+
+from jack_compiler import jack_analyzer
+from jack_compiler.compilation.vm_compilation import VMCompilationEngine
+from jack_compiler.compilation.vm_writing import FileWriter
+
+pytest.importorskip("vmtranslator")
+from jack_compiler import pipeline  # noqa: E402
+from vmtranslator import main as vm_translator  # noqa: E402
+from vmtranslator.vm import VMCommand, VMCommandTypes  # noqa: E402
+
+SYS = '''class Sys {
+  static int calls;
+  function void init() {
+    let calls = Sys.twice(-3) * 5;
+    while (true) {}
+    return;
+  }
+  function int twice(int x) {
+    if (x < 0) { return x + x; }
+    return ~x;
+  }
+}
+'''
+
+
+def test_writer_records_structured_commands(tmp_path):
+    source = tmp_path / "Sys.jack"
+    source.write_text(SYS)
+    writer = pipeline.VMCommandWriter(FileWriter(str(tmp_path / "Sys.vm")))
+    VMCompilationEngine(str(source), str(tmp_path / "Sys.vm"), vm_writer=writer).compile_class()
+    assert writer.commands[:4] == [
+        VMCommand(VMCommandTypes.C_FUNCTION, "Sys.init", 0),
+        VMCommand(VMCommandTypes.C_PUSH, "constant", 3),
+        VMCommand(VMCommandTypes.C_ARITHMETIC, "neg"),
+        VMCommand(VMCommandTypes.C_CALL, "Sys.twice", 1),
+    ]
+    assert len((tmp_path / "Sys.vm").read_text().splitlines()) == len(writer.commands)
+
+
+@pytest.mark.parametrize("options", [{}, {'tree_shake': True, 'inline': True}, {'peephole': True},
+                                     {'compact_runtime': True}])
+def test_matches_compiling_then_translating(tmp_path, options):
+    (tmp_path / "Sys.jack").write_text(SYS)
+    jack_analyzer.JackAnalyzer(str(tmp_path), VMCompilationEngine).analyze()
+    vm_translator.translate_to_hack(str(tmp_path), str(tmp_path / "two_steps.asm"), **options)
+    (tmp_path / "Sys.vm").unlink()
+    output_path = pipeline.compile_to_hack(str(tmp_path), **options)
+    assert output_path.endswith(".asm")
+    with open(output_path) as f:
+        assert f.read() == (tmp_path / "two_steps.asm").read_text()
+    assert not (tmp_path / "Sys.vm").exists()
+
+
+def test_errors_remove_the_assembly(tmp_path):
+    (tmp_path / "Sys.jack").write_text(SYS)
+    (tmp_path / "Broken.jack").write_text("class Broken {")
+    with pytest.raises(jack_analyzer.CompilationError, match="Broken.jack"):
+        pipeline.compile_to_hack(str(tmp_path), str(tmp_path / "out.asm"))
+    assert not (tmp_path / "out.asm").exists()
@@ -0,0 +1,144 @@
+import socket
+import threading
+
+import pytest
+
+from jack_compiler import class_cache, client, server
+
+SOURCE = 'class {name} {{\n  function int f() {{\n    return {i};\n  }}\n}}\n'
+
+
+def write_classes(dir_path, n):
+    for i in range(n):
+        (dir_path / f"Class{i}.jack").write_text(SOURCE.format(name=f"Class{i}", i=i))
+
+
+def test_compile_request_reuses_parsed_classes(tmp_path):
+    write_classes(tmp_path, 3)
+    trees = class_cache.ClassCache()
+    first = server.compile_request({'path': str(tmp_path)}, trees)
+    assert first['ok'] and first['error'] is None
+    assert (tmp_path / "Class2.vm").read_text().splitlines()[:2] == ["function Class2.f 0", "push constant 2"]
+    assert server.compile_request({'path': str(tmp_path)}, trees)['ok']
+    assert (trees.misses, trees.hits) == (3, 3)
+
+
+def test_compile_request_errors(tmp_path):
+    (tmp_path / "Broken.jack").write_text("class Broken {")
+    response = server.compile_request({'path': str(tmp_path)})
+    assert not response['ok'] and "Broken.jack" in response['error']
+    assert "missing 'path'" in server.compile_request({})['error']
+    assert "unknown optimization" in server.compile_request({'path': str(tmp_path), 'optimize': 'x'})['error']
+
+
+def test_compile_request_errors_are_not_missing_fields(tmp_path, monkeypatch):
+    (tmp_path / "Main.jack").write_text("class Main { function void f() { let y = 1; return; } }")
+    response = server.compile_request({'path': str(tmp_path)})
+    assert not response['ok'] and "undefined variable y" in response['error']
+    def analyze(self):
+        raise KeyError('y')
+    monkeypatch.setattr(server.jack_analyzer.JackAnalyzer, "analyze", analyze)
+    response = server.compile_request({'path': str(tmp_path)})
+    assert not response['ok'] and "missing" not in response['error']
+
+
+def test_compile_request_rejects_other_paths(tmp_path):
+    response = server.compile_request({'path': str(tmp_path / "nope")})
+    assert not response['ok'] and "is not a directory or .jack file" in response['error']
+
+
+def test_send_request_reports_a_closed_connection(tmp_path):
+    socket_path = str(tmp_path / "jack.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(socket_path)
+        listener.listen(1)
+        def hang_up():
+            # read the request, as a server that fails on it does, then hang up
+            connection, _ = listener.accept()
+            with connection, connection.makefile('rb') as f:
+                f.readline()
+        thread = threading.Thread(target=hang_up)
+        thread.start()
+        with pytest.raises(ConnectionError):
+            client.send_request({'path': str(tmp_path)}, socket_path)
+        thread.join()
+
+
+def test_translate_needs_vmtranslator(tmp_path, monkeypatch):
+    write_classes(tmp_path, 1)
+    monkeypatch.setattr(server, "vm_translator", None)
+    response = server.compile_request({'path': str(tmp_path), 'translate': True})
+    assert "vmtranslator package is not installed" in response['error']
+
+
+def test_class_cache_is_bounded(tmp_path):
+    write_classes(tmp_path, 3)
+    trees = class_cache.ClassCache(max_classes=2)
+    for i in (0, 1, 2, 0):
+        trees.parse_file(str(tmp_path / f"Class{i}.jack"))
+    assert len(trees) == 2 and trees.misses == 4
+
+
+def test_watcher_sees_changes(tmp_path):
+    write_classes(tmp_path, 2)
+    watcher = server.Watcher({'path': str(tmp_path)})
+    assert watcher.changed()
+    assert not watcher.changed()
+    (tmp_path / "Class1.jack").write_text(SOURCE.format(name="Class1", i=100))
+    assert watcher.changed()
+
+
+def test_server_over_socket(tmp_path):
+    write_classes(tmp_path, 2)
+    socket_path = str(tmp_path / "jack.sock")
+    with server.CompileServer(socket_path) as compile_server:
+        thread = threading.Thread(target=compile_server.serve_forever, args=(0.01,))
+        thread.start()
+        try:
+            response = client.send_request({'path': str(tmp_path), 'incremental': True}, socket_path)
+            assert response['ok'] and "0 of 2 classes up to date" in response['output']
+            response = client.send_request({'path': str(tmp_path), 'incremental': True}, socket_path)
+            assert "2 of 2 classes up to date" in response['output']
+        finally:
+            compile_server.shutdown()
+            thread.join()
+    assert not (tmp_path / "jack.sock").exists()
+
+
+@pytest.fixture
+def watched_server(tmp_path):
+    write_classes(tmp_path, 2)
+    with server.CompileServer(str(tmp_path / "jack.sock")) as compile_server:
+        compile_server.watch({'path': str(tmp_path)})
+        yield compile_server
+
+
+def test_watched_projects_rebuild(tmp_path, watched_server, capsys):
+    watched_server.service_actions()
+    assert (tmp_path / "Class0.vm").exists()
+    assert capsys.readouterr().out.count("compiling") == 2
+    watched_server.service_actions()
+    assert "compiling" not in capsys.readouterr().out
+    (tmp_path / "Class1.jack").write_text(SOURCE.format(name="Class1", i=100))
+    watched_server.service_actions()
+    assert capsys.readouterr().out.count("compiling") == 1
+
+
+def test_watched_paths_must_exist(tmp_path):
+    (tmp_path / "notes.txt").write_text("")
+    with server.CompileServer(str(tmp_path / "jack.sock")) as compile_server:
+        for path in (tmp_path / "missing_dir", tmp_path / "Missing.jack", tmp_path / "notes.txt"):
+            with pytest.raises((OSError, ValueError)):
+                compile_server.watch({'path': str(path)})
+        assert compile_server.watchers == []
+
+
+def test_a_bad_watched_project_does_not_stop_the_others(tmp_path, watched_server, capsys):
+    gone = tmp_path / "gone"
+    gone.mkdir()
+    watched_server.watch({'path': str(gone)})
+    watched_server.watchers.insert(0, watched_server.watchers.pop())
+    gone.rmdir()
+    watched_server.service_actions()
+    out = capsys.readouterr().out
+    assert f"cannot watch {gone}" in out and out.count("compiling") == 2
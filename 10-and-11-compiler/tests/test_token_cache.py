@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from jack_compiler.jack_tokenizer import tokenize
+from jack_compiler.token_cache import TokenCache
+
+SOURCE = 'class Main {\n  function void main() {\n    do Output.printString("hi");\n    return;\n  }\n}\n'
+
+
+def as_rows(table):
+    return [(t.token_type, t.value, t.line, t.column) for t in table]
+
+
+def test_warm_run_hits_the_cache(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text(SOURCE)
+    cold = TokenCache(str(tmp_path / "cache"))
+    first = cold.tokenize_file(str(source))
+    warm = TokenCache(str(tmp_path / "cache"))
+    second = warm.tokenize_file(str(source))
+    assert (cold.misses, warm.hits, warm.misses) == (1, 1, 0)
+    assert as_rows(first) == as_rows(second)
+
+
+def test_corrupt_entries_are_misses(tmp_path):
+    source = tmp_path / "Main.jack"
+    source.write_text(SOURCE)
+    cache = TokenCache(str(tmp_path / "cache"))
+    cache.tokenize_file(str(source))
+    for entry in os.scandir(cache.cache_dir):
+        with open(entry.path, 'wb') as f:
+            f.write(b"JTOK garbage")
+    cache.tokenize_file(str(source))
+    assert cache.misses == 2
+
+
+def test_lru_eviction(tmp_path):
+    cache = TokenCache(str(tmp_path / "cache"))
+    sources = []
+    for i in range(3):
+        source = tmp_path / f"Class{i}.jack"
+        source.write_text(SOURCE.replace("Main", f"Class{i}"))
+        sources.append(source.read_bytes())
+        cache.tokenize_file(str(source))
+    entries = sorted(os.scandir(cache.cache_dir), key=lambda e: e.name)
+    for age, entry in enumerate(entries):
+        os.utime(entry.path, (age, age))
+    # using an entry makes it the most recently used one
+    oldest = min(sources, key=lambda s: os.path.getmtime(cache._entry_path(s)))
+    assert cache.get(oldest) is not None
+    cache.max_bytes = sum(e.stat().st_size for e in entries) - 1
+    cache.evict()
+    assert len(os.listdir(cache.cache_dir)) == 2
+    assert cache.get(oldest) is not None
+
+
+def test_entries_evicted_while_read_are_still_hits(tmp_path, monkeypatch):
+    source = tmp_path / "Main.jack"
+    source.write_text(SOURCE)
+    cache = TokenCache(str(tmp_path / "cache"))
+    cache.tokenize_file(str(source))
+
+    def evicted(path, *args):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    table = cache.tokenize_file(str(source))
+    assert cache.hits == 1
+    assert as_rows(table) == as_rows(tokenize(SOURCE))
+
+
+def test_failed_writes_leave_no_temporary_files(tmp_path):
+    cache = TokenCache(str(tmp_path / "cache"))
+
+    class Unwritable:
+        def to_bytes(self):
+            raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        cache.put(SOURCE.encode(), Unwritable())
+    assert os.listdir(cache.cache_dir) == []